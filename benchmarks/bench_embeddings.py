@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import torch
+from transformers import AutoConfig
+
+from protencode.embeddings_generation.cpu_engine import CPUEngine
+from protencode.embeddings_generation.generate_ESM2embeddings import generateESM2, lengthBatches
+from protencode.embeddings_generation.process_embeddings import processESM2Embeddings
+from protencode.embeddings_generation.esm2_attentionweighter import ESM2Attention, topAttentionPositions
+from benchmarks.common import Benchmark, BENCH_SCALES, BATCH_SIZES, MAX_LENGTHS, THREADS, esm_model, protein_sequences
+
+TOP_N = 10
+# Full attention inputs larger than this are skipped (they are (layers x sequences x heads x L x L) floats)
+FULL_ATTENTION_BYTES = 1024 ** 3
+
+class GenerateESM2(Benchmark):
+    """
+    `generateESM2` on CPU with the pipeline's attention reduction, across batch sizes, max lengths,
+    padding strategies ('longest' also buckets by length, as `--dynamic-padding` does) and threads.
+    """
+    params = [BENCH_SCALES, BATCH_SIZES, MAX_LENGTHS, ["max_length", "longest"], THREADS]
+    param_names = ["scale", "batch_size", "max_length", "padding", "threads"]
+
+    def setup(self, scale, batch_size, max_length, padding, threads):
+        super().setup(scale)
+        self.engine = CPUEngine(esm_model(), num_threads=threads)
+        self.sequences = pd.DataFrame({"sequence": protein_sequences(scale)})
+        tokens = np.minimum(self.sequences["sequence"].str.len().to_numpy() + 2, max_length)
+        lengths = tokens if padding == "longest" else np.full(len(tokens), max_length)
+        batches = lengthBatches(lengths, batch_size, sort_by_length=padding == "longest")
+        # Reported by the runner as sequences/s, tokens/s (real tokens) and seconds per batch
+        self.work = {"sequences": len(tokens), "tokens": int(tokens.sum()), "batches": len(batches)}
+        # Warm-up, so one-off allocation and kernel selection are not timed
+        self._run(scale, batch_size, max_length, padding, threads)
+
+    def _run(self, scale, batch_size, max_length, padding, threads):
+        generateESM2(
+            self.engine.model_name, self.sequences, batch_size, max_length, padding=padding,
+            sort_by_length=padding == "longest", attention="weights", engine=self.engine,
+        )
+
+    def time_generateESM2(self, *params):
+        self._run(*params)
+
+    def peakmem_generateESM2(self, *params):
+        self._run(*params)
+
+def _modelOutputs(scale, max_length, attention):
+    # Random tensors with the shapes generateESM2 returns for the benchmark model
+    config = AutoConfig.from_pretrained(esm_model())
+    n_sequences = len(protein_sequences(scale))
+    if attention == "full":
+        shape = (n_sequences, config.num_attention_heads, max_length, max_length)
+        if np.prod(shape) * 4 * config.num_hidden_layers > FULL_ATTENTION_BYTES:
+            raise NotImplementedError("full attention tensor too large")
+    generator = torch.Generator().manual_seed(0)
+    embds = [torch.randn((max_length, config.hidden_size), generator=generator) for _ in range(n_sequences)]
+    if attention == "full":
+        attentions = [torch.rand(shape, generator=generator) for _ in range(config.num_hidden_layers)]
+    else:
+        attentions = torch.softmax(torch.randn((n_sequences, max_length), generator=generator), dim=-1)
+        if attention == "topn":
+            attentions = topAttentionPositions(attentions, TOP_N)
+    return embds, attentions
+
+class ProcessESM2Embeddings(Benchmark):
+    """
+    Stacking (into the memory-mapped output) and mean pooling of the embeddings, with full or reduced attention.
+    """
+    params = [BENCH_SCALES, MAX_LENGTHS, ["full", "weights"]]
+    param_names = ["scale", "max_length", "attention"]
+
+    def setup(self, scale, max_length, attention):
+        super().setup(scale)
+        self.embds, self.attentions = _modelOutputs(scale, max_length, attention)
+
+    def time_processESM2Embeddings(self, *params):
+        processESM2Embeddings(self.embds, self.attentions, self.output_dir)
+
+    def peakmem_processESM2Embeddings(self, *params):
+        processESM2Embeddings(self.embds, self.attentions, self.output_dir)
+
+class ESM2AttentionPooling(Benchmark):
+    """
+    `ESM2Attention` weighted pooling from full attention, residue weights or top-N positions.
+    """
+    params = [BENCH_SCALES, MAX_LENGTHS, ["full", "weights", "topn"]]
+    param_names = ["scale", "max_length", "attention"]
+
+    def setup(self, scale, max_length, attention):
+        super().setup(scale)
+        embds, attentions = _modelOutputs(scale, max_length, attention)
+        self.stacked, self.attentions, _ = processESM2Embeddings(embds, attentions, self.output_dir, save_setting=False)
+
+    def time_ESM2Attention(self, *params):
+        ESM2Attention(self.attentions, self.stacked, self.output_dir, save_setting=False)
+
+    def peakmem_ESM2Attention(self, *params):
+        ESM2Attention(self.attentions, self.stacked, self.output_dir, save_setting=False)
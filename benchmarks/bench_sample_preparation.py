@@ -0,0 +1,36 @@
+import numpy as np
+
+from protencode.sample_preparation import binary_encoding, multimut_encoding, esmattention_encoding
+from protencode.sample_preparation.sample_mapping import loadSampleMapping
+from protencode.sample_preparation.sample_index import buildSampleIndex
+from benchmarks.common import Benchmark, stage_outputs, prepared_dir
+
+TOP_N = 10
+
+class Encoders(Benchmark):
+    def setup(self, scale):
+        super().setup(scale)
+        # The mappings stage writes the sequence and sample tables into the prepared run directory
+        stage_outputs(scale, "mappings")
+        self.index = buildSampleIndex(loadSampleMapping(prepared_dir(scale)))
+        n_sequences = len(self.index.sequence_genes)
+        # Stand-in for the optimiser-selected embedding dimensions of every sequence
+        self.top_embeddings = np.random.default_rng(0).random((n_sequences, TOP_N), dtype=np.float32)
+
+    def time_createBinaryMatrix(self, scale):
+        binary_encoding.createBinaryMatrix(self.index, self.output_dir)
+
+    def peakmem_createBinaryMatrix(self, scale):
+        binary_encoding.createBinaryMatrix(self.index, self.output_dir)
+
+    def time_createMultiMutationMatrix(self, scale):
+        multimut_encoding.createMultiMutationMatrix(self.index, self.output_dir)
+
+    def peakmem_createMultiMutationMatrix(self, scale):
+        multimut_encoding.createMultiMutationMatrix(self.index, self.output_dir)
+
+    def time_create_top_matrix(self, scale):
+        esmattention_encoding.create_top_matrix(self.index, self.top_embeddings, self.output_dir, top_n=TOP_N)
+
+    def peakmem_create_top_matrix(self, scale):
+        esmattention_encoding.create_top_matrix(self.index, self.top_embeddings, self.output_dir, top_n=TOP_N)
@@ -0,0 +1,112 @@
+import os
+
+from protencode.sequence_preparation import (
+    variantProcessor,
+    fastaProcessor,
+    fastaIndex,
+    mutationSequenceMerge,
+    extractVarationInfo,
+    mutationGenerator,
+    finalise_sequences,
+)
+from benchmarks.common import Benchmark, BENCH_SCALES, dataset, stage_outputs
+
+class ProcessVariantFile(Benchmark):
+    """
+    Reading DepMap/CCLE CSV and MAF mutation files with their columns (see `variantFileLayout`).
+    """
+    params = [BENCH_SCALES, ["csv", "maf"]]
+    param_names = ["scale", "input_format"]
+
+    def setup(self, scale, input_format):
+        super().setup(scale)
+        data_dir, _ = dataset(scale, input_format)
+        self.file = os.path.join(data_dir, sorted(os.listdir(data_dir))[0])
+
+    def _run(self):
+        variantProcessor.processVariantFile(self.file, **variantProcessor.variantFileLayout(self.file))
+
+    def time_processVariantFile(self, scale, input_format):
+        self._run()
+
+    def peakmem_processVariantFile(self, scale, input_format):
+        self._run()
+
+class UniprotFastaSwissProtProcessor(Benchmark):
+    def setup(self, scale):
+        super().setup(scale)
+        _, uniprot_cache = dataset(scale)
+        self.fasta_file = os.path.join(uniprot_cache, "9606", "synthetic", "9606.fasta")
+        (all_mutations,) = stage_outputs(scale, "mutations")
+        self.genes = all_mutations["geneName"].unique()
+        # The persistent index is built once; `time_buildFastaIndex` covers building it
+        fastaIndex.loadFastaIndex(self.fasta_file, show_progress=False)
+
+    def _run(self):
+        fastaProcessor.uniprotFastaSwissProtProcessor(self.fasta_file, self.output_dir, show_progress=False, genes=self.genes)
+
+    def time_uniprotFastaSwissProtProcessor(self, scale):
+        self._run()
+
+    def peakmem_uniprotFastaSwissProtProcessor(self, scale):
+        self._run()
+
+    def time_buildFastaIndex(self, scale):
+        fastaIndex.buildFastaIndex(self.fasta_file, index_file=os.path.join(self.output_dir, "index.pidx"), show_progress=False)
+
+class MergeReport(Benchmark):
+    def setup(self, scale):
+        super().setup(scale)
+        self.all_mutations, self.uniprot_data = stage_outputs(scale, "mutations", "fasta")
+
+    def time_mergeReport(self, scale):
+        mutationSequenceMerge.mergeReport(self.all_mutations, self.uniprot_data)
+
+    def peakmem_mergeReport(self, scale):
+        mutationSequenceMerge.mergeReport(self.all_mutations, self.uniprot_data)
+
+class ProcessVariantParts(Benchmark):
+    def setup(self, scale):
+        super().setup(scale)
+        (self.merged,) = stage_outputs(scale, "merge")
+
+    def time_processVariantParts(self, scale):
+        extractVarationInfo.processVariantParts(self.merged, variant_column="variant")
+
+    def peakmem_processVariantParts(self, scale):
+        extractVarationInfo.processVariantParts(self.merged, variant_column="variant")
+
+class ProcessMutations(Benchmark):
+    def setup(self, scale):
+        super().setup(scale)
+        (self.mutations,) = stage_outputs(scale, "dedupe")
+        self.log_file = os.path.join(self.output_dir, "logs", "mutation_generator.log")
+
+    def time_processMutationsProgress(self, scale):
+        mutationGenerator.processMutationsProgress(self.mutations, self.log_file, self.output_dir)
+
+    def peakmem_processMutationsProgress(self, scale):
+        mutationGenerator.processMutationsProgress(self.mutations, self.log_file, self.output_dir)
+
+    def time_processMutationsDelta(self, scale):
+        mutationGenerator.processMutationsDelta(self.mutations, self.log_file, self.output_dir)
+
+    def peakmem_processMutationsDelta(self, scale):
+        mutationGenerator.processMutationsDelta(self.mutations, self.log_file, self.output_dir)
+
+class GenerateSequenceMappings(Benchmark):
+    def setup(self, scale):
+        super().setup(scale)
+        self.lengene_mutseq, (_, self.wildtypes) = stage_outputs(scale, "downstream", "mutants")
+        self.samples = self.lengene_mutseq["sample_id"].unique()
+
+    def _run(self):
+        finalise_sequences.generate_sequence_mappings(
+            self.output_dir, self.lengene_mutseq, self.samples, wildtypes=self.wildtypes, sample2sequence_format="long",
+        )
+
+    def time_generate_sequence_mappings(self, scale):
+        self._run()
+
+    def peakmem_generate_sequence_mappings(self, scale):
+        self._run()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+
+from protencode.utils.synthetic_data import generate_synthetic_dataset, random_proteins
+from protencode.utils.stage_cache import run_stages
+from protencode.sequence_preparation.pipeline import sequenceStages, SEQUENCE_STAGES
+
+# Dataset scales: mutation rows, samples and genes
+SCALES = {
+    "small": dict(n_mutations=10_000, n_samples=100, n_genes=1_000),
+    "medium": dict(n_mutations=1_000_000, n_samples=1_000, n_genes=10_000),
+    "large": dict(n_mutations=10_000_000, n_samples=10_000, n_genes=20_000),
+}
+# Benchmarked scales (comma-separated), e.g. PROTENCODE_BENCH_SCALES=small,medium
+BENCH_SCALES = [scale for scale in os.environ.get("PROTENCODE_BENCH_SCALES", "small").split(",") if scale]
+# Generated datasets and stage outputs are kept here between runs
+DATA_DIR = os.environ.get("PROTENCODE_BENCH_DATA", os.path.join(os.path.expanduser("~"), ".cache", "protencode", "benchmarks"))
+
+def _env_ints(name, default):
+    return [int(value) for value in os.environ.get(name, default).split(",") if value]
+
+# Embedding benchmarks: sequences per scale, and the grid of batch sizes, max lengths and threads
+EMBEDDING_SEQUENCES = {"small": 8, "medium": 64, "large": 512}
+BATCH_SIZES = _env_ints("PROTENCODE_BENCH_BATCH_SIZES", "2,8")
+MAX_LENGTHS = _env_ints("PROTENCODE_BENCH_MAX_LENGTHS", "128,256")
+THREADS = _env_ints("PROTENCODE_BENCH_THREADS", "") or sorted({1, os.cpu_count() or 1})
+
+def dataset(scale, input_format="csv"):
+    """
+    The synthetic dataset of `scale` (with CSV or MAF mutation files), generated on first use.
+    """
+    output_dir = os.path.join(DATA_DIR, scale if input_format == "csv" else f"{scale}_{input_format}")
+    marker = os.path.join(output_dir, "COMPLETE")
+    if not os.path.exists(marker):
+        shutil.rmtree(output_dir, ignore_errors=True)
+        generate_synthetic_dataset(output_dir, input_format=input_format, **SCALES[scale])
+        open(marker, "w").close()
+    return (
+        os.path.join(output_dir, "data"),
+        os.path.join(output_dir, "uniprot_cache"),
+    )
+
+def stage_outputs(scale, *names):
+    """
+    Outputs of sequence preparation stages on the dataset of `scale` (see `SEQUENCE_STAGES`),
+    computed once and then read from the stage cache. The run directory is `prepared_dir(scale)`.
+    """
+    data_dir, uniprot_cache = dataset(scale)
+    run_dir = prepared_dir(scale)
+    last = max(SEQUENCE_STAGES.index(name) for name in names)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        values = run_stages(
+            sequenceStages(data_dir, run_dir, uniprot_cache=uniprot_cache),
+            os.path.join(DATA_DIR, scale, "stage_cache"), until_stage=SEQUENCE_STAGES[last], load=names,
+        )
+    return [values[name] for name in names]
+
+def esm_model():
+    """
+    Local randomly initialised ESM-2 with the layer shapes of esm2_t12_35M, saved on first use.
+    """
+    from protencode.embeddings_generation.random_model import save_random_esm2
+    model_dir = os.path.join(DATA_DIR, "esm2_t12_35M_random")
+    marker = os.path.join(model_dir, "COMPLETE")
+    if not os.path.exists(marker):
+        shutil.rmtree(model_dir, ignore_errors=True)
+        save_random_esm2(model_dir)
+        open(marker, "w").close()
+    return model_dir
+
+def protein_sequences(scale):
+    """
+    Random protein sequences with realistic lengths for the embedding benchmarks of `scale`.
+    """
+    return random_proteins(EMBEDDING_SEQUENCES[scale])
+
+def prepared_dir(scale):
+    run_dir = os.path.join(DATA_DIR, scale, "prepared")
+    os.makedirs(os.path.join(run_dir, "logs"), exist_ok=True)
+    return run_dir
+
+class Benchmark:
+    """
+    Base class: the dataset scale as first parameter, and a scratch output directory per run.
+    """
+    params = BENCH_SCALES
+    param_names = ["scale"]
+    timeout = 3600
+
+    def setup(self, scale, *params):
+        self.output_dir = tempfile.mkdtemp(prefix="protencode-bench-")
+        os.makedirs(os.path.join(self.output_dir, "logs"), exist_ok=True)
+
+    def teardown(self, scale, *params):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
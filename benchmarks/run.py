@@ -0,0 +1,231 @@
+"""
+Run the benchmark suite and store or compare its results.
+
+The benchmarks follow asv conventions (classes with `setup`/`teardown`, `params`, and `time_*`
+and `peakmem_*` methods), so `asv run` works too; this runner needs no extra dependencies.
+Every benchmark runs in a fresh process: `time_*` methods are repeated and report the median and
+minimum wall time and the CPU time; `peakmem_*` methods report the process's peak RSS and how
+far the call raised it above the RSS after `setup`. Benchmarks that set a `work` dict in `setup`
+(e.g. {"sequences": ..., "tokens": ..., "batches": ...}) also get the throughput per second and the
+time per batch. As in asv, `params` given as a list of lists are combined as their product.
+
+    python -m benchmarks.run --label baseline
+    PROTENCODE_BENCH_SCALES=small,medium python -m benchmarks.run -b Merge --label after
+    python -m benchmarks.run --compare benchmarks/results/baseline.json benchmarks/results/after.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import inspect
+import platform
+import argparse
+import importlib
+import itertools
+import resource
+import subprocess
+import traceback
+import multiprocessing as mp
+from contextlib import redirect_stdout, redirect_stderr
+
+BENCHMARK_MODULES = (
+    "benchmarks.bench_sequence_preparation", "benchmarks.bench_sample_preparation", "benchmarks.bench_embeddings",
+)
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def discover(pattern=None):
+    """
+    (module, class, method, parameters) of every benchmark whose name ("Class.method[parameters]")
+    matches `pattern`.
+    """
+    found = []
+    for module_name in BENCHMARK_MODULES:
+        module = importlib.import_module(module_name)
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module_name:
+                continue
+            for method in sorted(name for name in dir(cls) if name.startswith(("time_", "peakmem_"))):
+                for params in _combinations(getattr(cls, "params", None)):
+                    job = (module_name, class_name, method, params)
+                    if not pattern or re.search(pattern, _name(job)):
+                        found.append(job)
+    return found
+
+def _name(job):
+    _, class_name, method, params = job
+    return f"{class_name}.{method}" + (f"[{', '.join(map(str, params))}]" if params else "")
+
+def _combinations(params):
+    if not params:
+        return [()]
+    if isinstance(params[0], (list, tuple)):
+        return list(itertools.product(*params))
+    return [(param,) for param in params]
+
+def _peak_rss():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _measure(module_name, class_name, method, args, repeat):
+    from protencode.utils.profiling import Profiler, current_rss
+    benchmark = getattr(importlib.import_module(module_name), class_name)()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        try:
+            benchmark.setup(*args)
+        except NotImplementedError:
+            return {"skipped": True}
+        try:
+            run = getattr(benchmark, method)
+            if method.startswith("peakmem_"):
+                before, peak_before = current_rss(), _peak_rss()
+                profiler = Profiler("benchmark", interval=0.01).start()
+                with profiler.stage(method) as record:
+                    run(*args)
+                profiler.stop()
+                peak_after = _peak_rss()
+                during = max(record.peak_rss_bytes, peak_after if peak_after > peak_before else 0)
+                return {"kind": "peakmem", "peak_rss_bytes": peak_after, "added_rss_bytes": max(during - before, 0)}
+            walls, cpus = [], []
+            for _ in range(repeat):
+                wall, cpu = time.perf_counter(), time.process_time()
+                run(*args)
+                walls.append(time.perf_counter() - wall)
+                cpus.append(time.process_time() - cpu)
+            walls.sort()
+            median = walls[len(walls) // 2]
+            result = {
+                "kind": "time", "median_seconds": median, "min_seconds": walls[0],
+                "cpu_seconds": sorted(cpus)[len(cpus) // 2], "repeat": repeat,
+            }
+            work = getattr(benchmark, "work", {})
+            result.update({f"{key}_per_second": value / median for key, value in work.items() if key != "batches"})
+            if work.get("batches"):
+                result["seconds_per_batch"] = median / work["batches"]
+            return result
+        finally:
+            if hasattr(benchmark, "teardown"):
+                benchmark.teardown(*args)
+
+def _child(sender, job, repeat):
+    try:
+        result = _measure(*job, repeat)
+    except Exception:
+        result = {"error": traceback.format_exc(limit=3)}
+    sender.send(result)
+    sender.close()
+
+def _run_isolated(job, repeat):
+    # A fresh process per benchmark, so peak memory and caches do not carry over
+    module_name, class_name = job[:2]
+    timeout = getattr(getattr(importlib.import_module(module_name), class_name), "timeout", None)
+    context = mp.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(sender, job, repeat))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            process.kill()
+            return {"error": f"timed out after {timeout} s"}
+        return receiver.recv()
+    except EOFError:
+        return {"error": f"benchmark process exited with code {process.exitcode}"}
+    finally:
+        process.join()
+
+def _machine():
+    import numpy as np
+    import pandas as pd
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+def run(pattern=None, repeat=3, label=None, output=None):
+    """
+    Run the matching benchmarks and write the results to `output`
+    (default: `benchmarks/results/<label>.json`).
+    """
+    label = label or time.strftime("%Y%m%d-%H%M%S")
+    output = output or os.path.join(RESULTS_DIR, f"{label}.json")
+    results = {}
+    for job in discover(pattern):
+        name = _name(job)
+        result = _run_isolated(job, repeat)
+        results[name] = result
+        throughput = ", ".join(f"{value:.1f} {key[:-len('_per_second')]}/s" for key, value in result.items() if key.endswith("_per_second"))
+        print(f"{name:<70} {_format(result)}" + (f"  ({throughput})" if throughput else ""), flush=True)
+    report = {"label": label, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "machine": _machine(), "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Results written to {output}")
+    return report
+
+def _value(result):
+    if result.get("kind") == "time":
+        return result["median_seconds"]
+    if result.get("kind") == "peakmem":
+        return result["added_rss_bytes"]
+    return None
+
+def _format(result, value=None):
+    value = _value(result) if value is None else value
+    if "error" in result:
+        return "failed"
+    if result.get("skipped"):
+        return "skipped"
+    if result["kind"] == "time":
+        return f"{value:.4f} s"
+    return f"{value / 1024 ** 2:.1f} MiB"
+
+def compare(baseline_path, current_path, threshold=1.1):
+    """
+    Print the benchmarks of both result files side by side; those slower or using more memory by
+    more than `threshold` (ratio) are flagged. Returns the number of regressions.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    with open(current_path) as f:
+        current = json.load(f)["results"]
+    regressions = 0
+    for name in sorted(set(baseline) & set(current)):
+        before, after = _value(baseline[name]), _value(current[name])
+        if before is None or after is None:
+            continue
+        ratio = after / before if before > 0 else float("inf") if after > 0 else 1.0
+        flag = ""
+        if ratio > threshold:
+            flag, regressions = "  REGRESSION", regressions + 1
+        elif ratio < 1 / threshold:
+            flag = "  improved"
+        print(f"{name:<70} {_format(baseline[name]):>12} -> {_format(current[name]):>12}  x{ratio:.2f}{flag}")
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f"{name:<70} only in {'baseline' if name in baseline else 'current'}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ProtEncode benchmark suite (scales via PROTENCODE_BENCH_SCALES).")
+    parser.add_argument("-b", "--bench", default=None, help="Only run benchmarks whose Class.method[parameters] matches this regex.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per time benchmark (default: 3).")
+    parser.add_argument("--label", default=None, help="Name of the results file (default: a timestamp).")
+    parser.add_argument("--output", default=None, help="Results file (default: benchmarks/results/<label>.json).")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two results files instead of running.")
+    parser.add_argument("--threshold", type=float, default=1.1, help="Ratio flagged as a regression by --compare (default: 1.1).")
+    args = parser.parse_args()
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, threshold=args.threshold) else 0)
+    run(args.bench, args.repeat, args.label, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,54 @@
+import os
 import argparse
-from protencode.sequence_preparation.pipeline import run_sequence_preparation
+from protencode.sequence_preparation.pipeline import run_sequence_preparation, SEQUENCE_STAGES
 from protencode.sample_preparation.pipeline import run_sample_preparation
 from protencode.utils.download_test_data import download_ccle_mutations
-# later: from protencode.embeddings_generation.pipeline import run_embeddings_generation
+from protencode.utils.synthetic_data import generate_synthetic_dataset
+from protencode.utils.profiling import profiling
+from protencode.embeddings_generation.pipeline import run_embeddings_generation, DEFAULT_MODEL
+
+def _add_profile_arguments(parser):
+    parser.add_argument("--profile", action="store_true", help="Record per-stage time, CPU, peak memory and throughput in <output>/logs/profile_<pipeline>.json.")
+    parser.add_argument("--profile-prometheus", default=None, help="With --profile, also write the report as a Prometheus textfile to this path.")
+    parser.add_argument("--profile-cprofile", action="store_true", help="With --profile, also write per-stage cProfile statistics to <output>/logs/cprofile/.")
 
 def testdata_main(args):
     download_ccle_mutations(outdir=args.output, nrows=args.nrows)
 
+def synthetic_main(args):
+    dataset = generate_synthetic_dataset(
+        args.output, n_mutations=args.mutations, n_samples=args.samples, n_genes=args.genes,
+        n_files=args.files, input_format=args.format, seed=args.seed,
+    )
+    print(f"[INFO] Synthetic mutations in {dataset.data_dir}; UniProt cache: {dataset.uniprot_cache}")
+    if args.esm_model:
+        from protencode.embeddings_generation.random_model import save_random_esm2
+        model_dir = save_random_esm2(os.path.join(args.output, "esm2_random"), seed=args.seed)
+        print(f"[INFO] Randomly initialised ESM-2 (esm2_t12_35M shapes) in {model_dir}")
+
 def embeddings_main(args):
-    print("Embeddings pipeline not wired yet")
+    run_embeddings_generation(
+        output_dir=args.output,
+        model_name=args.model,
+        max_length=args.max_length,
+        batch_size=args.batch_size,
+        shard_size=args.shard_size,
+        top_n=args.top_n,
+        dynamic_padding=args.dynamic_padding,
+        max_tokens=args.max_tokens,
+        n_workers=args.workers,
+        threads=args.threads,
+        precision=args.precision,
+        cache_dir=args.embedding_cache,
+        cache_size=args.embedding_cache_size,
+        resume=not args.no_resume,
+        token_dtype=args.token_dtype,
+        pooling=args.pooling,
+        pooling_top_k=args.pooling_top_k,
+        pooled_dtype=args.pooled_dtype,
+        memory_limit=args.memory_limit,
+        gpus=args.gpus,
+    )
 
 def sample_main(args):
     run_sample_preparation(
@@ -17,6 +57,9 @@ def sample_main(args):
         do_binary=args.binary,
         do_multi=args.multi,
         do_esm=args.esm,
+        export_csv=args.export_csv,
+        n_workers=args.workers,
+        esm_memmap=args.esm_memmap,
     )
 
 def sequence_main(args):
@@ -26,7 +69,20 @@ def sequence_main(args):
         organism_id=args.organism,
         contact_email=args.email,
         update=args.update,
+        uniprot_cache=args.uniprot_cache,
         min_length=args.min_length,
+        n_workers=args.workers,
+        chunksize=args.chunksize,
+        intermediate_format=args.format,
+        export_csv=args.export_csv,
+        sample2sequences_tsv=args.sample2sequences_tsv,
+        top_genes=args.top_genes,
+        from_stage=args.from_stage,
+        until_stage=args.until_stage,
+        dry_run=args.dry_run,
+        stage_cache=args.stage_cache,
+        use_stage_cache=not args.no_stage_cache,
+        incremental=args.incremental,
     )
 
 
@@ -38,8 +94,9 @@ def main():
             "Available pipelines:\n"
             "  • sequence   Prepare sequences from mutation files and UniProt\n"
             "  • sample     Generate sample-level encoding matrices (binary, multi, ESM)\n"
-            "  • embeddings (coming soon)\n"
-            "  • testdata   Download and prepare CCLE test dataset\n\n"
+            "  • embeddings Generate ESM-2 embeddings for prepared sequences\n"
+            "  • testdata   Download and prepare CCLE test dataset\n"
+            "  • synthetic  Generate an offline synthetic dataset at any scale\n\n"
             "👉 For more details on a specific pipeline, run:\n"
             "   protencode <pipeline> --help\n"
         ),
@@ -74,6 +131,29 @@ def main():
     )
     parser_testdata.set_defaults(func=testdata_main)
 
+    # --- synthetic data
+    parser_synthetic = subparsers.add_parser(
+        "synthetic",
+        help="Generate an offline synthetic dataset at any scale",
+        description=(
+            "Generate synthetic mutation files and a matching UniProt-style FASTA without network access.\n\n"
+            "Writes:\n"
+            "  • <output>/data/synthetic_mutations_*.csv (or .maf)\n"
+            "  • <output>/uniprot_cache/, for: protencode sequence --data <output>/data --uniprot-cache <output>/uniprot_cache\n"
+            "  • <output>/esm2_random/ (with --esm-model), for: protencode embeddings --model <output>/esm2_random"
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser_synthetic.add_argument("--output", required=True, help="Directory to write the dataset to.")
+    parser_synthetic.add_argument("--mutations", type=int, default=10_000, help="Number of mutation rows (default: 10000).")
+    parser_synthetic.add_argument("--samples", type=int, default=100, help="Number of samples (default: 100).")
+    parser_synthetic.add_argument("--genes", type=int, default=1_000, help="Number of genes in the FASTA (default: 1000).")
+    parser_synthetic.add_argument("--files", type=int, default=1, help="Number of mutation files to split the rows over (default: 1).")
+    parser_synthetic.add_argument("--format", choices=["csv", "maf"], default="csv", help="CCLE-style CSV or tab-separated MAF (default: csv).")
+    parser_synthetic.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+    parser_synthetic.add_argument("--esm-model", action="store_true", help="Also save a randomly initialised ESM-2 with the layer shapes of esm2_t12_35M.")
+    parser_synthetic.set_defaults(func=synthetic_main)
+
     # --- sample preparation
     parser_sample = subparsers.add_parser(
         "sample",
@@ -88,13 +168,11 @@ def main():
     parser_sample.add_argument("--binary", action="store_true", help="Generate binary matrix only.")
     parser_sample.add_argument("--multi", action="store_true", help="Generate multi-mutation matrix only.")
     parser_sample.add_argument("--esm", action="store_true", help="Generate ESM top-N matrix only.")
-    parser_sample.set_defaults(func=lambda args: run_sample_preparation(
-        output_dir=args.output,
-        top_n=args.top_n,
-        do_binary=args.binary,
-        do_multi=args.multi,
-        do_esm=args.esm,
-    ))
+    parser_sample.add_argument("--export-csv", action="store_true", help="Also export the encoding matrices as dense CSV.")
+    parser_sample.add_argument("--esm-memmap", action="store_true", help="Build the ESM matrix in a memory-mapped .npy instead of in RAM.")
+    parser_sample.add_argument("--workers", type=int, default=None, help="Number of encodings run at once (default: all selected).")
+    _add_profile_arguments(parser_sample)
+    parser_sample.set_defaults(func=sample_main)
 
     # --- sequence preparation
     parser_sequence = subparsers.add_parser(
@@ -116,27 +194,71 @@ def main():
     parser_sequence.add_argument("--output", required=True, help="Directory to write processed outputs.")
     parser_sequence.add_argument("--organism", default="9606", help="NCBI taxonomy ID (default: 9606 = human).")
     parser_sequence.add_argument("--email", default="", help="Contact email required for UniProt downloads.")
-    parser_sequence.add_argument("--update", action="store_true", help="Force UniProt FASTA re-download.")
+    parser_sequence.add_argument("--update", action="store_true", help="Check UniProt for a newer release and download it if not cached.")
+    parser_sequence.add_argument("--uniprot-cache", default=None, help="Shared UniProt download cache directory (default: <output>/uniprot_cache).")
     parser_sequence.add_argument("--min-length", type=int, default=200, help="Minimum gene length filter (default: 200).")
-    parser_sequence.set_defaults(func=lambda args: run_sequence_preparation(
-        data_dir=args.data,
-        output_dir=args.output,
-        organism_id=args.organism,
-        contact_email=args.email,
-        update=args.update,
-        min_length=args.min_length,
-    ))
+    parser_sequence.add_argument("--workers", type=int, default=1, help="Number of processes for parsing mutation files (default: 1).")
+    parser_sequence.add_argument("--chunksize", type=int, default=None, help="Stream mutation files in chunks of this many rows (default: read whole files).")
+    parser_sequence.add_argument("--format", choices=["parquet", "arrow", "csv"], default="parquet", help="Storage format for intermediate tables (default: parquet).")
+    parser_sequence.add_argument("--export-csv", action="store_true", help="Also export every intermediate table as CSV.")
+    parser_sequence.add_argument("--sample2sequences-tsv", action="store_true", help="Also write the ';'-joined sample2sequences table and TSV.")
+    parser_sequence.add_argument("--top-genes", type=int, default=None, help="Keep only the most frequently mutated genes (default: all).")
+    parser_sequence.add_argument("--from-stage", choices=SEQUENCE_STAGES, default=None, help="Recompute this stage and all later ones even if cached.")
+    parser_sequence.add_argument("--until-stage", choices=SEQUENCE_STAGES, default=None, help="Stop after this stage.")
+    parser_sequence.add_argument("--dry-run", action="store_true", help="Only print which stages would be recomputed.")
+    parser_sequence.add_argument("--stage-cache", default=None, help="Stage cache directory (default: <output>/stage_cache).")
+    parser_sequence.add_argument("--no-stage-cache", action="store_true", help="Run every stage without reading or writing the stage cache.")
+    parser_sequence.add_argument("--incremental", action="store_true", help="Merge only new mutation files into an existing output, keeping sequence IDs.")
+    _add_profile_arguments(parser_sequence)
+    parser_sequence.set_defaults(func=sequence_main)
 
-    # --- embeddings placeholder
+    # --- embeddings generation
     parser_embeddings = subparsers.add_parser(
         "embeddings",
-        help="Run embeddings generation (coming soon)",
-        description="Generate embeddings for protein sequences (not yet implemented).",
+        help="Run embeddings generation",
+        description=(
+            "Generate ESM-2 embeddings for <output>/sequences.txt.\n\n"
+            "Sequences are embedded in checkpointed shards recorded in manifest.json; rerunning\n"
+            "the command resumes after the last completed shard."
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
     )
-    parser_embeddings.set_defaults(func=lambda args: print("Embeddings pipeline not wired yet."))
+    parser_embeddings.add_argument("--output", required=True, help="Output directory (from sequence preparation).")
+    parser_embeddings.add_argument("--model", default=DEFAULT_MODEL, help=f"Hugging Face model name or local path (default: {DEFAULT_MODEL}).")
+    parser_embeddings.add_argument("--max-length", type=int, default=800, help="Tokenised length sequences are truncated to (default: 800).")
+    parser_embeddings.add_argument("--batch-size", type=int, default=None, help="Maximum number of sequences per batch (default: planned from free memory).")
+    parser_embeddings.add_argument("--shard-size", type=int, default=1000, help="Number of sequences per checkpointed shard (default: 1000).")
+    parser_embeddings.add_argument("--top-n", type=int, default=10, help="Number of embedding dimensions selected per gene (default: 10).")
+    parser_embeddings.add_argument("--dynamic-padding", action="store_true", help="Pad batches only to their longest member, bucketing sequences by length.")
+    parser_embeddings.add_argument("--max-tokens", type=int, default=None, help="Cap on the padded tokens per batch (default with --dynamic-padding: planned).")
+    parser_embeddings.add_argument("--workers", type=int, default=None, help="Number of CPU worker processes (default: planned from cores and memory).")
+    parser_embeddings.add_argument("--threads", type=int, default=None, help="Intra-op threads per CPU process.")
+    parser_embeddings.add_argument("--memory-limit", default=None, help="Memory to plan batches for, e.g. 16G (default: detected free memory).")
+    parser_embeddings.add_argument("--gpus", default=None, help="GPU indices to use, e.g. 0,1, or 'none' for the CPU (default: GPUs with room for the model).")
+    parser_embeddings.add_argument("--precision", choices=["float32", "bfloat16", "int8"], default="float32", help="CPU inference precision (default: float32).")
+    parser_embeddings.add_argument("--embedding-cache", default=None, help="Persistent embedding cache directory shared between runs.")
+    parser_embeddings.add_argument("--embedding-cache-size", default=None, help="Disk budget of the embedding cache, e.g. 20G; least recently used entries are evicted (default: unbounded).")
+    parser_embeddings.add_argument("--no-resume", action="store_true", help="Ignore completed shards and start afresh.")
+    parser_embeddings.add_argument("--token-dtype", choices=["float32", "float16", "bfloat16"], default=None,
+                                   help="Also keep the unpadded per-token embeddings in this storage dtype.")
+    parser_embeddings.add_argument("--pooling", nargs="+", choices=["mean", "attention", "cls", "topk"], default=None,
+                                   help="Mask-aware pooling strategies to run over the per-token embeddings (requires --token-dtype).")
+    parser_embeddings.add_argument("--pooling-top-k", type=int, default=10, help="Tokens kept by topk pooling (default: 10).")
+    parser_embeddings.add_argument("--pooled-dtype", choices=["float32", "float16"], default="float32", help="Dtype of the pooled outputs (default: float32).")
+    _add_profile_arguments(parser_embeddings)
+    parser_embeddings.set_defaults(func=embeddings_main)
 
     args = parser.parse_args()
-    args.func(args)
+    if getattr(args, "profile", False):
+        logs_dir = os.path.join(args.output, "logs")
+        with profiling(
+            args.command, report_path=os.path.join(logs_dir, f"profile_{args.command}.json"),
+            prometheus_path=args.profile_prometheus,
+            cprofile_dir=os.path.join(logs_dir, "cprofile") if args.profile_cprofile else None,
+        ):
+            args.func(args)
+    else:
+        args.func(args)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,28 +1,150 @@
+import multiprocessing as mp
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import pandas as pd
 from scipy.optimize import minimize
 
-def total_loss(params, vectors, target_loss=0):
+def vectorStats(vectors):
+    """
+    Per-vector sums and (population) standard deviations of a (vectors x values) array.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    return vectors.sum(axis=1), vectors.std(axis=1)
+
+def _loss(params, sums_total, stds_total, target_loss):
     alpha, beta = params
-    total_loss_value = 0
-    for vector in vectors:
-        vector_sum = np.sum(vector)
-        vector_std = np.std(vector)
-        total_loss_value += -(alpha * vector_sum - beta * vector_std)
-    penalty_loss = (total_loss_value - target_loss)**2
-    return penalty_loss
+    return (-(alpha * sums_total - beta * stds_total) - target_loss) ** 2
+
+def _lossGrad(params, sums_total, stds_total, target_loss):
+    alpha, beta = params
+    residual = -(alpha * sums_total - beta * stds_total) - target_loss
+    return np.array([-2 * residual * sums_total, 2 * residual * stds_total])
+
+def total_loss(params, vectors, target_loss=0):
+    vector_sums, vector_stds = vectorStats(vectors)
+    return _loss(params, vector_sums.sum(), vector_stds.sum(), target_loss)
 
 def refined_loss_function(vector, alpha, beta):
     vector_sum = np.sum(vector)
     vector_std = np.std(vector)
     return -(alpha * vector_sum - beta * vector_std)
 
-def optimiseAttention(vectors, num_returned, output_dir, initial_params=[10, 1], target_loss=0):
-    result = minimize(total_loss, initial_params, args=(vectors, target_loss))
+def _topLowest(losses, num_returned):
+    # Indices of the `num_returned` lowest losses per row, in ascending loss order
+    num_returned = min(num_returned, losses.shape[-1])
+    top = np.argpartition(losses, num_returned - 1, axis=-1)[..., :num_returned]
+    order = np.argsort(np.take_along_axis(losses, top, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(top, order, axis=-1)
+
+def optimiseAttention(vectors, num_returned, output_dir, initial_params=[10, 1], target_loss=0, verbose=False):
+    """
+    Fit (alpha, beta) so the summed loss -(alpha * sum - beta * std) over `vectors` meets
+    `target_loss`, then return the indices of the `num_returned` vectors with the lowest loss.
+
+    Per-vector sums and stds are computed once and the fit uses the analytic gradient.
+    With `verbose`, the fitted parameters and selected vectors are printed.
+    """
+    vector_sums, vector_stds = vectorStats(vectors)
+    result = minimize(
+        _loss, initial_params, args=(vector_sums.sum(), vector_stds.sum(), target_loss), jac=_lossGrad,
+    )
     optimal_alpha, optimal_beta = result.x
-    print(f"Optimal alpha: {optimal_alpha}, Optimal beta: {optimal_beta}")
-    losses = [refined_loss_function(vector, optimal_alpha, optimal_beta) for vector in vectors]
-    top_indices = np.argsort(losses)[:num_returned]
-    print(f"\nTop {num_returned} vectors with the lowest loss:")
-    for i in top_indices:
-        print(f"Vector {i} with loss {losses[i]}: {vectors[i]}")
-    return top_indices
\ No newline at end of file
+    losses = -(optimal_alpha * vector_sums - optimal_beta * vector_stds)
+    top_indices = _topLowest(losses, num_returned)
+    if verbose:
+        print(f"Optimal alpha: {optimal_alpha}, Optimal beta: {optimal_beta}")
+        print(f"\nTop {num_returned} vectors with the lowest loss:")
+        for i in top_indices:
+            print(f"Vector {i} with loss {losses[i]}: {vectors[i]}")
+    return top_indices
+
+def optimalParams(sums_total, stds_total, initial_params=(10, 1), target_loss=0):
+    """
+    Fitted (alpha, beta) for many problems at once, given each problem's summed vector sums and stds.
+
+    The residual -(alpha * S - beta * T) - target is linear in (alpha, beta), so every gradient of
+    the squared loss is parallel to (-S, T) and gradient-based minimisation from `initial_params`
+    ends at its projection onto the zero-residual line; that point is computed in closed form.
+
+    Returns:
+        (problems x 2) array of (alpha, beta).
+    """
+    sums_total = np.atleast_1d(np.asarray(sums_total, dtype=np.float64))
+    stds_total = np.atleast_1d(np.asarray(stds_total, dtype=np.float64))
+    direction = np.stack([-sums_total, stds_total], axis=-1)
+    initial = np.asarray(initial_params, dtype=np.float64)
+    residual = direction @ initial - target_loss
+    norm = (direction ** 2).sum(axis=-1)
+    step = np.divide(residual, norm, out=np.zeros_like(residual), where=norm > 0)
+    return initial[None, :] - step[:, None] * direction
+
+def _groupStats(values, starts):
+    # Per group (consecutive rows from each start) column sums and population stds
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.diff(np.append(starts, len(values)))[:, None]
+    sums = np.add.reduceat(values, starts, axis=0)
+    means = sums / counts
+    deviations = values - np.repeat(means, counts[:, 0], axis=0)
+    stds = np.sqrt(np.add.reduceat(deviations ** 2, starts, axis=0) / counts)
+    return sums, stds
+
+def _selectGroups(values, starts, num_returned, initial_params, target_loss):
+    sums, stds = _groupStats(values, starts)
+    params = optimalParams(sums.sum(axis=1), stds.sum(axis=1), initial_params, target_loss)
+    losses = -(params[:, :1] * sums - params[:, 1:] * stds)
+    return _topLowest(losses, num_returned)
+
+def selectTopDimensions(embeddings, groups, num_returned, initial_params=(10, 1), target_loss=0, n_workers=1,
+                        chunk_rows=1_000_000):
+    """
+    Batched `optimiseAttention` over many genes: for each group of rows of `embeddings` (e.g. the
+    attention-weighted embeddings of a gene's sequences), treat every column as a vector over the
+    group's rows, fit (alpha, beta) and pick the `num_returned` lowest-loss columns.
+
+    Groups are processed in vectorised chunks of about `chunk_rows` rows, across `n_workers`
+    processes when more than one.
+
+    Args:
+        embeddings (np.ndarray): (rows x dimensions) values.
+        groups (array-like): Group label of every row.
+        num_returned (int): Columns selected per group.
+        initial_params (tuple): Starting (alpha, beta) (default: (10, 1)).
+        target_loss (float): Target of the summed loss (default: 0).
+        n_workers (int): Number of processes (default: 1).
+        chunk_rows (int): Approximate rows per chunk (default: 1,000,000).
+
+    Returns:
+        np.ndarray: (groups x num_returned) column indices in ascending loss order, groups in
+        order of first appearance.
+        np.ndarray: The group labels.
+    """
+    codes, labels = pd.factorize(pd.Series(np.asarray(groups)), use_na_sentinel=False)
+    order = np.argsort(codes, kind="stable")
+    values = np.asarray(embeddings)[order]
+    if not len(values):
+        # No rows (e.g. no shards were embedded): nothing to select
+        width = min(num_returned, values.shape[1]) if values.ndim == 2 else num_returned
+        return np.zeros((0, width), dtype=np.int64), np.asarray(labels)
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+    if n_workers > 1:
+        chunk_rows = min(chunk_rows, -(-len(values) // n_workers))
+    # Split the groups into chunks of whole groups
+    bounds = [0]
+    for group in range(1, len(starts)):
+        if starts[group] - starts[bounds[-1]] >= chunk_rows:
+            bounds.append(group)
+    bounds.append(len(starts))
+    chunks = []
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        row_end = starts[last] if last < len(starts) else len(values)
+        chunks.append((values[starts[first]:row_end], starts[first:last] - starts[first]))
+    if n_workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context("spawn")) as executor:
+            results = list(executor.map(
+                _selectGroups, [chunk for chunk, _ in chunks], [chunk_starts for _, chunk_starts in chunks],
+                repeat(num_returned), repeat(initial_params), repeat(target_loss),
+            ))
+    else:
+        results = [_selectGroups(chunk, chunk_starts, num_returned, initial_params, target_loss) for chunk, chunk_starts in chunks]
+    return np.concatenate(results), np.asarray(labels)
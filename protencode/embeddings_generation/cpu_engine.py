@@ -0,0 +1,215 @@
+import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from transformers import AutoTokenizer, AutoModel
+
+from protencode.embeddings_generation.generate_ESM2embeddings import generateESM2
+from protencode.embeddings_generation.esm2_attentionweighter import topAttentionPositions
+
+PRECISIONS = ("float32", "bfloat16", "int8")
+
+class CPUEngine:
+    """
+    ESM-2 model prepared for CPU inference, to be passed to `generateESM2(engine=...)`.
+
+    Args:
+        model_name (str): Hugging Face model name or local path.
+        precision (str): "float32", "bfloat16" (weights and activations in bf16) or "int8"
+            (dynamic int8 quantization of the linear layers) (default: "float32").
+        num_threads (int, optional): Intra-op threads used by this process (default: PyTorch's choice).
+    """
+
+    def __init__(self, model_name, precision="float32", num_threads=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model_name = model_name
+        self.precision = precision
+        self.device = torch.device("cpu")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        if precision == "bfloat16":
+            model = model.to(torch.bfloat16)
+        elif precision == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        self.model = model
+
+    def __repr__(self):
+        return f"CPUEngine({self.model_name!r}, precision={self.precision!r}, threads={torch.get_num_threads()})"
+
+def shardIndices(lengths, n_shards):
+    """
+    Split sequence indices into `n_shards` shards of similar total length (longest first, each
+    sequence to the currently lightest shard). Returns a list of sorted index arrays.
+    """
+    loads = np.zeros(n_shards)
+    shards = [[] for _ in range(n_shards)]
+    for idx in np.argsort(-np.asarray(lengths), kind="stable"):
+        target = int(np.argmin(loads))
+        shards[target].append(idx)
+        loads[target] += lengths[idx]
+    return [np.sort(np.array(shard, dtype=np.int64)) for shard in shards]
+
+def _pinCores(worker, threads_per_worker):
+    # Pin the worker to its own block of cores where the platform allows it
+    if not hasattr(os, "sched_setaffinity"):
+        return
+    available = sorted(os.sched_getaffinity(0))
+    cores = available[worker * threads_per_worker:(worker + 1) * threads_per_worker]
+    if cores:
+        os.sched_setaffinity(0, cores)
+
+# Engine of a `CPUWorkerPool` worker process, loaded once by `_initWorker`
+_worker_engine = None
+
+def _initWorker(slots, threads_per_worker, model_name, precision):
+    global _worker_engine
+    _pinCores(slots.get(), threads_per_worker)
+    torch.set_num_threads(threads_per_worker)
+    _worker_engine = CPUEngine(model_name, precision=precision, num_threads=threads_per_worker)
+
+def _shardWorker(model_name, sequences, kwargs):
+    cache_dir = kwargs.pop("cache_dir", None)
+    cache = None
+    if cache_dir is not None:
+        from protencode.embeddings_generation.embedding_cache import EmbeddingCache
+        cache = EmbeddingCache(cache_dir)
+    start = time.perf_counter()
+    embds, attentions = generateESM2(model_name, pd.DataFrame({"sequence": sequences}), engine=_worker_engine, cache=cache, **kwargs)
+    elapsed = time.perf_counter() - start
+    if cache is not None:
+        cache.close()
+    if isinstance(attentions, list):
+        attentions = [attn.numpy() for attn in attentions]
+    elif attentions is not None:
+        attentions = attentions.numpy()
+    return np.stack([embd.numpy() for embd in embds]) if embds else None, attentions, elapsed
+
+class CPUWorkerPool:
+    """
+    Spawned CPU worker processes for `shardedGenerateESM2`, each pinned to its own cores with
+    `threads_per_worker` intra-op threads and holding a `CPUEngine` loaded once, so repeated calls
+    (e.g. one per pipeline shard) do not start processes or load and quantize the model again.
+    Use as a context manager, or call `close()`.
+
+    Args:
+        model_name (str): Hugging Face model name or local path.
+        n_workers (int): Number of worker processes.
+        threads_per_worker (int, optional): Intra-op threads per worker (default: the available
+            cores split between the workers).
+        precision (str): Engine precision, as in `CPUEngine` (default: "float32").
+    """
+
+    def __init__(self, model_name, n_workers, threads_per_worker=None, precision="float32"):
+        if threads_per_worker is None:
+            available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+            threads_per_worker = max(1, available // n_workers)
+        self.model_name = model_name
+        self.n_workers = n_workers
+        self.threads_per_worker = threads_per_worker
+        self.precision = precision
+        context = mp.get_context("spawn")
+        # Every worker takes its own core block index
+        slots = context.Queue()
+        for worker in range(n_workers):
+            slots.put(worker)
+        self.executor = ProcessPoolExecutor(
+            max_workers=n_workers, mp_context=context, initializer=_initWorker,
+            initargs=(slots, threads_per_worker, model_name, precision),
+        )
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def shardedGenerateESM2(model_name, sequence_data, batch_size, max_length, n_workers, threads_per_worker=None,
+                        precision="float32", cache_dir=None, pool=None, **kwargs):
+    """
+    Run `generateESM2` on CPU across `n_workers` spawned processes, each pinned to its own cores with
+    `threads_per_worker` intra-op threads, and merge the results back into input order.
+
+    Sequences are sharded by total length so workers finish together. Keyword arguments (padding,
+    sort_by_length, max_tokens, attention, attention_top_n) are passed on to `generateESM2`; with
+    `cache_dir`, every worker opens the shared `EmbeddingCache`. With a `CPUWorkerPool`, its
+    workers and loaded engines are used (its worker count, threads and precision apply); otherwise
+    a pool is started for this call only.
+
+    Returns:
+        Same as `generateESM2`.
+    """
+    if pool is None:
+        with CPUWorkerPool(model_name, n_workers, threads_per_worker, precision) as pool:
+            return shardedGenerateESM2(
+                model_name, sequence_data, batch_size, max_length, n_workers, cache_dir=cache_dir, pool=pool, **kwargs,
+            )
+    pro_seq = sequence_data["sequence"].tolist()
+    attention = kwargs.pop("attention", "full")
+    attention_top_n = kwargs.pop("attention_top_n", 10)
+    # Top-N positions are taken after merging the per-residue weights
+    worker_attention = "weights" if attention == "topn" else attention
+    shards = [shard for shard in shardIndices([len(seq) for seq in pro_seq], pool.n_workers) if len(shard)]
+    worker_kwargs = dict(kwargs, batch_size=batch_size, max_length=max_length, attention=worker_attention, cache_dir=cache_dir)
+    print(f"Embedding {len(pro_seq)} sequences on {len(shards)} CPU workers x {pool.threads_per_worker} threads ({pool.precision})")
+    futures = [
+        pool.executor.submit(_shardWorker, model_name, [pro_seq[i] for i in shard], dict(worker_kwargs))
+        for shard in shards
+    ]
+    results = [future.result() for future in futures]
+    embds = [None] * len(pro_seq)
+    for shard, (hidden, _, elapsed) in zip(shards, results):
+        for i, idx in enumerate(shard):
+            embds[idx] = torch.from_numpy(hidden[i])
+        print(f"  worker finished {len(shard)} sequences in {elapsed:.1f}s")
+    if worker_attention == "none":
+        return embds, None
+    order = np.argsort(np.concatenate(shards), kind="stable")
+    if worker_attention == "full":
+        attentions = [
+            torch.from_numpy(np.concatenate([result[1][layer] for result in results])[order])
+            for layer in range(len(results[0][1]))
+        ]
+        return embds, attentions
+    weights = torch.from_numpy(np.concatenate([result[1] for result in results])[order])
+    return embds, topAttentionPositions(weights, attention_top_n) if attention == "topn" else weights
+
+def accuracyCheck(model_name, sequence_data, batch_size, max_length, precision, num_threads=None, **kwargs):
+    """
+    Compare `precision` against float32 on `sequence_data`.
+
+    Returns a dict with the maximum absolute difference of the real-token hidden states, the mean
+    and minimum cosine similarity of mean-pooled embeddings, and the throughput (sequences/s) of both.
+    """
+    results = {}
+    for name in ("float32", precision):
+        engine = CPUEngine(model_name, precision=name, num_threads=num_threads)
+        start = time.perf_counter()
+        embds, _ = generateESM2(model_name, sequence_data, batch_size, max_length, attention="none", engine=engine, **kwargs)
+        results[name] = (torch.stack(embds), len(embds) / (time.perf_counter() - start))
+    reference, test = results["float32"][0], results[precision][0]
+    lengths = torch.as_tensor([min(len(seq) + 2, max_length) for seq in sequence_data["sequence"]])
+    mask = (torch.arange(max_length)[None, :] < lengths[:, None]).float()[:, :, None]
+    pooled_reference = (reference * mask).sum(1) / mask.sum(1)
+    pooled_test = (test * mask).sum(1) / mask.sum(1)
+    cosine = torch.nn.functional.cosine_similarity(pooled_reference, pooled_test, dim=-1)
+    report = {
+        "precision": precision,
+        "max_abs_diff": float(((reference - test) * mask).abs().max()),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "float32_seq_per_s": results["float32"][1],
+        f"{precision}_seq_per_s": results[precision][1],
+    }
+    print(f"Accuracy vs float32 ({precision}): max |diff| {report['max_abs_diff']:.4g}, "
+          f"cosine mean {report['mean_cosine']:.6f} / min {report['min_cosine']:.6f}")
+    return report
@@ -0,0 +1,247 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk cache of per-sequence embedding arrays.
+
+    Entries are keyed by sha256(model name | max_length | mode | sequence). Values are appended to
+    per-process shard files and read back through read-only memory maps; a SQLite index (WAL mode)
+    maps keys to (shard, offset, shape), so any number of processes can read while others write.
+    Index rows are only inserted once the shard bytes are flushed, so readers never see partial values.
+    Reads do not take the write lock: access times are kept in memory and written with the next
+    write (or every `access_batch` hits, or on close), and only when older than `access_resolution`
+    seconds. With `max_bytes`, the shard files are kept within that size (see `evict`).
+
+    Usage:
+        with EmbeddingCache("cache/") as cache:
+            keys = [cache.key(model, 800, "max_length", seq) for seq in sequences]
+            hits = cache.get_many(keys)
+            cache.put(keys[0], array)
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, shard_bytes=256 * 1024 * 1024, stale_seconds=3600,
+                 access_resolution=60, access_batch=10000):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.shard_bytes = shard_bytes
+        self.stale_seconds = stale_seconds
+        self.access_resolution = access_resolution
+        self.access_batch = access_batch
+        self._accessed = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, shard TEXT NOT NULL, offset INTEGER NOT NULL, nbytes INTEGER NOT NULL, "
+            "dtype TEXT NOT NULL, shape TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_shard ON entries (shard)")
+        self._shard = None
+        self._maps = {}
+
+    @staticmethod
+    def key(model_name, max_length, mode, sequence):
+        return hashlib.sha256(f"{model_name}|{max_length}|{mode}|{sequence}".encode()).hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._flush_access()
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+        self._maps.clear()
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def total_bytes(self):
+        """
+        Bytes of the live entries.
+        """
+        return self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+
+    def _shard_sizes(self):
+        sizes = {}
+        for name in os.listdir(self.cache_dir):
+            if name.startswith("shard-"):
+                try:
+                    sizes[name] = os.path.getsize(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+        return sizes
+
+    def disk_bytes(self):
+        """
+        Bytes of the shard files, including values of evicted entries not yet reclaimed.
+        """
+        return sum(self._shard_sizes().values())
+
+    def _map(self, shard, end):
+        # Re-map when the shard has grown past the mapped size
+        mapped = self._maps.get(shard)
+        if mapped is None or len(mapped) < end:
+            mapped = np.memmap(os.path.join(self.cache_dir, shard), dtype=np.uint8, mode="r")
+            self._maps[shard] = mapped
+        return mapped
+
+    def get_many(self, keys):
+        """
+        Look up `keys`; returns {key: read-only array} for the hits and refreshes their access time.
+        """
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT key, shard, offset, nbytes, dtype, shape, last_access FROM entries WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for key, shard, offset, nbytes, dtype, shape, last_access in rows:
+                try:
+                    raw = self._map(shard, offset + nbytes)[offset:offset + nbytes]
+                except (FileNotFoundError, ValueError):
+                    # Evicted or compacted by another process since the lookup
+                    continue
+                found[key] = raw.view(np.dtype(dtype)).reshape(json.loads(shape))
+                if now - last_access > self.access_resolution:
+                    self._accessed[key] = now
+        if len(self._accessed) >= self.access_batch:
+            self._flush_access()
+        return found
+
+    def _flush_access(self):
+        if self._accessed:
+            accessed, self._accessed = self._accessed, {}
+            self._write_many("UPDATE entries SET last_access = ? WHERE key = ?", [(now, key) for key, now in accessed.items()])
+
+    def _write_many(self, sql, rows):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.executemany(sql, rows)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def _open_shard(self):
+        if self._shard is None or self._shard.tell() >= self.shard_bytes:
+            if self._shard is not None:
+                self._shard.close()
+            name = f"shard-{os.getpid()}-{time.time_ns()}.bin"
+            self._shard = open(os.path.join(self.cache_dir, name), "ab")
+            self._shard_name = name
+        return self._shard
+
+    def put_many(self, items):
+        """
+        Store {key: array} (or (key, array) pairs); existing keys are left unchanged.
+        """
+        items = list(items.items() if isinstance(items, dict) else items)
+        if not items:
+            return
+        shard = self._open_shard()
+        rows = []
+        now = time.time()
+        for key, array in items:
+            array = np.ascontiguousarray(array)
+            offset = shard.tell()
+            shard.write(array.tobytes())
+            rows.append((key, self._shard_name, offset, array.nbytes, array.dtype.str, json.dumps(list(array.shape)), now))
+        shard.flush()
+        os.fsync(shard.fileno())
+        self._write_many("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self._flush_access()
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def put(self, key, array):
+        self.put_many([(key, array)])
+
+    def _reclaimable(self, name, now):
+        # Shards of other processes may still receive values whose index rows are not yet committed
+        if name.split("-")[1] == str(os.getpid()):
+            return name != (self._shard_name if self._shard is not None else None)
+        try:
+            return now - os.path.getmtime(os.path.join(self.cache_dir, name)) > self.stale_seconds
+        except FileNotFoundError:
+            return False
+
+    def _compact(self, name):
+        # Copy the shard's live values into the current shard, repoint their index rows and remove it
+        rows = self.db.execute("SELECT key, offset, nbytes FROM entries WHERE shard = ?", (name,)).fetchall()
+        if rows:
+            source = np.memmap(os.path.join(self.cache_dir, name), dtype=np.uint8, mode="r")
+            target = self._open_shard()
+            moved = []
+            for key, offset, nbytes in rows:
+                moved.append((self._shard_name, target.tell(), key, name, offset))
+                target.write(source[offset:offset + nbytes].tobytes())
+            del source
+            target.flush()
+            os.fsync(target.fileno())
+            # Rows moved or evicted by another process meanwhile are left alone
+            self._write_many("UPDATE entries SET shard = ?, offset = ? WHERE key = ? AND shard = ? AND offset = ?", moved)
+        if not self.db.execute("SELECT 1 FROM entries WHERE shard = ? LIMIT 1", (name,)).fetchone():
+            os.remove(os.path.join(self.cache_dir, name))
+            self._maps.pop(name, None)
+
+    def evict(self, max_bytes):
+        """
+        Keep the shard files within `max_bytes`.
+
+        Least recently used entries are dropped until the live entries fit, shard files without live
+        entries are removed and, while the files still exceed `max_bytes`, the shards with the most
+        evicted bytes are compacted (their live values copied into the current shard). Open read
+        maps in other processes stay valid. Shards of other processes are only removed or compacted
+        once unmodified for `stale_seconds`, as they may still be receiving values.
+        """
+        self._flush_access()
+        total = self.total_bytes()
+        if total > max_bytes:
+            doomed = []
+            for key, nbytes in self.db.execute("SELECT key, nbytes FROM entries ORDER BY last_access"):
+                if total <= max_bytes:
+                    break
+                doomed.append((key,))
+                total -= nbytes
+            self._write_many("DELETE FROM entries WHERE key = ?", doomed)
+        live = dict(self.db.execute("SELECT shard, SUM(nbytes) FROM entries GROUP BY shard").fetchall())
+        sizes = self._shard_sizes()
+        if self._shard is not None and sizes.get(self._shard_name, 0) > live.get(self._shard_name, 0):
+            # Start a new shard, so the current one can be compacted too
+            self._shard.close()
+            self._shard = None
+        now = time.time()
+        for name in [name for name in sizes if name not in live]:
+            try:
+                if self._reclaimable(name, now):
+                    os.remove(os.path.join(self.cache_dir, name))
+                    self._maps.pop(name, None)
+                    del sizes[name]
+            except FileNotFoundError:
+                sizes.pop(name, None)
+        disk = sum(sizes.values())
+        for name in sorted(sizes, key=lambda name: live.get(name, 0) - sizes[name]):
+            if disk <= max_bytes or sizes[name] <= live.get(name, 0):
+                break
+            if self._reclaimable(name, now):
+                self._compact(name)
+                disk -= sizes[name] - live.get(name, 0)
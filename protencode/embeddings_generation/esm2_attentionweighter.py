@@ -1,14 +1,79 @@
+from typing import NamedTuple
 import torch.nn.functional as F
 import torch
 import numpy as np
+from protencode.embeddings_generation.process_embeddings import rowChunks
 
-def ESM2Attention(attentions_tensor, stacked_embeddings, output_dir):
-    attention_avg = attentions_tensor.mean(dim=0)
-    attention_weights = attention_avg.mean(dim=1)
-    attention_weights = F.softmax(attention_weights, dim=-1)
-    weighted_sum = torch.bmm(attention_weights, stacked_embeddings)
-    pooled_embeddings = weighted_sum.mean(dim=1)
+class AttentionPositions(NamedTuple):
+    """
+    The top-N residue positions of each sequence by attention weight, with their weights.
+    """
+    positions: torch.Tensor
+    weights: torch.Tensor
+
+def reduceAttention(layer_attentions, max_length, attention_mask=None):
+    """
+    Reduce one batch of per-layer attentions to per-residue weights w = mean_i softmax(A)[i, :],
+    with A the layer- and head-averaged attention map padded to `max_length`.
+
+    Summing the embeddings with these weights equals the row-softmax, bmm and mean over rows of
+    `ESM2Attention`, so only (batch x max_length) values need to be kept per batch.
+
+    With the batch's (batch x width) `attention_mask`, the softmax and the mean only run over real
+    positions instead, so padded positions get zero weight and each sequence's weights sum to 1.
+    """
+    attention_avg = torch.stack([attn.float() for attn in layer_attentions]).mean(dim=(0, 2))
+    width = attention_avg.shape[-1]
+    if attention_mask is not None:
+        mask = attention_mask.to(torch.bool)
+        probabilities = F.softmax(attention_avg.masked_fill(~mask[:, None, :], float("-inf")), dim=-1)
+        rows = mask.to(probabilities.dtype)
+        weights = (probabilities * rows[:, :, None]).sum(dim=1) / rows.sum(dim=1, keepdim=True).clamp(min=1)
+        return F.pad(weights, (0, max_length - width)) if width < max_length else weights
+    if width < max_length:
+        attention_avg = F.pad(attention_avg, (0, max_length - width, 0, max_length - width))
+    return F.softmax(attention_avg, dim=-1).mean(dim=1)
+
+def topAttentionPositions(weights, top_n):
+    """
+    Keep the `top_n` highest-weighted residue positions of each sequence.
+    """
+    values, positions = torch.topk(weights, top_n, dim=-1)
+    return AttentionPositions(positions, values)
+
+def ESM2Attention(attentions_tensor, stacked_embeddings, output_dir, save_setting=True,
+                  file_name="esm2_weighted_pooledembeddings_maxlen200.npy", chunk_bytes=64 * 1024 * 1024):
+    """
+    Attention-weighted pooling of per-residue embeddings.
+
+    `attentions_tensor` is either the full (layers x sequences x heads x L x L) attention tensor,
+    the (sequences x L) residue weights from `reduceAttention`, or `AttentionPositions`
+    (pooling then only sums over the kept positions). The embeddings may be float16; pooling runs
+    in float32, about `chunk_bytes` of embeddings at a time. For chunked, mask-aware pooling of large runs,
+    see `pooling.poolEmbeddings`.
+    """
+    if isinstance(attentions_tensor, AttentionPositions):
+        gathered = torch.gather(
+            stacked_embeddings, 1,
+            attentions_tensor.positions[:, :, None].expand(-1, -1, stacked_embeddings.shape[-1]),
+        ).float()
+        pooled_embeddings = (attentions_tensor.weights[:, :, None].float() * gathered).sum(dim=1)
+    elif attentions_tensor.dim() == 2:
+        # Chunks of float16 (memory-mapped) embeddings are converted to float32 one at a time
+        pooled_embeddings = torch.cat([
+            torch.einsum('nl,nld->nd', attentions_tensor[start:end].float(), stacked_embeddings[start:end].float())
+            for start, end in rowChunks(stacked_embeddings, chunk_bytes)
+        ]) if len(stacked_embeddings) else torch.zeros((0, stacked_embeddings.shape[-1]))
+    else:
+        attention_avg = attentions_tensor.mean(dim=0)
+        attention_weights = attention_avg.mean(dim=1)
+        attention_weights = F.softmax(attention_weights, dim=-1)
+        pooled_embeddings = torch.cat([
+            torch.bmm(attention_weights[start:end], stacked_embeddings[start:end].float()).mean(dim=1)
+            for start, end in rowChunks(stacked_embeddings, chunk_bytes)
+        ]) if len(stacked_embeddings) else torch.zeros((0, stacked_embeddings.shape[-1]))
     WPE_np = pooled_embeddings.numpy()
-    print(f"Saving weighted pooled embeddings to {output_dir}")
-    np.save(f"{output_dir}/esm2_weighted_pooledembeddings_maxlen200.npy", WPE_np)
-    return WPE_np.transpose()
\ No newline at end of file
+    if save_setting == True:
+        print(f"Saving weighted pooled embeddings to {output_dir}")
+        np.save(f"{output_dir}/{file_name}", WPE_np)
+    return WPE_np.transpose()
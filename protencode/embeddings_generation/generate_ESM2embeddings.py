@@ -1,35 +1,186 @@
 import os
 os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
+import numpy as np
 import torch
 from transformers import AutoTokenizer, AutoModel
 import torch.nn as nn
 from tqdm import tqdm
+from protencode.embeddings_generation.esm2_attentionweighter import reduceAttention, topAttentionPositions
 
-def generateESM2(model_name, sequence_data, batch_size, max_length):
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModel.from_pretrained(model_name)
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    print(f"Using device {device}")
-    model = nn.DataParallel(model)
-    model = model.to(device)
-    model.eval()
+def lengthBatches(lengths, batch_size, max_tokens=None, sort_by_length=True):
+    """
+    Split sequence indices into batches, optionally bucketed by length.
+
+    With `sort_by_length`, sequences are ordered longest first so each batch holds similar lengths.
+    With `max_tokens`, a batch is also closed once its padded size (members x longest member) would
+    exceed the token budget; a single sequence always forms a batch.
+
+    Returns a list of index arrays into `lengths`.
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(-lengths, kind="stable") if sort_by_length else np.arange(len(lengths))
+    batches, current, longest = [], [], 0
+    for idx in order:
+        candidate = max(longest, lengths[idx])
+        full = len(current) >= batch_size or (max_tokens is not None and candidate * (len(current) + 1) > max_tokens)
+        if current and full:
+            batches.append(np.array(current))
+            current, candidate = [], lengths[idx]
+        current.append(idx)
+        longest = candidate
+    if current:
+        batches.append(np.array(current))
+    return batches
+
+def generateESM2(model_name, sequence_data, batch_size, max_length, padding='max_length', sort_by_length=False, max_tokens=None,
+                 attention='full', attention_top_n=10, cache=None, engine=None, token_store=None, token_offset=0,
+                 mask_attention=False):
+    """
+    Embed sequences with an ESM-2 model, returning per-sequence hidden states and per-layer attentions.
+
+    With padding='longest' each batch is padded only to its own longest member (optionally after
+    bucketing sequences by length and capping batches by `max_tokens`), so short proteins do not pay
+    the attention cost of `max_length`. Outputs are zero-padded back to `max_length` and returned
+    in input order. In both modes the hidden states and attention rows of padded positions are zeroed,
+    so the outputs (and everything pooled from them) do not depend on the padding mode.
+
+    With attention='weights' or 'topn' each batch's attention maps are reduced on the fly to the
+    per-residue weights used by `ESM2Attention` (or their top-N positions), so memory grows with the
+    number of sequences rather than sequences x max_length^2. With `mask_attention`, that reduction
+    ignores padded positions (see `reduceAttention`).
+
+    With a `TokenStore`, the real-token hidden states of every sequence are also written to it as
+    each batch finishes (sequence i to entry `token_offset + i`), without their padded positions.
+
+    With an `EmbeddingCache`, hidden states (and reduced attention weights) are looked up by
+    (model, max_length, attention mode and engine precision, sequence); only misses are sent to the model, each
+    distinct sequence once, and the model is not loaded at all when every sequence is cached.
+
+    Args:
+        model_name (str): Hugging Face model name or local path.
+        sequence_data (pd.DataFrame): Sequences in a 'sequence' column.
+        batch_size (int): Maximum number of sequences per batch.
+        max_length (int): Tokenised length sequences are truncated (and padded back) to.
+        padding (str): 'max_length' (pad every batch to `max_length`) or 'longest' (default: 'max_length').
+        sort_by_length (bool): Bucket sequences by length before batching (default: False).
+        max_tokens (int, optional): Cap on the padded tokens per batch.
+        attention (str): 'full', 'weights', 'topn' or 'none' (default: 'full').
+        attention_top_n (int): Number of positions kept per sequence with attention='topn' (default: 10).
+        cache (EmbeddingCache, optional): Persistent embedding cache (not available with attention='full').
+        engine (CPUEngine, optional): Preloaded model to run instead of loading `model_name`
+            (see `cpu_engine`); otherwise the model is loaded and wrapped in DataParallel on CUDA.
+        token_store (TokenStore, optional): Preallocated ragged store to stream hidden states into
+            (see `token_store`).
+        token_offset (int): Store entry of the first sequence (default: 0).
+        mask_attention (bool): Reduce attention over real positions only (default: False).
+
+    Returns:
+        list of torch.Tensor: (max_length x hidden) hidden states per sequence.
+        The attentions: per layer, (sequences x heads x max_length x max_length) tensors ('full');
+        a (sequences x max_length) weight tensor ('weights'); AttentionPositions ('topn'); or None.
+    """
+    if padding not in ('max_length', 'longest'):
+        raise ValueError(f"Unknown padding '{padding}'")
+    if attention not in ('full', 'weights', 'topn', 'none'):
+        raise ValueError(f"Unknown attention mode '{attention}'")
+    if cache is not None and attention == 'full':
+        raise ValueError("The embedding cache stores reduced attention only; use attention='weights', 'topn' or 'none'")
     pro_seq = sequence_data['sequence'].tolist()
-    embds = []
+    embds = [None] * len(pro_seq)
     attentions = []
-    for i in tqdm(range(0, len(pro_seq), batch_size), desc="Processing Sequences"):
-        batch_seqs = pro_seq[i:i+batch_size]
-        inputs = tokenizer(batch_seqs, return_tensors='pt', padding='max_length', max_length=max_length, truncation=True)
+    if attention in ('weights', 'topn'):
+        attentions = torch.zeros((len(pro_seq), max_length), dtype=torch.float32)
+    todo = np.arange(len(pro_seq))
+    if cache is not None:
+        # Cached values are the hidden states, with the attention weights as an extra last column
+        reduced = 'masked_weights' if mask_attention else 'weights'
+        # Results of bf16 and int8 engines differ from float32 ones, so they never share entries
+        precision = engine.precision if engine is not None else 'float32'
+        # Padded positions are zeroed in both padding modes, so they share entries
+        mode = f"zeroed|{reduced if attention in ('weights', 'topn') else 'tokens'}|{precision}"
+        keys = [cache.key(model_name, max_length, mode, seq) for seq in pro_seq]
+        hits = cache.get_many(keys)
+        first_index = {}
+        for idx, key in enumerate(keys):
+            value = hits.get(key)
+            if value is not None:
+                embds[idx] = torch.from_numpy(np.array(value[:, :-1] if attention != 'none' else value))
+                if attention != 'none':
+                    attentions[idx] = torch.from_numpy(np.array(value[:, -1]))
+            else:
+                first_index.setdefault(key, idx)
+        todo = np.array(sorted(first_index.values()), dtype=np.int64)
+        print(f"Embedding cache: {sum(key in hits for key in keys)} of {len(pro_seq)} sequences cached, {len(todo)} to compute.")
+        if token_store is not None:
+            for idx in range(len(pro_seq)):
+                if embds[idx] is not None:
+                    token_store.write(token_offset + idx, embds[idx].numpy())
+    if engine is not None:
+        tokenizer, model, device = engine.tokenizer, engine.model, engine.device
+    elif len(todo):
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name)
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        print(f"Using device {device}")
+        if device.type == 'cuda':
+            model = nn.DataParallel(model)
+        model = model.to(device)
+        model.eval()
+    # Tokenised length: residues plus the <cls> and <eos> tokens (every batch is max_length wide otherwise)
+    lengths = np.minimum([len(pro_seq[i]) + 2 for i in todo], max_length) if padding == 'longest' else np.full(len(todo), max_length)
+    batches = [todo[batch] for batch in lengthBatches(lengths, batch_size, max_tokens, sort_by_length)]
+    for batch in tqdm(batches, desc="Processing Sequences"):
+        batch_seqs = [pro_seq[i] for i in batch]
+        inputs = tokenizer(batch_seqs, return_tensors='pt', padding=padding, max_length=max_length, truncation=True)
         input_ids = inputs['input_ids'].to(device)
         attention_mask = inputs['attention_mask'].to(device)
-        with torch.no_grad():
-            embeddings = model(input_ids=input_ids, attention_mask=attention_mask, output_attentions=True)
-        embds.extend(embeddings.last_hidden_state.cpu())
-        if not attentions:
-            attentions = [attn.cpu() for attn in embeddings.attentions]
+        with torch.inference_mode():
+            embeddings = model(input_ids=input_ids, attention_mask=attention_mask, output_attentions=attention != 'none')
+        width = input_ids.shape[1]
+        hidden = embeddings.last_hidden_state.float().cpu()
+        mask = inputs['attention_mask'].to(hidden.dtype)
+        # Zero padded positions (the model's pad-token states with 'max_length'), as for those padded back to max_length
+        hidden = hidden * mask[:, :, None]
+        if width < max_length:
+            hidden = torch.nn.functional.pad(hidden, (0, 0, 0, max_length - width))
+        for i, idx in enumerate(batch):
+            embds[idx] = hidden[i]
+            if token_store is not None:
+                token_store.write(token_offset + idx, hidden[i].numpy())
+        index = torch.as_tensor(batch)
+        if attention == 'none':
+            pass
+        elif attention == 'full':
+            if not attentions:
+                attentions = [
+                    torch.zeros((len(pro_seq), attn.shape[1], max_length, max_length), dtype=torch.float32)
+                    for attn in embeddings.attentions
+                ]
+            for layer, attn in enumerate(embeddings.attentions):
+                attn = attn.float().cpu() * mask[:, None, :, None]
+                attentions[layer][index, :, :width, :width] = attn
         else:
-            cpu_attentions = [attn.cpu() for attn in embeddings.attentions]
-            attentions = [torch.cat((attn_layer, cpu_attentions[i]), dim=0) 
-                        for i, attn_layer in enumerate(attentions)]
+            batch_attentions = [attn.float().cpu() * mask[:, None, :, None] for attn in embeddings.attentions]
+            attentions[index] = reduceAttention(batch_attentions, max_length, mask.bool() if mask_attention else None)
+        if cache is not None:
+            cache.put_many([
+                (keys[idx], np.hstack([embds[idx].numpy(), attentions[idx].numpy()[:, None]]) if attention != 'none' else embds[idx].numpy())
+                for idx in batch
+            ])
         del input_ids, attention_mask, embeddings
-        torch.cuda.empty_cache()
-    return embds, attentions
\ No newline at end of file
+        if device.type == 'cuda':
+            torch.cuda.empty_cache()
+    if cache is not None:
+        # Repeated sequences were computed once
+        for idx, key in enumerate(keys):
+            if embds[idx] is None:
+                embds[idx] = embds[first_index[key]]
+                if token_store is not None:
+                    token_store.write(token_offset + idx, embds[idx].numpy())
+                if attention != 'none':
+                    attentions[idx] = attentions[first_index[key]]
+    if attention == 'topn':
+        attentions = topAttentionPositions(attentions, attention_top_n)
+    elif attention == 'none':
+        attentions = None
+    return embds, attentions
@@ -24,7 +24,9 @@ def parse_gpu_info(output):
     :return: A list of dictionaries with GPU information.
     """
     gpu_info = []
-    for line in output.split('\n'):
+    for line in output.strip().split('\n'):
+        if not line.strip():
+            continue
         gpu_idx, total_mem, used_mem = map(int, line.split(','))
         free_mem = total_mem - used_mem
         gpu_info.append({
@@ -56,12 +58,20 @@ def set_cuda_visible_devices(gpu_indices):
     os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
     print(f"CUDA_VISIBLE_DEVICES set to GPUs {', '.join(map(str, gpu_indices))}")
 
-def select_and_set_best_gpus():
+def select_and_set_best_gpus(num_gpus=None, gpu_indices=None, interactive=False, gpu_info_str=None):
     """
-    Main function to query GPUs, select the best ones, and allow user to confirm or override the choice.
+    Main function to query GPUs, select the best ones and set CUDA_VISIBLE_DEVICES.
+    Without prompts, `gpu_indices` (or the PROTENCODE_GPUS environment variable, e.g. "0,2") fixes
+    the GPUs; otherwise the `num_gpus` GPUs (default: all) with the most free memory are used.
+    With `interactive`, the user is asked for the number of GPUs and to confirm or override the choice.
+    :param num_gpus: Number of GPUs to select.
+    :param gpu_indices: GPU indices to use.
+    :param interactive: Prompt the user.
+    :param gpu_info_str: nvidia-smi output to use instead of querying it.
     :return: The indices of the selected GPUs, or None if no GPUs were selected.
     """
-    gpu_info_str = get_gpu_info()
+    if gpu_info_str is None:
+        gpu_info_str = get_gpu_info()
     if not gpu_info_str:
         print("Unable to fetch GPU information.")
         return None
@@ -72,6 +82,18 @@ def select_and_set_best_gpus():
     for gpu in gpu_info:
         print(f"GPU {gpu['gpu_idx']}: {gpu['free_mem']} MiB free out of {gpu['total_mem']} MiB")
     
+    if not interactive:
+        if gpu_indices is None and os.environ.get("PROTENCODE_GPUS"):
+            gpu_indices = [int(idx) for idx in os.environ["PROTENCODE_GPUS"].split(',') if idx.strip().isdigit()]
+        if gpu_indices is None:
+            gpu_indices = select_best_gpus(gpu_info, num_gpus=num_gpus or len(gpu_info))
+        unknown = [idx for idx in gpu_indices if idx not in [gpu['gpu_idx'] for gpu in gpu_info]]
+        if unknown:
+            raise ValueError(f"Invalid GPU indices {unknown}; available: {[gpu['gpu_idx'] for gpu in gpu_info]}")
+        if gpu_indices:
+            set_cuda_visible_devices(gpu_indices)
+        return gpu_indices or None
+    
     num_gpus = int(input("Enter the number of GPUs you want to use: ").strip())
     best_gpu_indices = select_best_gpus(gpu_info, num_gpus=num_gpus)
     print(f"Automatically selecting GPUs {', '.join(map(str, best_gpu_indices))} with the most available memory.")
@@ -0,0 +1,333 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import torch
+
+from protencode.embeddings_generation import (
+    generate_ESM2embeddings,
+    process_embeddings,
+    esm2_attentionweighter,
+    attention_optimiser,
+)
+from protencode.embeddings_generation.token_store import createTokenStore, openTokenStore
+from protencode.embeddings_generation.pooling import poolEmbeddings
+from protencode.embeddings_generation.resource_planner import plan_resources, parse_bytes
+from protencode.embeddings_generation.gpu_selector import set_cuda_visible_devices
+from protencode.utils.intermediate_store import find_frame, read_frame
+from protencode.utils.profiling import profile_stage
+
+DEFAULT_MODEL = "facebook/esm2_t12_35M_UR50D"
+
+def embeddingsDir(output_dir, model_name=DEFAULT_MODEL, max_length=800):
+    """
+    Directory of the embedding outputs, e.g. `<output_dir>/output_800_t12_35m` for ESM-2 t12 35M.
+    """
+    match = re.search(r"t\d+_\d+[MB]", os.path.basename(model_name.rstrip("/")))
+    tag = match.group(0).lower() if match else os.path.basename(model_name.rstrip("/")).lower()
+    return os.path.join(output_dir, f"output_{max_length}_{tag}")
+
+def _saveAtomic(path, **arrays):
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+def _writeManifest(path, manifest):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+def _sequencesDigest(sequences):
+    digest = hashlib.sha256()
+    for sequence in sequences:
+        digest.update(sequence.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def _appendedTo(previous, config, sequences):
+    # Whether `config` only differs from `previous` by sequences appended after its rows.
+    # Per-token stores are laid out for a fixed set of sequences, so they are not extended.
+    same_settings = {key: value for key, value in previous.items() if key not in ("n_sequences", "sequences_sha256")} == {
+        key: value for key, value in config.items() if key not in ("n_sequences", "sequences_sha256")
+    }
+    if not same_settings or config["token_dtype"] is not None or previous.get("n_sequences", 0) > len(sequences):
+        return False
+    return _sequencesDigest(sequences.iloc[:previous["n_sequences"]]) == previous.get("sequences_sha256")
+
+def sequenceGenes(output_dir, sequence_ids):
+    """
+    Gene of every sequence ID, from the `sequences` table (or the joined sample2sequences table of older runs).
+    """
+    if find_frame(output_dir, "sequences") is not None:
+        table = read_frame(output_dir, "sequences", columns=["sequence_id", "geneName"])
+    elif find_frame(output_dir, "sample2sequences", legacy_file="sample2sequences.tsv") is not None:
+        table = read_frame(output_dir, "sample2sequences", legacy_file="sample2sequences.tsv", sep="\t")
+    else:
+        raise FileNotFoundError(f"Missing sequences table in {output_dir}")
+    genes = table.drop_duplicates("sequence_id").set_index("sequence_id")["geneName"]
+    return genes.reindex(np.asarray(sequence_ids)).to_numpy()
+
+def _loadEngine(model_name, precision, threads, device="cpu"):
+    # CPU runs (planned, or forced with gpus="none") get the explicit CPU engine, loaded once for all shards
+    if device == "cuda" and torch.cuda.is_available():
+        return None
+    from protencode.embeddings_generation.cpu_engine import CPUEngine
+    return CPUEngine(model_name, precision=precision, num_threads=threads)
+
+def _modelConfig(model_name):
+    from transformers import AutoConfig
+    return AutoConfig.from_pretrained(model_name)
+
+def selectTopEmbeddings(averaged, weighted, genes, top_n, n_workers=1):
+    """
+    Select, per gene, the `top_n` embedding dimensions chosen by the attention optimiser on the
+    attention-weighted embeddings of the gene's sequences, and return those dimensions of the
+    (unweighted) averaged embeddings: one (sequences x top_n) matrix.
+    """
+    top, gene_names = attention_optimiser.selectTopDimensions(weighted, genes, top_n, n_workers=n_workers)
+    dimensions = top[pd.Index(gene_names).get_indexer(np.asarray(genes))]
+    return np.take_along_axis(np.asarray(averaged), dimensions, axis=1).astype(np.float32)
+
+def run_embeddings_generation(
+    output_dir: str,
+    model_name: str = DEFAULT_MODEL,
+    max_length: int = 800,
+    batch_size: int = None,
+    shard_size: int = 1000,
+    top_n: int = 10,
+    dynamic_padding: bool = False,
+    max_tokens: int = None,
+    n_workers: int = None,
+    threads: int = None,
+    precision: str = "float32",
+    cache_dir: str = None,
+    cache_size: str = None,
+    resume: bool = True,
+    token_dtype: str = None,
+    pooling: tuple = None,
+    pooling_top_k: int = 10,
+    pooled_dtype: str = "float32",
+    memory_limit: str = None,
+    gpus: str = None,
+):
+    """
+    Run the embeddings generation pipeline on `<output_dir>/sequences.txt`.
+
+    Sequences are embedded in fixed-size shards; every shard's pooled outputs are written atomically
+    and recorded in `manifest.json`, so a rerun resumes by skipping completed shards; if sequences
+    were only appended (incremental sequence preparation), the full shards of the earlier rows are
+    kept too. Once all shards are done they are combined into the files read by sample preparation.
+
+    Outputs (in `<output_dir>/output_<max_length>_<model tag>`):
+        - `averaged_embeddings.npy`: mean-pooled embeddings (sequences x hidden).
+        - `pooled_embeddings.npy`: attention-weighted pooled embeddings (sequences x hidden).
+        - `selected_top_unweighted_embeddings.npy`: per gene, the `top_n` optimiser-selected
+          dimensions of the averaged embeddings (sequences x top_n).
+        - `token_embeddings/` (with `token_dtype`): the per-token embeddings of every sequence
+          without padding, as a ragged memory-mapped `TokenStore`, filled as batches finish.
+        - `<strategy>_pooled_embeddings.npy` and `attention_weights.npy` (with `pooling`): the
+          mask-aware pooled embeddings of every strategy, from the token store in bounded chunks,
+          and the per-residue attention weights they use.
+    Rows follow `sequences.txt`.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory with `sequences.txt` from sequence preparation.
+    model_name : str, default="facebook/esm2_t12_35M_UR50D"
+        Hugging Face model name or local path.
+    max_length : int, default=800
+        Tokenised length sequences are truncated to.
+    batch_size : int, optional
+        Maximum number of sequences per batch (default: planned from the available memory).
+    shard_size : int, default=1000
+        Number of sequences per checkpointed shard.
+    top_n : int, default=10
+        Number of embedding dimensions selected per gene.
+    dynamic_padding : bool, default=False
+        Pad batches only to their longest member, bucketing sequences by length.
+    max_tokens : int, optional
+        Cap on the padded tokens per batch (default with `dynamic_padding`: planned).
+    n_workers : int, optional
+        Number of CPU worker processes, started once and kept for all shards (default: planned
+        from cores and memory).
+    threads : int, optional
+        Intra-op threads per CPU process.
+    precision : str, default="float32"
+        CPU inference precision ("float32", "bfloat16" or "int8").
+    cache_dir : str, optional
+        Persistent embedding cache shared between runs.
+    cache_size : str, optional
+        Disk budget of the embedding cache, e.g. "20G"; least recently used entries are evicted
+        after every shard (default: unbounded).
+    resume : bool, default=True
+        Skip shards recorded as complete in the manifest.
+    token_dtype : str, optional
+        Also keep the per-token embeddings, stored as "float32", "float16" or "bfloat16".
+    pooling : tuple of str, optional
+        Pooling strategies ("mean", "attention", "cls", "topk") to run over the token store;
+        requires `token_dtype`. Attention is then reduced over real positions only, also for
+        `pooled_embeddings.npy`.
+    pooling_top_k : int, default=10
+        Tokens kept by "topk" pooling.
+    pooled_dtype : str, default="float32"
+        Dtype of the pooled outputs.
+    memory_limit : str, optional
+        Memory to plan batches for (e.g. "16G") instead of the detected free memory.
+    gpus : str, optional
+        GPU indices to use (e.g. "0,1"), or "none" for the CPU (default: GPUs with room for the model).
+
+    Unset batch sizes and worker counts are chosen by `resource_planner.plan_resources`, which
+    also honours the PROTENCODE_* environment variables. The device and GPUs always come from its
+    plan, also when every size is given; a CPU plan runs on the CPU even where CUDA is available.
+    """
+    if pooling and token_dtype is None:
+        raise ValueError("Pooling runs over the per-token embeddings; set token_dtype to keep them")
+    sequences_file = os.path.join(output_dir, "sequences.txt")
+    if not os.path.exists(sequences_file):
+        raise FileNotFoundError(f"Missing {sequences_file}; run sequence preparation first")
+    sequence_data = pd.read_csv(sequences_file, sep="\t", dtype=str)
+    embed_dir = embeddingsDir(output_dir, model_name, max_length)
+    shard_dir = os.path.join(embed_dir, "shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest_path = os.path.join(embed_dir, "manifest.json")
+    config = {
+        "model_name": model_name,
+        "max_length": max_length,
+        "shard_size": shard_size,
+        "padding": "longest" if dynamic_padding else "max_length",
+        # Shards of older runs kept the model's pad-position states with "max_length" padding
+        "padded_positions": "zeroed",
+        "precision": precision,
+        "n_sequences": len(sequence_data),
+        "sequences_sha256": _sequencesDigest(sequence_data["sequence"]),
+        "token_dtype": token_dtype,
+        "mask_attention": bool(pooling),
+    }
+    manifest = {"config": config, "shards": {}, "complete": False}
+    if resume and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous.get("config") == config:
+            manifest = previous
+        elif _appendedTo(previous.get("config", {}), config, sequence_data["sequence"]):
+            # Sequences were appended (incremental sequence preparation): full shards of the old rows stay valid
+            kept = {
+                shard: entry for shard, entry in previous["shards"].items()
+                if entry["rows"][1] - entry["rows"][0] == shard_size and entry["rows"][1] <= previous["config"]["n_sequences"]
+            }
+            print(f"[INFO] {len(sequence_data) - previous['config']['n_sequences']} sequences appended; reusing {len(kept)} completed shards.")
+            manifest = {"config": config, "shards": kept, "complete": False}
+        else:
+            print("[INFO] Manifest does not match the current sequences or settings; starting afresh.")
+    token_store = None
+    if token_dtype is not None:
+        token_dir = os.path.join(embed_dir, "token_embeddings")
+        if manifest["shards"] and os.path.exists(os.path.join(token_dir, "meta.json")):
+            token_store = openTokenStore(token_dir, mode="r+")
+        else:
+            # Tokenised length: residues plus <cls> and <eos>, truncated to max_length
+            lengths = np.minimum(sequence_data["sequence"].str.len().to_numpy() + 2, max_length)
+            token_store = createTokenStore(token_dir, lengths, _modelConfig(model_name).hidden_size, token_dtype)
+            manifest["shards"] = {}
+    # ---- Plan devices, batches and workers for the available memory (given sizes are kept as they are)
+    plan = plan_resources(
+        _modelConfig(model_name), sequence_data["sequence"].str.len(), max_length, attention="weights",
+        precision=precision, dynamic_padding=dynamic_padding,
+        overrides=dict(batch_size=batch_size, max_tokens=max_tokens, n_workers=n_workers,
+                       threads_per_worker=threads, memory_limit=memory_limit, gpus=gpus),
+    )
+    print(f"[INFO] Resource plan: {plan.describe()}")
+    if plan.device == "cuda":
+        set_cuda_visible_devices(plan.gpus)
+    batch_size, n_workers, threads = plan.batch_size, plan.n_workers, plan.threads_per_worker
+    if dynamic_padding:
+        max_tokens = plan.max_tokens
+    # ---- Embed shard by shard
+    n_shards = (len(sequence_data) + shard_size - 1) // shard_size
+    engine = None
+    pool = None
+    cache = None
+    cache_bytes = parse_bytes(cache_size) if cache_size is not None else None
+    if cache_dir is not None:
+        from protencode.embeddings_generation.embedding_cache import EmbeddingCache
+        cache = EmbeddingCache(cache_dir)
+    options = dict(
+        padding=config["padding"], sort_by_length=dynamic_padding, max_tokens=max_tokens, attention="weights",
+        mask_attention=config["mask_attention"],
+    )
+    try:
+        for shard in range(n_shards):
+            shard_file = os.path.join(shard_dir, f"shard_{shard:05d}.npz")
+            if str(shard) in manifest["shards"] and os.path.exists(shard_file):
+                continue
+            rows = sequence_data.iloc[shard * shard_size:(shard + 1) * shard_size]
+            print(f"[INFO] Embedding shard {shard + 1}/{n_shards} ({len(rows)} sequences)")
+            tokens = np.minimum(rows["sequence"].str.len().to_numpy() + 2, max_length).sum()
+            with profile_stage("embed", sequences=len(rows), tokens=tokens):
+                if n_workers > 1:
+                    from protencode.embeddings_generation.cpu_engine import CPUWorkerPool, shardedGenerateESM2
+                    if pool is None:
+                        # Workers and their engines are started once and kept for all shards
+                        pool = CPUWorkerPool(model_name, n_workers, threads, precision)
+                    embds, weights = shardedGenerateESM2(
+                        model_name, rows, batch_size, max_length, n_workers, cache_dir=cache_dir, pool=pool, **options,
+                    )
+                    if token_store is not None:
+                        for i, embd in enumerate(embds):
+                            token_store.write(shard * shard_size + i, embd.numpy())
+                else:
+                    if engine is None:
+                        engine = _loadEngine(model_name, precision, threads, plan.device)
+                    embds, weights = generate_ESM2embeddings.generateESM2(
+                        model_name, rows, batch_size, max_length, cache=cache, engine=engine,
+                        token_store=token_store, token_offset=shard * shard_size, **options,
+                    )
+            with profile_stage("process_embeddings", sequences=len(rows)):
+                stacked_embeddings, weights, averaged = process_embeddings.processESM2Embeddings(embds, weights, embed_dir, save_setting=False)
+            with profile_stage("attention_weighting", sequences=len(rows)):
+                weighted = esm2_attentionweighter.ESM2Attention(weights, stacked_embeddings, embed_dir, save_setting=False).T
+            if token_store is not None:
+                # The shard's tokens reach the disk before the shard is recorded as complete
+                token_store.flush()
+            arrays = dict(averaged=averaged.astype(np.float32), weighted=weighted.astype(np.float32))
+            if pooling:
+                arrays["weights"] = weights.numpy()
+            _saveAtomic(shard_file, **arrays)
+            manifest["shards"][str(shard)] = {"rows": [shard * shard_size, shard * shard_size + len(rows)], "file": os.path.basename(shard_file)}
+            _writeManifest(manifest_path, manifest)
+            del embds, weights, stacked_embeddings
+            if cache is not None and cache_bytes is not None:
+                cache.evict(cache_bytes)
+    finally:
+        if pool is not None:
+            pool.close()
+        if cache is not None:
+            cache.close()
+    # ---- Combine shards into the outputs read by sample preparation
+    parts = [np.load(os.path.join(shard_dir, f"shard_{shard:05d}.npz")) for shard in range(n_shards)]
+    averaged = np.concatenate([part["averaged"] for part in parts]) if parts else np.zeros((0, 0), dtype=np.float32)
+    weighted = np.concatenate([part["weighted"] for part in parts]) if parts else np.zeros((0, 0), dtype=np.float32)
+    with profile_stage("select_top", rows_in=len(averaged)):
+        selected = selectTopEmbeddings(averaged, weighted, sequenceGenes(output_dir, sequence_data["sequence_id"]), top_n, n_workers)
+    for name, array in (("averaged_embeddings", averaged), ("pooled_embeddings", weighted), ("selected_top_unweighted_embeddings", selected)):
+        tmp = os.path.join(embed_dir, f"{name}.tmp.npy")
+        np.save(tmp, array)
+        os.replace(tmp, os.path.join(embed_dir, f"{name}.npy"))
+    if pooling:
+        weights = np.lib.format.open_memmap(
+            os.path.join(embed_dir, "attention_weights.npy"), mode="w+", dtype=np.float32, shape=(len(sequence_data), max_length),
+        )
+        for shard, part in enumerate(parts):
+            weights[shard * shard_size:shard * shard_size + len(part["weights"])] = part["weights"]
+        weights.flush()
+        with profile_stage("pooling", sequences=len(sequence_data), tokens=int(token_store.lengths.sum())):
+            poolEmbeddings(token_store, weights, strategies=pooling, top_k=pooling_top_k, output_dir=embed_dir, dtype=pooled_dtype)
+    manifest["complete"] = True
+    _writeManifest(manifest_path, manifest)
+    print(f"[INFO] Embeddings written to {embed_dir}")
+    print("[INFO] Embeddings generation complete ✅")
+    return embed_dir
@@ -0,0 +1,125 @@
+import os
+import numpy as np
+from tqdm import tqdm
+
+from protencode.embeddings_generation.token_store import TokenStore
+
+POOLING_STRATEGIES = ("mean", "attention", "cls", "topk")
+
+def _chunkTokens(embeddings, lengths, start, end):
+    # (chunk x longest x hidden) float32 block of sequences start..end, zero beyond each length
+    width = max(int(lengths[start:end].max()), 1)
+    if isinstance(embeddings, TokenStore):
+        block = np.zeros((end - start, width, embeddings.hidden_size), dtype=np.float32)
+        for i in range(start, end):
+            block[i - start, :lengths[i]] = embeddings.sequence(i)
+        return block
+    block = np.asarray(embeddings[start:end, :width], dtype=np.float32)
+    mask = np.arange(width)[None, :] < lengths[start:end, None]
+    return block * mask[:, :, None]
+
+def poolChunk(tokens, lengths, weights=None, strategies=("mean", "attention"), top_k=10):
+    """
+    Pool one block of per-token embeddings over each sequence's first `lengths` positions.
+
+    Strategies:
+        - "mean": mean over the real tokens.
+        - "attention": sum over the real tokens weighted by `weights`, renormalised over them.
+        - "cls": the first (<cls>) token.
+        - "topk": weighted mean of the `top_k` real tokens with the highest weights.
+
+    Args:
+        tokens (np.ndarray): (sequences x L x hidden) embeddings.
+        lengths (np.ndarray): Real tokens per sequence.
+        weights (np.ndarray, optional): (sequences x >= L) per-residue weights, required for
+            "attention" and "topk".
+        strategies (iterable of str): Strategies to compute.
+        top_k (int): Tokens kept by "topk" (default: 10).
+
+    Returns:
+        dict: (sequences x hidden) float32 array per strategy.
+    """
+    width = tokens.shape[1]
+    mask = np.arange(width)[None, :] < np.asarray(lengths)[:, None]
+    pooled = {}
+    if "mean" in strategies:
+        pooled["mean"] = tokens.sum(axis=1) / np.maximum(mask.sum(axis=1), 1)[:, None]
+    if "cls" in strategies:
+        pooled["cls"] = tokens[:, 0] * mask[:, :1]
+    if "attention" in strategies or "topk" in strategies:
+        if weights is None:
+            raise ValueError("Attention weights are required for 'attention' and 'topk' pooling")
+        masked = np.where(mask, np.asarray(weights[:, :width], dtype=np.float32), 0)
+        if "attention" in strategies:
+            normalised = masked / np.maximum(masked.sum(axis=1, keepdims=True), np.finfo(np.float32).tiny)
+            pooled["attention"] = np.einsum("nl,nld->nd", normalised, tokens)
+        if "topk" in strategies:
+            k = min(top_k, width)
+            # Padded positions rank last; they carry zero weight if a sequence is shorter than k
+            ranked = np.where(mask, masked, -np.inf)
+            top = np.argpartition(-ranked, k - 1, axis=1)[:, :k]
+            top_weights = np.take_along_axis(masked, top, axis=1)
+            top_weights = top_weights / np.maximum(top_weights.sum(axis=1, keepdims=True), np.finfo(np.float32).tiny)
+            gathered = np.take_along_axis(tokens, top[:, :, None], axis=1)
+            pooled["topk"] = np.einsum("nk,nkd->nd", top_weights, gathered)
+    return pooled
+
+def poolEmbeddings(embeddings, weights=None, lengths=None, strategies=("mean", "attention"), top_k=10,
+                   chunk_size=256, output_dir=None, names=None, dtype="float32"):
+    """
+    Pool per-token embeddings with several strategies in one pass over bounded chunks of sequences.
+
+    `embeddings` is a `TokenStore` or a (sequences x L x hidden) array (e.g. a memory-mapped
+    `esm2_fullseq_preaveraged_embeddings.npy`); only `chunk_size` sequences are read at a time and
+    positions past each sequence's length are ignored. With `output_dir`, every strategy is written
+    to a preallocated memory-mapped `<name>.npy` as chunks finish, so memory stays bounded by the chunk.
+
+    Args:
+        embeddings (TokenStore or array-like): Per-token embeddings.
+        weights (array-like, optional): (sequences x L) per-residue attention weights, e.g. from
+            `reduceAttention` with an attention mask.
+        lengths (array-like, optional): Real tokens per sequence (default: the store's lengths, or L).
+        strategies (iterable of str): Any of "mean", "attention", "cls" and "topk" (see `poolChunk`).
+        top_k (int): Tokens kept by "topk" (default: 10).
+        chunk_size (int): Sequences per chunk (default: 256).
+        output_dir (str, optional): Directory to write the pooled arrays to.
+        names (dict, optional): Output file name (without .npy) per strategy
+            (default: "<strategy>_pooled_embeddings").
+        dtype (str): Output dtype (default: "float32").
+
+    Returns:
+        dict: (sequences x hidden) array per strategy (memory-mapped with `output_dir`).
+    """
+    strategies = tuple(strategies)
+    unknown = set(strategies) - set(POOLING_STRATEGIES)
+    if unknown:
+        raise ValueError(f"Unknown pooling strategies {sorted(unknown)}, expected any of {POOLING_STRATEGIES}")
+    if isinstance(embeddings, TokenStore):
+        n, hidden = len(embeddings), embeddings.hidden_size
+        if lengths is None:
+            lengths = embeddings.lengths
+    else:
+        n, width, hidden = embeddings.shape
+        if lengths is None:
+            lengths = np.full(n, width)
+    lengths = np.asarray(lengths)
+    names = {strategy: f"{strategy}_pooled_embeddings" for strategy in strategies} | dict(names or {})
+    pooled = {}
+    for strategy in strategies:
+        if output_dir is None:
+            pooled[strategy] = np.zeros((n, hidden), dtype=dtype)
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+            pooled[strategy] = np.lib.format.open_memmap(
+                os.path.join(output_dir, f"{names[strategy]}.npy"), mode="w+", dtype=dtype, shape=(n, hidden),
+            )
+    for start in tqdm(range(0, n, chunk_size), desc="Pooling embeddings"):
+        end = min(start + chunk_size, n)
+        tokens = _chunkTokens(embeddings, lengths, start, end)
+        chunk_weights = None if weights is None else np.asarray(weights[start:end], dtype=np.float32)
+        for strategy, values in poolChunk(tokens, lengths[start:end], chunk_weights, strategies, top_k).items():
+            pooled[strategy][start:end] = values
+    for array in pooled.values():
+        if isinstance(array, np.memmap):
+            array.flush()
+    return pooled
@@ -1,22 +1,66 @@
 import numpy as np
 import torch
 
-def processESM2Embeddings(embds, attentions, output_dir, save_setting=True):
-    stacked_embeddings = torch.stack(embds)
-    attentions_tensor = torch.stack(attentions, dim=0)
-    preX = stacked_embeddings.numpy()
-    pooled_embeddings = torch.mean(stacked_embeddings, dim=1)
+def _stackEmbeddings(embds, path=None, storage_dtype="float32"):
+    # Copy the per-sequence embeddings straight into a preallocated (optionally on-disk) array,
+    # instead of torch.stack followed by a second copy on save
+    if storage_dtype not in ("float32", "float16"):
+        raise ValueError(f"Unknown storage dtype '{storage_dtype}', expected 'float32' or 'float16'")
+    shape = (len(embds),) + tuple(embds[0].shape)
+    if path is None:
+        stacked = torch.empty(shape, dtype=torch.float32)
+        for i, embd in enumerate(embds):
+            stacked[i] = embd
+        return stacked
+    saved = np.lib.format.open_memmap(path, mode="w+", dtype=storage_dtype, shape=shape)
+    for i, embd in enumerate(embds):
+        saved[i] = embd.numpy()
+    saved.flush()
+    # The returned tensor shares the file-backed memory; float16 values are converted a chunk at a
+    # time where float32 is needed (see `meanPool` and `ESM2Attention`)
+    return torch.from_numpy(saved)
+
+def rowChunks(stacked_embeddings, chunk_bytes=64 * 1024 * 1024):
+    """
+    (start, end) ranges of sequences whose float32 copy takes at most about `chunk_bytes`.
+    """
+    row_bytes = 4 * max(int(np.prod(stacked_embeddings.shape[1:])), 1)
+    step = max(1, chunk_bytes // row_bytes)
+    return [(start, min(start + step, len(stacked_embeddings))) for start in range(0, len(stacked_embeddings), step)]
+
+def meanPool(stacked_embeddings, chunk_bytes=64 * 1024 * 1024):
+    """
+    Mean over positions in float32, converting a chunk of sequences at a time so a float16
+    (memory-mapped) stack is never copied whole.
+    """
+    pooled = torch.empty((stacked_embeddings.shape[0], stacked_embeddings.shape[-1]), dtype=torch.float32)
+    for start, end in rowChunks(stacked_embeddings, chunk_bytes):
+        pooled[start:end] = stacked_embeddings[start:end].float().mean(dim=1)
+    return pooled
+
+def processESM2Embeddings(embds, attentions, output_dir, save_setting=True, storage_dtype="float32"):
+    """
+    Stack per-sequence ESM-2 embeddings and mean-pool them over positions.
+
+    With `save_setting`, the full embeddings are written into a preallocated memory-mapped
+    `esm2_fullseq_preaveraged_embeddings.npy` (float32 or float16) as they are stacked.
+    For ragged storage without padded positions, see `token_store`.
+    """
+    stacked_embeddings = _stackEmbeddings(
+        embds, f"{output_dir}/esm2_fullseq_preaveraged_embeddings.npy" if save_setting else None, storage_dtype,
+    )
+    # Attentions reduced while streaming (weights or top-N positions) are passed on as they are
+    attentions_tensor = torch.stack(attentions, dim=0) if isinstance(attentions, list) else attentions
+    pooled_embeddings = meanPool(stacked_embeddings)
     X = pooled_embeddings.numpy()
     if save_setting == True:
-        np.save(f"{output_dir}/esm2_fullseq_preaveraged_embeddings.npy", preX)
         np.save(f"{output_dir}/esm2_fullseq_averaged_embeddings.npy", X)
     return stacked_embeddings, attentions_tensor, X
 
-def processProtTransEmbeddings(embds, output_dir, save_setting=True):
-    stacked_embeddings = torch.stack(embds)
-    preX = stacked_embeddings.numpy()
-    pooled_embeddings = torch.mean(stacked_embeddings, dim=1)
+def processProtTransEmbeddings(embds, output_dir, save_setting=True, storage_dtype="float32"):
+    stacked_embeddings = _stackEmbeddings(
+        embds, f"{output_dir}/prottrans_fullseq_preaveraged_embeddings.npy" if save_setting else None, storage_dtype,
+    )
+    pooled_embeddings = meanPool(stacked_embeddings)
     X = pooled_embeddings.numpy()
-    if save_setting == True:
-        np.save(f"{output_dir}/prottrans_fullseq_preaveraged_embeddings.npy", preX)
-    return stacked_embeddings, X
\ No newline at end of file
+    return stacked_embeddings, X
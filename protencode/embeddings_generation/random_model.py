@@ -0,0 +1,59 @@
+import os
+import json
+import torch
+from transformers import EsmConfig, EsmModel, EsmTokenizer
+
+# ESM-2 token vocabulary, in token id order
+ESM2_VOCABULARY = [
+    "<cls>", "<pad>", "<eos>", "<unk>", "L", "A", "G", "V", "S", "E", "R", "T", "I", "D", "P", "K", "Q", "N",
+    "F", "Y", "M", "H", "W", "C", "X", "B", "U", "Z", "O", ".", "-", "<null_1>", "<mask>",
+]
+# Architecture of facebook/esm2_t12_35M_UR50D (the pipeline's default model), dropout off
+ESM2_T12_35M_CONFIG = dict(
+    vocab_size=33,
+    hidden_size=480,
+    num_hidden_layers=12,
+    num_attention_heads=20,
+    intermediate_size=1920,
+    max_position_embeddings=1026,
+    position_embedding_type="rotary",
+    emb_layer_norm_before=False,
+    token_dropout=True,
+    layer_norm_eps=1e-5,
+    mask_token_id=32,
+    pad_token_id=1,
+    hidden_dropout_prob=0.0,
+    attention_probs_dropout_prob=0.0,
+)
+
+def save_random_esm2(output_dir, config=None, seed=0, **overrides):
+    """
+    Save a randomly initialised ESM-2 model and its tokenizer to `output_dir`, without network access.
+
+    The model has the layer shapes of `config` (default: esm2_t12_35M) and loads like a downloaded
+    checkpoint (`--model <output_dir>`, `AutoModel.from_pretrained(output_dir)`), so the runtime and
+    memory of the embedding stage can be measured offline; its embeddings are meaningless.
+
+    Args:
+        output_dir (str): Directory to write the model to.
+        config (dict or str, optional): Model configuration, or the path of a `config.json`
+            (default: `ESM2_T12_35M_CONFIG`).
+        seed (int): Seed of the random weights (default: 0).
+        **overrides: Configuration values to change, e.g. num_hidden_layers=2.
+
+    Returns:
+        str: `output_dir`.
+    """
+    if isinstance(config, str):
+        with open(config) as f:
+            config = json.load(f)
+    config = {**(ESM2_T12_35M_CONFIG if config is None else config), **overrides}
+    os.makedirs(output_dir, exist_ok=True)
+    vocab_file = os.path.join(output_dir, "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(ESM2_VOCABULARY))
+    EsmTokenizer(vocab_file).save_pretrained(output_dir)
+    torch.manual_seed(seed)
+    model = EsmModel(EsmConfig(**config)).eval()
+    model.save_pretrained(output_dir)
+    return output_dir
@@ -0,0 +1,238 @@
+import os
+import re
+import shutil
+from typing import NamedTuple
+import numpy as np
+
+from protencode.embeddings_generation.gpu_selector import get_gpu_info, parse_gpu_info
+
+# Environment variables overriding the planned values (CLI flags take precedence over them)
+ENV_OVERRIDES = {
+    "batch_size": "PROTENCODE_BATCH_SIZE",
+    "max_tokens": "PROTENCODE_MAX_TOKENS",
+    "n_workers": "PROTENCODE_WORKERS",
+    "threads_per_worker": "PROTENCODE_THREADS",
+    "memory_limit": "PROTENCODE_MEMORY_LIMIT",
+    "gpus": "PROTENCODE_GPUS",
+}
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+class ResourcePlan(NamedTuple):
+    """
+    Device, batching and worker settings chosen by `plan_resources`.
+    """
+    device: str
+    gpus: list
+    batch_size: int
+    max_tokens: int
+    n_workers: int
+    threads_per_worker: int
+    available_bytes: int
+    model_bytes: int
+    sequence_bytes: int
+
+    def describe(self):
+        where = f"GPUs {','.join(map(str, self.gpus))}" if self.device == "cuda" else (
+            f"{self.n_workers} CPU workers x {self.threads_per_worker} threads")
+        return (f"{where}, batch size {self.batch_size}, token budget {self.max_tokens}, "
+                f"{self.available_bytes / 1024 ** 3:.1f} GiB available")
+
+def parse_bytes(value):
+    """
+    Parse a byte count such as "8589934592", "8G" or "512MiB".
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?\s*", str(value), flags=re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Cannot parse byte count '{value}'")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+def read_meminfo(path="/proc/meminfo"):
+    """
+    Total and available memory in bytes from /proc/meminfo, or (None, None) if unreadable.
+    """
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                values[key] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None, None
+    return values.get("MemTotal"), values.get("MemAvailable", values.get("MemFree"))
+
+def _read_first(paths):
+    for path in paths:
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            continue
+    return None
+
+def read_cgroup_memory(root="/sys/fs/cgroup"):
+    """
+    Memory limit and current usage in bytes of the cgroup (v2 or v1), or None where unlimited or absent.
+    """
+    limit = _read_first([os.path.join(root, "memory.max"), os.path.join(root, "memory", "memory.limit_in_bytes")])
+    usage = _read_first([os.path.join(root, "memory.current"), os.path.join(root, "memory", "memory.usage_in_bytes")])
+    limit = int(limit) if limit and limit.isdigit() else None
+    # cgroup v1 reports "unlimited" as a huge page-aligned number
+    if limit is not None and limit >= 1 << 60:
+        limit = None
+    return limit, int(usage) if usage and usage.isdigit() else None
+
+def read_cgroup_cpus(root="/sys/fs/cgroup"):
+    """
+    CPU quota of the cgroup in cores (cpu.max or v1 cfs quota/period), or None if unlimited.
+    """
+    quota = _read_first([os.path.join(root, "cpu.max")])
+    if quota:
+        limit, _, period = quota.partition(" ")
+        return max(1, int(int(limit) / int(period or 100000))) if limit.isdigit() else None
+    limit = _read_first([os.path.join(root, "cpu", "cpu.cfs_quota_us")])
+    period = _read_first([os.path.join(root, "cpu", "cpu.cfs_period_us")])
+    if limit and period and limit.lstrip("-").isdigit() and int(limit) > 0:
+        return max(1, int(limit) // int(period))
+    return None
+
+def available_cpus(cgroup_root="/sys/fs/cgroup"):
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = read_cgroup_cpus(cgroup_root)
+    return min(cpus, quota) if quota else cpus
+
+def available_cpu_memory(meminfo_path="/proc/meminfo", cgroup_root="/sys/fs/cgroup"):
+    """
+    Memory this process can still use: the smaller of MemAvailable and the cgroup's remaining limit.
+    """
+    _, available = read_meminfo(meminfo_path)
+    limit, usage = read_cgroup_memory(cgroup_root)
+    if limit is not None:
+        remaining = limit - (usage or 0)
+        available = remaining if available is None else min(available, remaining)
+    return available
+
+def model_bytes(config, precision="float32"):
+    """
+    Approximate size of the ESM-2 weights described by a Hugging Face config.
+    """
+    hidden, intermediate = config.hidden_size, config.intermediate_size
+    per_layer = 4 * hidden * hidden + 2 * hidden * intermediate + 9 * hidden + intermediate
+    embeddings = (config.vocab_size + getattr(config, "max_position_embeddings", 0)) * hidden
+    linear = config.num_hidden_layers * (4 * hidden * hidden + 2 * hidden * intermediate)
+    total = config.num_hidden_layers * per_layer + embeddings
+    if precision == "int8":
+        return linear + 4 * (total - linear)
+    return total * (2 if precision == "bfloat16" else 4)
+
+def sequence_bytes(config, length, attention="weights", precision="float32"):
+    """
+    Approximate peak inference memory of one sequence padded to `length` tokens.
+
+    Counts the per-layer activations (hidden states, Q/K/V, the feed-forward intermediate and the
+    attention scores and probabilities of every head) plus, unless attention="none", the attention
+    maps of all layers returned by the model, and the float32 copies `generateESM2` keeps.
+    """
+    activation = 2 if precision == "bfloat16" else 4
+    hidden, heads, layers = config.hidden_size, config.num_attention_heads, config.num_hidden_layers
+    per_layer = length * (6 * hidden + 2 * config.intermediate_size) + 2 * heads * length * length
+    returned = 0 if attention == "none" else layers * heads * length * length
+    kept = length * hidden * 4 + (0 if attention == "none" else 2 * layers * heads * length * length * 4 // activation)
+    return int((per_layer + returned) * activation + kept)
+
+def _override(name, overrides):
+    value = (overrides or {}).get(name)
+    if value is None:
+        value = os.environ.get(ENV_OVERRIDES[name]) or None
+    return value
+
+def plan_resources(config, lengths, max_length, attention="weights", precision="float32", memory_fraction=0.8,
+                   dynamic_padding=False, min_threads=4, overrides=None, nvidia_smi_output=None, meminfo_path="/proc/meminfo",
+                   cgroup_root="/sys/fs/cgroup", cpus=None):
+    """
+    Choose the device, batch size, token budget and worker count for embedding `lengths` sequences.
+
+    Available memory is read from nvidia-smi (GPUs with room for the model are used) or, on CPU,
+    from the cgroup limit and /proc/meminfo. `memory_fraction` of it, less the model, is the
+    activation budget; the token budget is that budget over the per-token cost of the longest
+    (padded) sequence, which bounds every narrower batch too; with `dynamic_padding` the batch size
+    is raised so batches of the shortest sequences can fill that budget. On CPU, workers of `min_threads`
+    threads are added while each fits a model and one sequence in memory.
+
+    Every value can be fixed through `overrides` (e.g. from CLI flags) or the PROTENCODE_*
+    environment variables in `ENV_OVERRIDES`; PROTENCODE_GPUS="none" forces the CPU.
+
+    Args:
+        config: Hugging Face model config (hidden_size, intermediate_size, num_hidden_layers,
+            num_attention_heads, vocab_size).
+        lengths (iterable of int): Residues per sequence.
+        max_length (int): Tokenised length sequences are truncated to.
+        attention (str): Attention mode passed to `generateESM2` (default: "weights").
+        precision (str): "float32", "bfloat16" or "int8" (default: "float32").
+        dynamic_padding (bool): Batches are padded to their longest member (default: False).
+        memory_fraction (float): Share of the available memory to plan for (default: 0.8).
+        min_threads (int): Threads per CPU worker (default: 4).
+        overrides (dict, optional): batch_size, max_tokens, n_workers, threads_per_worker,
+            memory_limit (replaces the detected available memory; bytes or e.g. "8G") and gpus
+            (list or "0,1"/"none").
+        nvidia_smi_output (str, optional): nvidia-smi CSV report to use instead of running it
+            ("" for no GPUs).
+        meminfo_path (str): /proc/meminfo replacement for testing.
+        cgroup_root (str): cgroup mount replacement for testing.
+        cpus (int, optional): Usable CPU cores (default: affinity and cgroup quota).
+
+    Returns:
+        ResourcePlan
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    longest = min(int(lengths.max(initial=0)) + 2, max_length)
+    shortest = min(int(lengths.min(initial=max_length)) + 2, max_length)
+    weights = model_bytes(config, precision)
+    per_sequence = sequence_bytes(config, longest, attention, precision)
+    # ---- Devices
+    gpus = _override("gpus", overrides)
+    if isinstance(gpus, str):
+        gpus = [] if gpus.strip().lower() in ("none", "cpu", "") else [int(idx) for idx in gpus.split(",")]
+    if nvidia_smi_output is None:
+        nvidia_smi_output = get_gpu_info() if gpus != [] and shutil.which("nvidia-smi") else ""
+    gpu_info = parse_gpu_info(nvidia_smi_output) if nvidia_smi_output else []
+    if gpus is None:
+        fitting = [gpu for gpu in gpu_info if gpu["free_mem"] * 1024 ** 2 * memory_fraction > weights + per_sequence]
+        gpus = [gpu["gpu_idx"] for gpu in sorted(fitting, key=lambda gpu: gpu["free_mem"], reverse=True)]
+    chosen = [gpu for gpu in gpu_info if gpu["gpu_idx"] in gpus]
+    memory_limit = _override("memory_limit", overrides)
+    if chosen:
+        device = "cuda"
+        available = min(gpu["free_mem"] for gpu in chosen) * 1024 ** 2
+    else:
+        device, gpus = "cpu", []
+        available = available_cpu_memory(meminfo_path, cgroup_root) or 0
+    if memory_limit is not None:
+        available = parse_bytes(memory_limit)
+    budget = available * memory_fraction
+    # ---- Workers
+    if device == "cuda":
+        n_workers, threads = 1, None
+    else:
+        cpus = cpus or available_cpus(cgroup_root)
+        fixed_threads = _override("threads_per_worker", overrides)
+        threads = int(fixed_threads) if fixed_threads is not None else min(min_threads, cpus)
+        n_workers = _override("n_workers", overrides)
+        if n_workers is None:
+            n_workers = max(1, min(cpus // threads, int(budget // (weights + per_sequence))))
+            if fixed_threads is None:
+                # Workers limited by memory share the spare cores
+                threads = max(threads, cpus // n_workers)
+        n_workers = int(n_workers)
+        budget = budget / n_workers
+    # ---- Batches
+    activation_budget = max(budget - weights, 0)
+    per_gpu = max(1, int(activation_budget // per_sequence))
+    max_tokens = _override("max_tokens", overrides)
+    max_tokens = int(max_tokens) if max_tokens is not None else max(longest, per_gpu * longest * max(len(gpus), 1))
+    batch_size = _override("batch_size", overrides)
+    if batch_size is None:
+        batch_size = per_gpu * max(len(gpus), 1)
+        if dynamic_padding:
+            batch_size = max(batch_size, max_tokens // shortest)
+    return ResourcePlan(device, list(gpus), int(batch_size), max_tokens, n_workers, threads, int(available), int(weights), int(per_sequence))
@@ -0,0 +1,112 @@
+import os
+import json
+import numpy as np
+
+TOKEN_DTYPES = ("float32", "float16", "bfloat16")
+
+# bfloat16 has no NumPy dtype; its bit patterns are stored as uint16
+_STORAGE = {"float32": np.float32, "float16": np.float16, "bfloat16": np.uint16}
+
+def _toStorage(array, dtype):
+    array = np.asarray(array, dtype=np.float32)
+    if dtype == "bfloat16":
+        # Round to nearest even on the upper 16 bits
+        bits = np.ascontiguousarray(array).view(np.uint32)
+        return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+    return array.astype(_STORAGE[dtype], copy=False)
+
+def _fromStorage(array, dtype):
+    if dtype == "bfloat16":
+        return (array.astype(np.uint32) << 16).view(np.float32)
+    return array.astype(np.float32, copy=False)
+
+class TokenStore:
+    """
+    Ragged on-disk store of per-token embeddings: the real-token rows of every sequence back to back
+    in one (total tokens x hidden) memory-mapped array, with `offsets` giving each sequence's row range,
+    so padded positions are never stored.
+
+    Files in `path`: `tokens.npy` (float32, float16 or bfloat16 bits as uint16), `offsets.npy` and
+    `meta.json`. Create a store with `createTokenStore`, open an existing one with `openTokenStore`.
+
+    `store[i]` is a zero-copy read-only view of sequence i in the storage dtype; `store.sequence(i)`
+    returns it as float32 (a copy unless stored as float32).
+    """
+
+    def __init__(self, path, tokens, offsets, dtype):
+        self.path = path
+        self.tokens = tokens
+        self.offsets = offsets
+        self.dtype = dtype
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def hidden_size(self):
+        return self.tokens.shape[1]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def sequence(self, index):
+        return _fromStorage(self[index], self.dtype)
+
+    def write(self, index, hidden):
+        """
+        Store the first `lengths[index]` rows of `hidden` (a sequence's per-token embeddings,
+        possibly padded) as sequence `index`.
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        self.tokens[start:end] = _toStorage(np.asarray(hidden)[:end - start], self.dtype)
+
+    def meanPooled(self, divisor=None, chunk_size=1024):
+        """
+        Per-sequence sum of the token embeddings divided by the sequence length (or by `divisor`,
+        e.g. `max_length` to match a mean over zero-padded rows), read `chunk_size` sequences at a time.
+        """
+        pooled = np.zeros((len(self), self.hidden_size), dtype=np.float32)
+        for start in range(0, len(self), chunk_size):
+            end = min(start + chunk_size, len(self))
+            rows = _fromStorage(self.tokens[self.offsets[start]:self.offsets[end]], self.dtype)
+            sums = np.add.reduceat(rows, self.offsets[start:end] - self.offsets[start], axis=0) if len(rows) else 0
+            lengths = self.lengths[start:end]
+            # reduceat repeats the next row for empty sequences
+            sums = np.where(lengths[:, None] > 0, sums, 0)
+            pooled[start:end] = sums / (divisor if divisor is not None else np.maximum(lengths, 1)[:, None])
+        return pooled
+
+    def flush(self):
+        if isinstance(self.tokens, np.memmap):
+            self.tokens.flush()
+
+def createTokenStore(path, lengths, hidden_size, dtype="float32"):
+    """
+    Preallocate a `TokenStore` in `path` for sequences of `lengths` real tokens each.
+    """
+    if dtype not in TOKEN_DTYPES:
+        raise ValueError(f"Unknown token dtype '{dtype}', expected one of {TOKEN_DTYPES}")
+    os.makedirs(path, exist_ok=True)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    tokens = np.lib.format.open_memmap(
+        os.path.join(path, "tokens.npy"), mode="w+", dtype=_STORAGE[dtype], shape=(int(offsets[-1]), hidden_size),
+    )
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"dtype": dtype, "n_sequences": len(lengths), "hidden_size": hidden_size}, f)
+    return TokenStore(path, tokens, offsets, dtype)
+
+def openTokenStore(path, mode="r"):
+    """
+    Open the `TokenStore` in `path`, memory-mapped read-only (or writable with mode="r+").
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    offsets = np.load(os.path.join(path, "offsets.npy"))
+    tokens = np.load(os.path.join(path, "tokens.npy"), mmap_mode=mode)
+    return TokenStore(path, tokens, offsets, meta["dtype"])
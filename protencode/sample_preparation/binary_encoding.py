@@ -1,18 +1,14 @@
-import pandas as pd
+import os
+import numpy as np
 
-def createBinaryMatrix(Samples, output_dir):
+from protencode.sample_preparation.sparse_encoding import sampleGeneCounts, saveSparseEncoding
+
+def createBinaryMatrix(index, output_dir, export_csv=False):
     print("Creating binary frame...")
-    Samples['samples'] = Samples['sample_id'].str.split(';')
-    expanded_df = Samples.explode('samples', ignore_index=True)
-    expanded_df['binary_variant'] = expanded_df['variant'].apply(lambda x: 0 if x == 'WT' else 1)
-    binary_matrix_df = expanded_df.pivot_table(index='samples', columns='geneName', 
-                                                values='binary_variant', aggfunc='first').fillna(0)
-    binary_matrix_df.columns.name = None
-    binary_matrix_df = binary_matrix_df.reset_index()
-    # Ensure the sampleFrames directory exists
+    binary_matrix = sampleGeneCounts(index, dtype=np.int8)
+    # A gene is mutated in a sample if it carries any mutant sequence of it
+    binary_matrix.matrix.data[:] = 1
     save_dir = os.path.join(output_dir, "sampleFrames")
-    os.makedirs(save_dir, exist_ok=True)
-    out_path = os.path.join(save_dir, "binaryEncoding.csv")
+    out_path = saveSparseEncoding(binary_matrix, save_dir, "binaryEncoding", export_csv=export_csv)
     print(f"Saving to {out_path}.")
-    binary_matrix_df.to_csv(out_path, index=None)
-    return binary_matrix_df
\ No newline at end of file
+    return binary_matrix
@@ -1,26 +1,99 @@
-import pandas as pd
-import numpy as np
 import os
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+class TopMatrix(NamedTuple):
+    """
+    Sample x (gene, TopK) matrix of ESM top-N scores with its row and column labels.
+    Columns are gene-major: `gene.Top1 ... gene.TopN` for each gene in sorted order.
+    """
+    matrix: np.ndarray
+    samples: np.ndarray
+    columns: np.ndarray
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def toDataFrame(self, rows=slice(None)):
+        """
+        Dense DataFrame indexed by 'samples' with the columns in lexicographic order, as the former
+        pivot table produced them.
+        """
+        order = np.argsort(self.columns, kind="stable")
+        frame = pd.DataFrame(self.matrix[rows][:, order], index=pd.Index(self.samples[rows], name="samples"), columns=self.columns[order])
+        frame.columns.name = "gene_Top"
+        return frame
+
+def topColumns(genes, top_n):
+    return np.array([f"{gene}.Top{k}" for gene in genes for k in range(1, top_n + 1)], dtype=object)
+
+def scatterTopMatrix(index, Top10Embd, top_n, out=None, block_rows=4096):
+    """
+    Scatter top-N embedding scores straight into a (samples x genes*top_n) float32 matrix.
+
+    Every sample first gets the wildtype scores of each gene, then the scores of its first mutant
+    sequence (lowest sequence code) overwrite the slots of genes it carries mutations in.
+
+    Args:
+        index (SampleIndex): The shared sample index.
+        Top10Embd (np.ndarray): Top-N scores per sequence code (may be memory-mapped).
+        top_n (int): Number of scores used per gene.
+        out (np.ndarray, optional): Preallocated float32 output, e.g. a memory-mapped `.npy`.
+        block_rows (int): Number of sample rows filled with wildtype scores at once (default: 4096).
+
+    Returns:
+        np.ndarray: The filled matrix.
+    """
+    if top_n > Top10Embd.shape[1]:
+        raise ValueError(f"top_n={top_n} exceeds the {Top10Embd.shape[1]} embeddings available per sequence")
+    n_samples, n_genes = len(index.samples), len(index.genes)
+    if out is None:
+        out = np.empty((n_samples, n_genes * top_n), dtype=np.float32)
+    slots = out.reshape(n_samples, n_genes, top_n)
+    wildtype = np.asarray(Top10Embd[np.clip(index.wildtype_codes, 0, None), :top_n], dtype=np.float32)
+    wildtype[index.wildtype_codes < 0] = np.nan
+    for start in range(0, n_samples, block_rows):
+        slots[start:start + block_rows] = wildtype
+    rows, columns, codes = index.firstMutants()
+    slots[rows, columns] = np.asarray(Top10Embd[codes, :top_n], dtype=np.float32)
+    return out
+
+def create_top_matrix(index, Top10Embd, output_dir, top_n, memmap=False, export_csv=False, csv_rows=1024):
+    """
+    Build the ESM top-N matrix and save it to `<output_dir>/sampleFrames/esmTop10Encoding.npy`, with
+    `.samples.txt` and `.columns.txt` label files.
+
+    Args:
+        index (SampleIndex): The shared sample index.
+        Top10Embd (np.ndarray): Top-N scores per sequence code (may be memory-mapped).
+        output_dir (str): Output directory.
+        top_n (int): Number of scores used per gene.
+        memmap (bool): Fill a memory-mapped `.npy` in place instead of building the matrix in RAM (default: False).
+        export_csv (bool): Also write `esmTop10Encoding.csv` in the former pivot layout (default: False).
+        csv_rows (int): Number of sample rows written to the CSV at once (default: 1024).
 
-def sampleJoin(Samples, Top10Embd):
-    Top10DF = pd.DataFrame(Top10Embd, columns=[f'Top{i}' for i in range(1, Top10Embd.shape[1] + 1)])
-    SamplesCombined = pd.concat([Samples, Top10DF], axis=1)
-    SamplesCombined['samples'] = SamplesCombined['sample_id'].str.split(';')
-    SamplesExpanded = SamplesCombined.explode('samples', ignore_index=True)
-    return SamplesExpanded
-
-def create_top_matrix(Samples, Top10Embd, output_dir, top_n):
-    expanded_df = sampleJoin(Samples, Top10Embd)
-    melted_df = expanded_df.melt(id_vars=['samples', 'geneName'], 
-                                 value_vars=[f'Top{i}' for i in range(1, top_n+1)],
-                                 var_name='Top', value_name='Score')
-    melted_df['gene_Top'] = melted_df['geneName'] + '.' + melted_df['Top']
-    matrix_df = melted_df.pivot_table(index='samples', columns='gene_Top', values='Score', aggfunc='first')
-    # Ensure the sampleFrames directory exists
+    Returns:
+        TopMatrix: The matrix with its labels.
+    """
     save_dir = os.path.join(output_dir, "sampleFrames")
     os.makedirs(save_dir, exist_ok=True)
-    out_path = os.path.join(save_dir, "esmTop10Encoding.csv")
+    out_path = os.path.join(save_dir, "esmTop10Encoding.npy")
+    shape = (len(index.samples), len(index.genes) * top_n)
+    out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=shape) if memmap else None
+    matrix = TopMatrix(scatterTopMatrix(index, Top10Embd, top_n, out=out), index.samples, topColumns(index.genes, top_n))
     print(f"Saving to {out_path}.")
-    matrix_df_reset = matrix_df.reset_index()
-    matrix_df_reset.to_csv(out_path, index=False)
-    return matrix_df
\ No newline at end of file
+    if memmap:
+        matrix.matrix.flush()
+    else:
+        np.save(out_path, matrix.matrix)
+    for axis, labels in (("samples", matrix.samples), ("columns", matrix.columns)):
+        with open(os.path.join(save_dir, f"esmTop10Encoding.{axis}.txt"), "w") as f:
+            f.writelines(f"{label}\n" for label in labels)
+    if export_csv:
+        csv_path = os.path.join(save_dir, "esmTop10Encoding.csv")
+        with open(csv_path, "w") as f:
+            for start in range(0, shape[0], csv_rows):
+                matrix.toDataFrame(slice(start, start + csv_rows)).reset_index().to_csv(f, index=False, header=start == 0)
+    return matrix
@@ -1,15 +1,11 @@
-import pandas as pd
+import os
 
-def createMultiMutationMatrix(Samples, output_dir):
+from protencode.sample_preparation.sparse_encoding import sampleGeneCounts, saveSparseEncoding
+
+def createMultiMutationMatrix(index, output_dir, export_csv=False):
     print("Creating multi-mutation frame...")
-    Samples['samples'] = Samples['sample_id'].str.split(';')
-    expanded_df = Samples.explode('samples', ignore_index=True)
-    expanded_df['mutation_count'] = expanded_df['variant'].apply(lambda x: 0 if x == 'WT' else 1)
-    mutation_count_df = expanded_df.groupby(['samples', 'geneName'])['mutation_count'].sum().reset_index()
-    mutation_matrix_df = mutation_count_df.pivot_table(index='samples', columns='geneName', 
-                                                        values='mutation_count', aggfunc='first').fillna(0)
-    mutation_matrix_df.columns.name = None
-    mutation_matrix_df = mutation_matrix_df.reset_index()
-    print(f"Saving to {output_dir}.")
-    mutation_matrix_df.to_csv(f"{output_dir}/sampleFrames/multimutEncoding.csv", index=None)
-    return mutation_matrix_df
\ No newline at end of file
+    mutation_matrix = sampleGeneCounts(index)
+    save_dir = os.path.join(output_dir, "sampleFrames")
+    out_path = saveSparseEncoding(mutation_matrix, save_dir, "multimutEncoding", export_csv=export_csv)
+    print(f"Saving to {out_path}.")
+    return mutation_matrix
@@ -1,5 +1,5 @@
 import os
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 from protencode.sample_preparation import (
@@ -7,6 +7,16 @@ from protencode.sample_preparation import (
     multimut_encoding,
     esmattention_encoding,
 )
+from protencode.sample_preparation.sample_mapping import loadSampleMapping
+from protencode.sample_preparation.sample_index import buildSampleIndex
+from protencode.utils.profiling import profile_stage, count_rows
+
+def _profiled(name, encode):
+    # Encodings run in threads, so their CPU time and RSS are those of the whole process
+    with profile_stage(name) as record:
+        matrix = encode()
+        record.count(rows_out=count_rows(matrix))
+    return matrix
 
 def run_sample_preparation(
     output_dir: str,
@@ -14,10 +24,15 @@ def run_sample_preparation(
     do_binary: bool = False,
     do_multi: bool = False,
     do_esm: bool = False,
+    export_csv: bool = False,
+    n_workers: int = None,
+    esm_memmap: bool = False,
 ):
     """
     Run the sample preparation pipeline.
 
+    The sample index is built once and shared read-only by all encodings, which run concurrently.
+
     Parameters
     ----------
     output_dir : str
@@ -30,42 +45,53 @@ def run_sample_preparation(
         Generate the multi-mutation encoding matrix.
     do_esm : bool
         Generate the ESM top-N attention matrix.
+    export_csv : bool, default=False
+        Also write the matrices as dense CSV (binary and multi-mutation matrices are always saved
+        as sparse `.npz`, the ESM matrix as float32 `.npy`, each with label files).
+    n_workers : int, optional
+        Number of encodings run at once (default: all selected encodings).
+    esm_memmap : bool, default=False
+        Fill the ESM matrix in a memory-mapped `.npy` so it never has to fit in RAM.
     """
-    # ---- Load input data
-    import os, pandas as pd, numpy as np
-    from protencode.sample_preparation import (
-        binary_encoding,
-        multimut_encoding,
-        esmattention_encoding,
-    )
     top10_embd_path = os.path.join(
         output_dir, "output_800_t12_35m", "selected_top_unweighted_embeddings.npy"
     )
-    pooled_embd_path = os.path.join(
-        output_dir, "output_800_t12_35m", "pooled_embeddings.npy"
-    )
-    samples_path = os.path.join(output_dir, "sample2sequences.tsv")
-    if not os.path.exists(samples_path):
-        raise FileNotFoundError(f"Missing sample2sequences.tsv in {output_dir}")
-    Samples = pd.read_csv(samples_path, sep="\t")
-    Top10Embd = np.load(top10_embd_path) if os.path.exists(top10_embd_path) else None
-    ESM2Data = np.load(pooled_embd_path) if os.path.exists(pooled_embd_path) else None
     # ---- Decide which encodings to run
     if not (do_binary or do_multi or do_esm):
         do_binary, do_multi, do_esm = True, True, True
-    results = {}
+    if do_esm and not os.path.exists(top10_embd_path):
+        raise FileNotFoundError("Missing Top10 embeddings .npy file for ESM matrix")
+    # ---- Load input data: long-format sample -> mutant sequence pairs, indexed once
+    with profile_stage("load_mapping") as record:
+        mapping = loadSampleMapping(output_dir)
+        record.count(rows_out=len(mapping.long))
+    with profile_stage("sample_index", rows_in=len(mapping.long)) as record:
+        index = buildSampleIndex(mapping)
+        record.count(rows_out=len(index.samples))
+    os.makedirs(os.path.join(output_dir, "sampleFrames"), exist_ok=True)
+
+    def esm_top():
+        # Memory-mapped, so only the rows of carried sequences are read
+        Top10Embd = np.load(top10_embd_path, mmap_mode="r")
+        return esmattention_encoding.create_top_matrix(
+            index, Top10Embd, output_dir, top_n=top_n, memmap=esm_memmap, export_csv=export_csv
+        )
+
+    encodings = {}
     if do_binary:
-        results["binary"] = binary_encoding.createBinaryMatrix(Samples, output_dir)
-        print(f"[INFO] Binary matrix shape: {results['binary'].shape}")
+        encodings["binary"] = lambda: binary_encoding.createBinaryMatrix(index, output_dir, export_csv=export_csv)
     if do_multi:
-        results["multi"] = multimut_encoding.createMultiMutationMatrix(Samples, output_dir)
-        print(f"[INFO] Multi-mutation matrix shape: {results['multi'].shape}")
+        encodings["multi"] = lambda: multimut_encoding.createMultiMutationMatrix(index, output_dir, export_csv=export_csv)
     if do_esm:
-        if Top10Embd is None:
-            raise FileNotFoundError("Missing Top10 embeddings .npy file for ESM matrix")
-        results["esm_top"] = esmattention_encoding.create_top_matrix(
-            Samples, Top10Embd, output_dir, top_n=top_n
-        )
+        encodings["esm_top"] = esm_top
+    with ThreadPoolExecutor(max_workers=n_workers or len(encodings)) as executor:
+        futures = {name: executor.submit(_profiled, name, encode) for name, encode in encodings.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    if "binary" in results:
+        print(f"[INFO] Binary matrix shape: {results['binary'].shape}")
+    if "multi" in results:
+        print(f"[INFO] Multi-mutation matrix shape: {results['multi'].shape}")
+    if "esm_top" in results:
         print(f"[INFO] ESM top{top_n} matrix shape: {results['esm_top'].shape}")
     print("[INFO] Sample preparation complete ✅")
-    return results
\ No newline at end of file
+    return results
@@ -0,0 +1,73 @@
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+class SampleIndex(NamedTuple):
+    """
+    Integer index of a sample-to-sequence mapping, built once and shared read-only by the encoders.
+
+    samples        : sorted sample IDs (matrix rows)
+    genes          : sorted gene names (matrix columns)
+    sequence_genes : gene column of every sequence code
+    wildtype_codes : sequence code of the wildtype of every gene (-1 if it has none)
+    pair_rows      : sample row of every mutant pair
+    pair_codes     : sequence code of every mutant pair
+    """
+    samples: np.ndarray
+    genes: np.ndarray
+    sequence_genes: np.ndarray
+    wildtype_codes: np.ndarray
+    pair_rows: np.ndarray
+    pair_codes: np.ndarray
+
+    @property
+    def pair_columns(self):
+        return self.sequence_genes[self.pair_codes]
+
+    def carriedSequences(self):
+        """
+        Return the (samples x genes) sequence code carried by every sample in every gene: its first
+        mutant sequence, or the gene's wildtype.
+        """
+        carried = np.tile(self.wildtype_codes, (len(self.samples), 1))
+        rows, columns, codes = self.firstMutants()
+        carried[rows, columns] = codes
+        return carried
+
+    def firstMutants(self):
+        """
+        Return (rows, columns, codes) of the lowest mutant sequence code of every mutated sample/gene cell.
+        """
+        columns = self.pair_columns
+        order = np.lexsort((self.pair_codes, columns, self.pair_rows))
+        rows, columns, codes = self.pair_rows[order], columns[order], self.pair_codes[order]
+        first = np.r_[True, (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])] if len(order) else np.zeros(0, dtype=bool)
+        return rows[first], columns[first], codes[first]
+
+def _readOnly(array):
+    array.setflags(write=False)
+    return array
+
+def buildSampleIndex(mapping):
+    """
+    Build the shared SampleIndex of a SampleMapping.
+    """
+    sample_ids = mapping.samples["sample_id"].to_numpy(dtype=object)
+    sample_order = np.argsort(sample_ids, kind="stable")
+    sample_rank = np.empty(len(sample_ids), dtype=np.int64)
+    sample_rank[sample_order] = np.arange(len(sample_ids))
+    sequences = mapping.sequences.sort_values("sequence_code")
+    gene_codes, genes = pd.factorize(sequences["geneName"], sort=True)
+    wildtype_codes = np.full(len(genes), -1, dtype=np.int64)
+    is_wildtype = (sequences["variant"] == "WT").to_numpy()
+    # First wildtype row of each gene
+    wildtype_rows = np.flatnonzero(is_wildtype)[::-1]
+    wildtype_codes[gene_codes[wildtype_rows]] = sequences["sequence_code"].to_numpy()[wildtype_rows]
+    return SampleIndex(
+        samples=_readOnly(sample_ids[sample_order]),
+        genes=_readOnly(np.asarray(genes, dtype=object)),
+        sequence_genes=_readOnly(gene_codes.astype(np.int64)),
+        wildtype_codes=_readOnly(wildtype_codes),
+        pair_rows=_readOnly(sample_rank[mapping.long["sample_code"].to_numpy()]),
+        pair_codes=_readOnly(mapping.long["sequence_code"].to_numpy().astype(np.int64)),
+    )
@@ -0,0 +1,63 @@
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+from protencode.utils.intermediate_store import find_frame, read_frame
+
+class SampleMapping(NamedTuple):
+    """
+    Normalised sample-to-sequence mapping written by sequence preparation.
+
+    samples   : 'sample_code', 'sample_id'
+    sequences : 'sequence_code', 'sequence_id', 'geneName', 'variant' (row i = line i of sequences.txt
+                = row i of the embedding matrices)
+    long      : 'sample_code', 'sequence_code' for mutant sequences only; a sample carries the
+                wildtype of every gene it has no pair for.
+    """
+    samples: pd.DataFrame
+    sequences: pd.DataFrame
+    long: pd.DataFrame
+
+def mappingFromJoined(Samples):
+    """
+    Convert a `;`-joined sample2sequences table to a SampleMapping. Sequence codes are the row
+    numbers of `Samples`, so embedding rows stay aligned with the table.
+    """
+    sequences = pd.DataFrame({
+        "sequence_code": np.arange(len(Samples), dtype=np.int32),
+        "sequence_id": Samples["sequence_id"].to_numpy(),
+        "geneName": Samples["geneName"].to_numpy(),
+        "variant": Samples["variant"].to_numpy(),
+    })
+    expanded = pd.DataFrame({
+        "sequence_code": sequences["sequence_code"],
+        "sample_id": Samples["sample_id"].fillna("").str.split(";").to_numpy(),
+    }).explode("sample_id")
+    expanded = expanded[expanded["sample_id"] != ""]
+    sample_codes, sample_ids = pd.factorize(expanded["sample_id"])
+    samples = pd.DataFrame({
+        "sample_code": np.arange(len(sample_ids), dtype=np.int32),
+        "sample_id": np.asarray(sample_ids, dtype=object),
+    })
+    is_mutant = (sequences["variant"] != "WT").to_numpy()[expanded["sequence_code"].to_numpy()]
+    long = pd.DataFrame({
+        "sample_code": sample_codes[is_mutant].astype(np.int32),
+        "sequence_code": expanded["sequence_code"].to_numpy()[is_mutant].astype(np.int32),
+    }).drop_duplicates().reset_index(drop=True)
+    return SampleMapping(samples, sequences, long)
+
+def loadSampleMapping(output_dir):
+    """
+    Load the sample-to-sequence mapping from `output_dir`, preferring the long-format tables and
+    falling back to the `;`-joined sample2sequences table (or its TSV export).
+    """
+    if find_frame(output_dir, "sample2sequence_long") is not None:
+        return SampleMapping(
+            read_frame(output_dir, "samples"),
+            read_frame(output_dir, "sequences", columns=["sequence_code", "sequence_id", "geneName", "variant"]),
+            read_frame(output_dir, "sample2sequence_long"),
+        )
+    if find_frame(output_dir, "sample2sequences", legacy_file="sample2sequences.tsv") is not None:
+        Samples = read_frame(output_dir, "sample2sequences", legacy_file="sample2sequences.tsv", sep="\t")
+        return mappingFromJoined(Samples)
+    raise FileNotFoundError(f"Missing sample2sequence tables in {output_dir}")
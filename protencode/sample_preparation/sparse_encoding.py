@@ -0,0 +1,76 @@
+import os
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+class SparseEncoding(NamedTuple):
+    """
+    Sample x gene encoding matrix in CSR form with its row (sample) and column (gene) labels.
+    """
+    matrix: sp.csr_matrix
+    samples: np.ndarray
+    genes: np.ndarray
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def toDataFrame(self):
+        """
+        Dense DataFrame with a leading 'samples' column, as written by the former CSV encodings.
+        """
+        dense = pd.DataFrame(self.matrix.toarray(), columns=self.genes)
+        dense.insert(0, "samples", self.samples)
+        return dense
+
+def sampleGeneCounts(index, dtype=np.int32):
+    """
+    Count the mutant sequences of every sample in every gene from the shared sample index.
+
+    Only mutant pairs are touched, so time and memory scale with the number of mutations.
+    Rows and columns are sorted by sample ID and gene name.
+
+    Args:
+        index (SampleIndex): The shared sample index.
+        dtype: Data type of the counts (default: int32).
+
+    Returns:
+        SparseEncoding: The count matrix with its labels.
+    """
+    # Duplicate (row, column) entries are summed on conversion to CSR
+    matrix = sp.coo_matrix(
+        (np.ones(len(index.pair_rows), dtype=dtype), (index.pair_rows, index.pair_columns)),
+        shape=(len(index.samples), len(index.genes)),
+    ).tocsr()
+    matrix.sum_duplicates()
+    return SparseEncoding(matrix, index.samples, index.genes)
+
+def saveSparseEncoding(encoding, save_dir, name, export_csv=False):
+    """
+    Save an encoding as `<name>.npz` with `<name>.samples.txt` and `<name>.genes.txt` label sidecars,
+    and optionally as a dense `<name>.csv`.
+
+    Returns:
+        str: Path of the `.npz` file.
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    out_path = os.path.join(save_dir, f"{name}.npz")
+    sp.save_npz(out_path, encoding.matrix)
+    for axis, labels in (("samples", encoding.samples), ("genes", encoding.genes)):
+        with open(os.path.join(save_dir, f"{name}.{axis}.txt"), "w") as f:
+            f.writelines(f"{label}\n" for label in labels)
+    if export_csv:
+        encoding.toDataFrame().to_csv(os.path.join(save_dir, f"{name}.csv"), index=None)
+    return out_path
+
+def loadSparseEncoding(save_dir, name):
+    """
+    Load an encoding saved by `saveSparseEncoding`.
+    """
+    matrix = sp.load_npz(os.path.join(save_dir, f"{name}.npz")).tocsr()
+    labels = {}
+    for axis in ("samples", "genes"):
+        with open(os.path.join(save_dir, f"{name}.{axis}.txt")) as f:
+            labels[axis] = np.array(f.read().splitlines(), dtype=object)
+    return SparseEncoding(matrix, labels["samples"], labels["genes"])
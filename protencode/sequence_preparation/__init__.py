@@ -1,19 +1,23 @@
 from . import variantProcessor
 from . import uniProtFasta
+from . import fastaIndex
 from . import fastaProcessor
 from . import mutationSequenceMerge
 from . import extractVarationInfo
 from . import geneLengthFilter
 from . import mutationGenerator
 from . import downstreamProcess
+from . import sequenceDelta
 
 __all__ = [
     "variantProcessor",
     "uniProtFasta",
+    "fastaIndex",
     "fastaProcessor",
     "mutationSequenceMerge",
     "extractVarationInfo",
     "geneLengthFilter",
     "mutationGenerator",
     "downstreamProcess",
+    "sequenceDelta",
 ]
\ No newline at end of file
@@ -1,7 +1,14 @@
+import os
 import pandas as pd
 import matplotlib.pyplot as plt
+from protencode.utils.intermediate_store import write_frame
 
-def DownstreamReduce(mutseq_mutated, positional_threshold, output_dir):
+def DownstreamReduce(mutseq_mutated, positional_threshold, output_dir, intermediate_format="parquet", export_csv=False,
+                     top_genes=None):
+    """
+    Keep mutations below `positional_threshold` in the `top_genes` most frequently mutated genes
+    (all genes by default), and save the gene count plots to `<output_dir>/logs/gene_counts.png`.
+    """
     early_mutations = mutseq_mutated[mutseq_mutated['pos'] < positional_threshold]
     print(f"{(len(early_mutations)/len(mutseq_mutated))*100:.1f}% mutations retained below positional threshold.")
     gene_counts = early_mutations['geneName'].value_counts()
@@ -29,11 +36,14 @@ def DownstreamReduce(mutseq_mutated, positional_threshold, output_dir):
             axes[1].axvline(x=pos - 0.5, color=colour, linestyle='--', label=f'First {pos} genes: {count}')
     axes[1].legend(loc='upper right')
     plt.tight_layout()
-    plt.show()
-    top_gene_number = input("Please select number of top genes to take forward.")
-    print(f"Returning {top_gene_number} top genes.")
-    top_genes = gene_counts.head(int(top_gene_number)).index.tolist()
-    topearly_mutseq = early_mutations[early_mutations['geneName'].isin(top_genes)]
+    os.makedirs(os.path.join(output_dir, "logs"), exist_ok=True)
+    fig.savefig(os.path.join(output_dir, "logs", "gene_counts.png"))
+    plt.close(fig)
+    if top_genes is None:
+        top_genes = len(gene_counts)
+    print(f"Returning {min(top_genes, len(gene_counts))} top genes.")
+    kept_genes = gene_counts.head(int(top_genes)).index.tolist()
+    topearly_mutseq = early_mutations[early_mutations['geneName'].isin(kept_genes)]
     print(f"Saving to {output_dir}.")
-    topearly_mutseq.to_csv(f"{output_dir}/topearly_mutseq.csv")
+    write_frame(topearly_mutseq, output_dir, "topearly_mutseq", intermediate_format, export_csv)
     return topearly_mutseq
\ No newline at end of file
@@ -1,37 +1,75 @@
 import re
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Three-letter amino acid codes used in HGVS protein notation (e.g. p.Val600Glu).
+THREE_TO_ONE = {
+    'Ala': 'A', 'Arg': 'R', 'Asn': 'N', 'Asp': 'D', 'Cys': 'C',
+    'Gln': 'Q', 'Glu': 'E', 'Gly': 'G', 'His': 'H', 'Ile': 'I',
+    'Leu': 'L', 'Lys': 'K', 'Met': 'M', 'Phe': 'F', 'Pro': 'P',
+    'Ser': 'S', 'Thr': 'T', 'Trp': 'W', 'Tyr': 'Y', 'Val': 'V',
+    'Sec': 'U', 'Pyl': 'O', 'Asx': 'B', 'Glx': 'Z', 'Xle': 'J',
+    'Xaa': 'X', 'Ter': '*',
+}
+
+# One-letter substitutions (p.V600E) or three-letter substitutions (p.Val600Glu, p.Arg213Ter, p.Arg213*).
+VARIANT_PATTERN = re.compile(
+    r"^p\.(?:(?P<wt1>.)(?P<pos1>[0-9]+)(?P<mut1>.)"
+    r"|(?P<wt3>[A-Z][a-z]{2})(?P<pos3>[0-9]+)(?P<mut3>[A-Z][a-z]{2}|\*))$"
+)
+
+def summariseUnmatched(unmatched, variant_column='variant', top=10):
+    """
+    Print a counted summary of variants that did not match the extraction pattern.
+    """
+    variants = unmatched[variant_column]
+    print(f"Non-pattern matching variants removed ({len(unmatched)}), of which {variants.isna().sum()} missing.")
+    if len(unmatched) > variants.isna().sum():
+        counts = variants.value_counts()
+        print(f"{len(counts)} distinct unmatched variants; most frequent:")
+        print(counts.head(top).to_string())
 
 def processVariantParts(df, variant_column='variant'):
     """
     Processes a DataFrame to extract parts of a variant string and merge them back into the original DataFrame.
-    
+
+    Each distinct variant string is parsed once with Arrow's regex kernel and the parts are
+    broadcast back to the rows as typed columns. Both one-letter (p.V600E) and three-letter
+    (p.Val600Glu) substitutions are supported; three-letter residues are converted to one-letter codes.
+
     Args:
         df (pd.DataFrame): Input DataFrame with a column containing variant strings.
         variant_column (str): Name of the column containing the variants (default: 'variant').
-        
+
     Returns:
-        pd.DataFrame: DataFrame with additional columns 'wtAA', 'pos', 'mutAA', and the count of unmatched variants.
+        pd.DataFrame: DataFrame with additional columns 'wtAA' and 'mutAA' (categorical) and 'pos' (int32).
+        pd.DataFrame: The rows whose variant did not match the extraction pattern.
     """
-    def extract_variant_parts(variant):
-        if pd.isna(variant):
-            return None
-        match = re.match(r"^p\.(.)([0-9]+)(.)$", variant)
-        if match:
-            return match.groups()
-        return None
-    df['variant_parts'] = df[variant_column].apply(extract_variant_parts)
-
-    unmatched_variants = df[df['variant_parts'].isna()].reset_index(drop=True)
-    print(f"Non-pattern matching variants removed ({len(unmatched_variants)}):")
-    print(unmatched_variants[variant_column])
-
-    matched_df = df[df['variant_parts'].notna()].reset_index(drop=True)
-
-    change = pd.DataFrame(
-        matched_df['variant_parts'].tolist(), columns=['wtAA', 'pos', 'mutAA']
-    )
-    change['pos'] = pd.to_numeric(change['pos'], errors='coerce').astype('Int64')
-    matched_df = pd.concat([matched_df.drop(columns=['variant_parts']), change], axis=1)
+    # Parse each distinct variant once with Arrow's regex kernel, then broadcast back to the rows
+    codes, uniques = pd.factorize(df[variant_column])
+    parts = pc.extract_regex(pa.array(pd.Index(uniques).astype(str), type=pa.string()), VARIANT_PATTERN.pattern)
+    parts = {name: parts.field(name).to_pandas().replace("", None) for name in VARIANT_PATTERN.groupindex}
+    wt_aa = parts['wt1'].fillna(parts['wt3'].map(THREE_TO_ONE))
+    mut_aa = parts['mut1'].fillna(parts['mut3'].map(THREE_TO_ONE))
+    pos = parts['pos1'].fillna(parts['pos3'])
+    parsed = (wt_aa.notna() & pos.notna() & mut_aa.notna()).to_numpy(dtype=bool)
+    matched = codes >= 0
+    matched[matched] = parsed[codes[matched]]
+
+    unmatched_variants = df[~matched].reset_index(drop=True)
+    summariseUnmatched(unmatched_variants, variant_column)
+
+    matched_codes = codes[matched]
+    wt_cat = pd.Categorical(wt_aa.where(parsed))
+    mut_cat = pd.Categorical(mut_aa.where(parsed))
+    pos_int = np.zeros(len(uniques), dtype=np.int32)
+    pos_int[parsed] = pos[parsed].astype('int32').to_numpy()
+    matched_df = df[matched].reset_index(drop=True)
+    matched_df['wtAA'] = pd.Categorical.from_codes(wt_cat.codes[matched_codes], categories=wt_cat.categories)
+    matched_df['pos'] = pos_int[matched_codes]
+    matched_df['mutAA'] = pd.Categorical.from_codes(mut_cat.codes[matched_codes], categories=mut_cat.categories)
     print(f"Returning extracted variation information merged into dataframe with length {len(matched_df)},")
     print(f"and dataframe of variants which did not match extraction pattern (length: {len(unmatched_variants)})")
-    return matched_df, unmatched_variants
\ No newline at end of file
+    return matched_df, unmatched_variants
@@ -0,0 +1,135 @@
+import mmap
+import os
+import pandas as pd
+from tqdm import tqdm
+
+INDEX_VERSION = "1"
+INDEX_COLUMNS = ["uniprotAccession", "geneName", "reviewed", "offset", "nbytes", "length"]
+
+def defaultIndexPath(fasta_file):
+    """
+    Return the path of the persistent index stored next to a FASTA file.
+    """
+    return f"{fasta_file}.pidx"
+
+def _parseHeader(header):
+    """
+    Split a UniProt FASTA header (bytes, without the leading '>') into accession, gene name and
+    reviewed flag. Mirrors the SwissProt regexes used previously: the accession is the field between
+    the first two '|' and the gene name is the token following ' GN='.
+    """
+    reviewed = header.startswith(b"sp|")
+    first_bar = header.find(b"|")
+    second_bar = header.find(b"|", first_bar + 1)
+    if first_bar == -1 or second_bar == -1:
+        accession = None
+    else:
+        accession = header[first_bar + 1:second_bar].decode("ascii")
+    gene_name = None
+    gn_start = header.find(b" GN=")
+    if gn_start != -1:
+        gn_end = header.find(b" ", gn_start + 4)
+        if gn_end > gn_start + 4:
+            gene_name = header[gn_start + 4:gn_end].decode("ascii")
+    return accession, gene_name, reviewed
+
+def buildFastaIndex(fasta_file, index_file=None, show_progress=True):
+    """
+    Scan a UniProt FASTA file once through mmap and write an accession/gene index of sequence offsets.
+
+    The index is similar to a samtools faidx: for each record it stores the byte offset of the first
+    sequence line, the number of bytes spanned by the sequence lines and the residue count, so that
+    individual sequences can later be read without parsing the rest of the file.
+
+    Args:
+        fasta_file (str): Path to the uncompressed FASTA file.
+        index_file (str): Where to write the index (default: `<fasta_file>.pidx`).
+        show_progress (bool): Whether to show a progress bar over the bytes scanned (default: True).
+
+    Returns:
+        pd.DataFrame: The index with columns 'uniprotAccession', 'geneName', 'reviewed', 'offset',
+        'nbytes' and 'length'.
+    """
+    index_file = index_file or defaultIndexPath(fasta_file)
+    records = {col: [] for col in INDEX_COLUMNS}
+    file_size = os.path.getsize(fasta_file)
+    if file_size:
+        with open(fasta_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pbar = tqdm(total=file_size, unit="B", unit_scale=True, desc="Indexing FASTA", disable=not show_progress)
+            start = 0 if mm[:1] == b">" else mm.find(b"\n>")
+            if start > 0:
+                start += 1
+            while start != -1 and start < file_size:
+                header_end = mm.find(b"\n", start)
+                if header_end == -1:
+                    header_end = file_size
+                next_record = mm.find(b"\n>", header_end)
+                seq_end = file_size if next_record == -1 else next_record + 1
+                seq_start = min(header_end + 1, file_size)
+                nbytes = seq_end - seq_start
+                sequence_bytes = mm[seq_start:seq_end]
+                length = nbytes - sequence_bytes.count(b"\n") - sequence_bytes.count(b"\r")
+                accession, gene_name, reviewed = _parseHeader(mm[start + 1:header_end].rstrip(b"\r"))
+                records["uniprotAccession"].append(accession)
+                records["geneName"].append(gene_name)
+                records["reviewed"].append(reviewed)
+                records["offset"].append(seq_start)
+                records["nbytes"].append(nbytes)
+                records["length"].append(length)
+                pbar.update(seq_end - start)
+                start = seq_end if next_record != -1 else -1
+            pbar.close()
+    index_df = pd.DataFrame(records, columns=INDEX_COLUMNS)
+    stat = os.stat(fasta_file)
+    with open(index_file, "w") as f:
+        f.write(f"#protencode-fasta-index\t{INDEX_VERSION}\t{stat.st_size}\t{stat.st_mtime_ns}\n")
+        index_df.to_csv(f, sep="\t", index=False)
+    return index_df
+
+def _indexIsCurrent(fasta_file, index_file):
+    if not os.path.exists(index_file):
+        return False
+    with open(index_file) as f:
+        fields = f.readline().rstrip("\n").split("\t")
+    stat = os.stat(fasta_file)
+    return fields == ["#protencode-fasta-index", INDEX_VERSION, str(stat.st_size), str(stat.st_mtime_ns)]
+
+def loadFastaIndex(fasta_file, index_file=None, rebuild=False, show_progress=True):
+    """
+    Load the persistent index of a FASTA file, (re)building it if missing or stale.
+
+    Args:
+        fasta_file (str): Path to the uncompressed FASTA file.
+        index_file (str): Path of the index (default: `<fasta_file>.pidx`).
+        rebuild (bool): Force the index to be rebuilt (default: False).
+        show_progress (bool): Whether to show a progress bar when building (default: True).
+
+    Returns:
+        pd.DataFrame: The FASTA index.
+    """
+    index_file = index_file or defaultIndexPath(fasta_file)
+    if rebuild or not _indexIsCurrent(fasta_file, index_file):
+        return buildFastaIndex(fasta_file, index_file, show_progress=show_progress)
+    return pd.read_csv(
+        index_file, sep="\t", skiprows=1, keep_default_na=False, na_values=[""],
+        dtype={"uniprotAccession": str, "geneName": str, "reviewed": bool, "offset": "int64", "nbytes": "int64", "length": "int64"},
+    )
+
+def fetchSequences(fasta_file, index_df):
+    """
+    Read the sequences of the given index rows from a FASTA file through mmap.
+
+    Args:
+        fasta_file (str): Path to the uncompressed FASTA file.
+        index_df (pd.DataFrame): Rows of the index returned by `loadFastaIndex`.
+
+    Returns:
+        list of str: The sequences, in the order of `index_df`.
+    """
+    if os.path.getsize(fasta_file) == 0:
+        return [""] * len(index_df)
+    with open(fasta_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [
+            mm[offset:offset + nbytes].replace(b"\n", b"").replace(b"\r", b"").decode("ascii")
+            for offset, nbytes in zip(index_df["offset"].to_numpy(), index_df["nbytes"].to_numpy())
+        ]
@@ -1,44 +1,38 @@
-from Bio import SeqIO
-import re
-from tqdm import tqdm
 import pandas as pd
+from protencode.sequence_preparation import fastaIndex
+from protencode.utils.intermediate_store import write_frame
 
-def uniprotFastaSwissProtProcessor(fasta_file, output_dir, show_progress=True):
+def uniprotFastaSwissProtProcessor(fasta_file, output_dir, show_progress=True, intermediate_format="parquet", export_csv=False, genes=None, index_file=None):
     """
     Parses a UniProt FASTA file to extract SwissProt entries with gene names and sequences.
-    
+
+    The FASTA is scanned once through mmap to build (or reuse) a persistent accession/gene index
+    stored next to it; only the sequences of the selected entries are then read from disk.
+
     Args:
         fasta_file (str): Path to the FASTA file.
         show_progress (bool): Whether to show a progress bar (default: True).
-        
+        intermediate_format (str): Format of the saved `uniprot_data` table (default: "parquet").
+        export_csv (bool): Additionally export `uniprot_data.csv` (default: False).
+        genes (iterable of str): If given, only load sequences for these gene names, e.g. the genes
+            that are actually mutated (default: None, load every SwissProt entry with a gene name).
+        index_file (str): Path of the FASTA index (default: `<fasta_file>.pidx`).
+
     Returns:
-        tuple: A tuple containing:
-            - uniprot_data (list): A list of dictionaries with 'uniprotAccession', 'geneName', and 'sequence'.
-            - count (int): The total number of SwissProt records.
+        pd.DataFrame: DataFrame with 'uniprotAccession', 'geneName' and 'wildtypeSequence' columns.
     """
-    uniprot_data = []
-    count = 0
-    if show_progress:
-        total_records = sum(1 for _ in SeqIO.parse(fasta_file, "fasta"))
-    with open(fasta_file, "r") as file:
-        iterator = SeqIO.parse(file, "fasta")
-        if show_progress:
-            iterator = tqdm(iterator, total=total_records, desc="Processing records")
-        for record in iterator:
-            header = record.description
-            if header.startswith("sp|"):
-                count += 1
-                uniprot_accession = re.sub(r"^sp\|(.+?)\|.+$", r"\1", header)
-                gene_name_match = re.search(r" GN=(.+?) ", header)
-                gene_name = gene_name_match.group(1) if gene_name_match else None
-                if gene_name is not None:
-                    uniprot_data.append({
-                        'uniprotAccession': uniprot_accession,
-                        'geneName': gene_name,
-                        'wildtypeSequence': str(record.seq)
-                    })
-    uniprot_df = pd.DataFrame(uniprot_data)
-    uniprot_df.to_csv(f"{output_dir}/uniprot_data.csv", index=False)
+    index_df = fastaIndex.loadFastaIndex(fasta_file, index_file=index_file, show_progress=show_progress)
+    swissprot = index_df[index_df["reviewed"].astype(bool)]
+    count = len(swissprot)
+    selected = swissprot[swissprot["geneName"].notna()]
+    if genes is not None:
+        selected = selected[selected["geneName"].isin(pd.Index(genes))]
+    uniprot_df = pd.DataFrame({
+        'uniprotAccession': selected["uniprotAccession"].to_numpy(),
+        'geneName': selected["geneName"].to_numpy(),
+        'wildtypeSequence': fastaIndex.fetchSequences(fasta_file, selected),
+    })
+    write_frame(uniprot_df, output_dir, "uniprot_data", intermediate_format, export_csv)
     print(f"\nThere are {count} SwissProt records.")
-    print(f"Returning dataframe with {len(uniprot_data)} entries (containing both a gene name and a sequence).")
-    return uniprot_df
\ No newline at end of file
+    print(f"Returning dataframe with {len(uniprot_df)} entries (containing both a gene name and a sequence).")
+    return uniprot_df
@@ -1,66 +1,377 @@
+import os
+import shutil
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from protencode.sequence_preparation import sequenceDelta
+from protencode.utils.intermediate_store import write_frame, read_frame
+
+SEQUENCE_COLUMNS = ["sequence_code", "sequence_id", "geneName", "variant", "wt_id", "pos", "mutAA"]
+
+def _toDelta(lengene_mutseq, wildtypes):
+    """
+    Return a delta-encoded view of the mutations, interning full wildtype strings if necessary.
+    """
+    if wildtypes is not None:
+        return lengene_mutseq, wildtypes
+    return sequenceDelta.internWildtypes(lengene_mutseq.drop(columns=["mutantSequence"], errors="ignore"))
 
 def sequence_sample_count(lengene_mutseq):
-    unique_wildtype = lengene_mutseq["wildtypeSequence"].nunique()
-    unique_mutant = lengene_mutseq["mutantSequence"].nunique()
-    number_overall = unique_wildtype + unique_mutant
-    numberoverall = list(range(1, number_overall + 1))
+    if "wt_id" in lengene_mutseq:
+        unique_wildtype = lengene_mutseq["wt_id"].nunique()
+        unique_mutant = len(lengene_mutseq[sequenceDelta.DELTA_COLUMNS].drop_duplicates())
+    else:
+        unique_wildtype = lengene_mutseq["wildtypeSequence"].nunique()
+        unique_mutant = lengene_mutseq["mutantSequence"].nunique()
     unique_samples = lengene_mutseq['sample_id'].unique()
     print("There are {} unique wildtype sequences and {} unique mutant sequences.".format(unique_wildtype, unique_mutant))
     print("There are {} unique samples.".format(len(unique_samples)))
     return unique_samples
 
-def generate_sequence_mappings(output_dir, lengene_mutseq, unique_samples, starting_sequence_count=0):
-    sequence_results = []
-    sample2seq_results = []
-    sequence_count = starting_sequence_count
-    for gene_name in tqdm(lengene_mutseq["geneName"].unique(), desc="Generating sequence mappings"):
-        gene_df = lengene_mutseq[lengene_mutseq["geneName"] == gene_name]
-        # Must have exactly one wildtype sequence
-        if len(gene_df["wildtypeSequence"].unique()) != 1:
-            print(f"⚠️ Warning: Gene {gene_name} skipped (wildtype sequence not unique).")
-            continue
-        WT_sequence = gene_df["wildtypeSequence"].unique()[0]
-        mutant_sequences = gene_df["mutantSequence"].unique()
-        all_sequences = np.insert(mutant_sequences, 0, WT_sequence)
-        # Assign sequence IDs
-        sequence_count_new = sequence_count + len(all_sequences)
-        sequence_ids = list(range(sequence_count + 1, sequence_count_new + 1))
-        sequence_file = pd.DataFrame(all_sequences, columns=["sequence"])
-        sequence_file["sequence_id"] = [
-            f"Seq{sequence_ids[i]}_{gene_name}{j+1}" for i, j in enumerate(range(len(all_sequences)))
-        ]
-        sequence_results.append(sequence_file)
-        # Map sequence → ID
-        sequence_mapping = dict(zip(sequence_file["sequence"], sequence_file["sequence_id"]))
-        # Mutant mapping
-        Sample2Sequence = (
-            gene_df.groupby(["mutantSequence", "geneName", "variant"])["sample_id"]
-            .apply(lambda x: ";".join(x))
-            .reset_index()
-        )
-        Sample2Sequence["sequence_id"] = Sample2Sequence["mutantSequence"].map(sequence_mapping)
-        # Handle missing samples (assign to WT)
-        missing_sample_ids = set(unique_samples) - set(gene_df["sample_id"])
-        missing_samples_one = ";".join(missing_sample_ids)
-        WT_sequence_id = sequence_file.loc[sequence_file["sequence"] == WT_sequence, "sequence_id"].iloc[0]
-        WT_data = {
-            "mutantSequence": WT_sequence,
-            "geneName": gene_name,
-            "variant": ["WT"],
-            "sample_id": missing_samples_one,
-            "sequence_id": WT_sequence_id,
-        }
-        WT_frame = pd.DataFrame(WT_data)
-        # Combine
-        FullFrame = pd.concat([WT_frame, Sample2Sequence], ignore_index=True)
-        sample2seq_results.append(FullFrame)
-        sequence_count = sequence_count_new
-    # Concatenate results across all genes
-    final_sequence_file = pd.concat(sequence_results, ignore_index=True)
-    final_sample2sequence = pd.concat(sample2seq_results, ignore_index=True)
-    final_sequence_file.to_csv(f"{output_dir}/sequences.txt", sep='\t', index=None)
-    final_sample2sequence.to_csv(f"{output_dir}/sample2sequences.tsv", sep='\t', index=None)
-    return final_sequence_file, final_sample2sequence
\ No newline at end of file
+def _mutantKeys(gene_codes, positions, residues):
+    """
+    Pack (gene, position, mutant residue) into one int64 key per row.
+    """
+    return (gene_codes.astype(np.int64) << 40) | (positions.astype(np.int64) << 8) | residues.astype(np.int64)
+
+def build_sequence_table(lengene_mutseq, starting_sequence_count=0):
+    """
+    Assign sequence IDs to the wildtype and mutant sequences of every gene in one grouped pass.
+
+    Genes keep their order of first appearance; within a gene the wildtype comes first, followed by
+    its mutants in order of first appearance, matching the IDs of the former per-gene loop.
+
+    Parameters
+    ----------
+    lengene_mutseq : pd.DataFrame
+        Delta-encoded mutations with 'geneName', 'wt_id', 'pos', 'mutAA' and 'variant' columns.
+    starting_sequence_count : int, default=0
+        Number the sequence IDs start after.
+
+    Returns
+    -------
+    pd.DataFrame
+        The sequence table (columns `SEQUENCE_COLUMNS`).
+    np.ndarray
+        The sequence code of every input row (-1 for rows of skipped genes).
+    """
+    gene_codes, genes = pd.factorize(lengene_mutseq["geneName"])
+    wt_ids = lengene_mutseq["wt_id"].to_numpy()
+    # Must have exactly one wildtype sequence
+    wildtypes_per_gene = pd.Series(wt_ids).groupby(gene_codes).nunique()
+    skipped = wildtypes_per_gene.index[wildtypes_per_gene.to_numpy() != 1]
+    for gene_code in skipped:
+        print(f"⚠️ Warning: Gene {genes[gene_code]} skipped (wildtype sequence not unique).")
+    keep = ~np.isin(gene_codes, skipped)
+    gene_wt = np.full(len(genes), -1, dtype=np.int64)
+    gene_wt[gene_codes[keep]] = wt_ids[keep]
+
+    keys = _mutantKeys(gene_codes, lengene_mutseq["pos"].to_numpy(), sequenceDelta.residueCodes(lengene_mutseq["mutAA"]))
+    first_seen = pd.Series(keys[keep]).drop_duplicates()
+    mutant_keys = first_seen.to_numpy()
+    mutant_rows = np.flatnonzero(keep)[first_seen.index.to_numpy()]
+    # Wildtype entries followed by mutant entries, then ordered by gene (first appearance),
+    # wildtype first and mutants by first appearance
+    kept_genes = np.flatnonzero(gene_wt >= 0)
+    n_wildtypes = len(kept_genes)
+    entry_genes = np.r_[kept_genes, gene_codes[mutant_rows]].astype(np.int64)
+    order = np.lexsort((np.arange(len(entry_genes)), entry_genes))
+    table_genes = entry_genes[order]
+    within_gene = pd.Series(table_genes).groupby(table_genes).cumcount().to_numpy() + 1
+    sequence_numbers = starting_sequence_count + np.arange(1, len(order) + 1)
+    gene_names = np.asarray(genes, dtype=object)[table_genes]
+    entries = pd.DataFrame({
+        "variant": np.r_[np.full(n_wildtypes, "WT", dtype=object), lengene_mutseq["variant"].to_numpy(dtype=object)[mutant_rows]],
+        "pos": np.r_[np.zeros(n_wildtypes, dtype=np.int32), lengene_mutseq["pos"].to_numpy()[mutant_rows]].astype(np.int32),
+        "mutAA": np.r_[np.full(n_wildtypes, None, dtype=object), np.asarray(lengene_mutseq["mutAA"], dtype=object)[mutant_rows]],
+    }).iloc[order]
+    sequences = pd.DataFrame({
+        "sequence_code": np.arange(len(order), dtype=np.int32),
+        "sequence_id": (
+            "Seq" + pd.Series(sequence_numbers).astype(str) + "_"
+            + pd.Series(gene_names, dtype=object) + pd.Series(within_gene).astype(str)
+        ).to_numpy(dtype=object),
+        "geneName": gene_names,
+        "variant": entries["variant"].to_numpy(),
+        "wt_id": gene_wt[table_genes].astype(np.int32),
+        "pos": entries["pos"].to_numpy(),
+        "mutAA": entries["mutAA"].to_numpy(),
+    }, columns=SEQUENCE_COLUMNS)
+    # Sequence code of every input row: its mutant entry's position in the ordered table
+    entry_codes = np.empty(len(order), dtype=np.int32)
+    entry_codes[order] = np.arange(len(order), dtype=np.int32)
+    row_codes = np.full(len(keys), -1, dtype=np.int32)
+    row_codes[keep] = entry_codes[n_wildtypes + pd.Index(mutant_keys).get_indexer(keys[keep])]
+    return sequences, row_codes
+
+def build_sample_mapping(lengene_mutseq, row_codes, unique_samples):
+    """
+    Build the normalised long-format sample-to-sequence mapping.
+
+    Only mutant sequences are listed; a sample carries the wildtype of every gene for which it has no row.
+
+    Returns
+    -------
+    pd.DataFrame
+        The sample table with columns 'sample_code' and 'sample_id'.
+    pd.DataFrame
+        The mapping with int32 columns 'sample_code' and 'sequence_code'.
+    """
+    samples = pd.DataFrame({
+        "sample_code": np.arange(len(unique_samples), dtype=np.int32),
+        "sample_id": np.asarray(unique_samples, dtype=object),
+    })
+    sample_codes = pd.Index(samples["sample_id"]).get_indexer(lengene_mutseq["sample_id"])
+    valid = (row_codes >= 0) & (sample_codes >= 0)
+    long = pd.DataFrame({
+        "sample_code": sample_codes[valid].astype(np.int32),
+        "sequence_code": row_codes[valid].astype(np.int32),
+    }).drop_duplicates().sort_values(["sequence_code", "sample_code"], kind="stable").reset_index(drop=True)
+    return samples, long
+
+def joined_sample_mapping(lengene_mutseq, row_codes, sequences, samples):
+    """
+    Build the former `;`-joined sample2sequences table (one row per sequence and variant, with a wildtype
+    row per gene listing every sample without a mutation in that gene), in sequence order.
+    """
+    valid = row_codes >= 0
+    mutants = (
+        pd.DataFrame({
+            "sequence_code": row_codes[valid],
+            "variant": lengene_mutseq["variant"].to_numpy(dtype=object)[valid],
+            "sample_id": lengene_mutseq["sample_id"].to_numpy(dtype=object)[valid],
+        })
+        .groupby(["sequence_code", "variant"], sort=True)["sample_id"]
+        .agg(";".join)
+        .reset_index()
+    )
+    all_samples = samples["sample_id"].to_numpy(dtype=object)
+    sample_index = pd.Index(all_samples)
+    wildtype_rows = sequences[sequences["pos"] == 0]
+    mutated_by_gene = (
+        pd.DataFrame({
+            "geneName": sequences["geneName"].to_numpy()[row_codes[valid]],
+            "sample_code": sample_index.get_indexer(lengene_mutseq["sample_id"].to_numpy()[valid]),
+        })
+        .groupby("geneName")["sample_code"]
+        .unique()
+    )
+    wildtype_samples = []
+    for gene_name in tqdm(wildtype_rows["geneName"], desc="Joining wildtype samples"):
+        missing = np.ones(len(all_samples), dtype=bool)
+        missing[mutated_by_gene.get(gene_name, [])] = False
+        wildtype_samples.append(";".join(all_samples[missing]))
+    wildtypes = pd.DataFrame({
+        "sequence_code": wildtype_rows["sequence_code"].to_numpy(),
+        "variant": "WT",
+        "sample_id": wildtype_samples,
+    })
+    joined = pd.concat([wildtypes, mutants], ignore_index=True).sort_values("sequence_code", kind="stable")
+    joined = joined.merge(
+        sequences.drop(columns=["variant"]), on="sequence_code", how="left"
+    )
+    return joined[["sequence_code", "wt_id", "pos", "mutAA", "geneName", "variant", "sample_id", "sequence_id"]]
+
+def _writeJoined(output_dir, lengene_mutseq, row_codes, sequences, samples, wildtypes, intermediate_format):
+    final_sample2sequence = joined_sample_mapping(lengene_mutseq, row_codes, sequences, samples)
+    write_frame(final_sample2sequence, output_dir, "sample2sequences", intermediate_format)
+    sequenceDelta.writeMaterialised(
+        final_sample2sequence, wildtypes, f"{output_dir}/sample2sequences.tsv",
+        "mutantSequence", ["mutantSequence", "geneName", "variant", "sample_id", "sequence_id"]
+    )
+    return final_sample2sequence
+
+def generate_sequence_mappings(output_dir, lengene_mutseq, unique_samples, starting_sequence_count=0, intermediate_format="parquet", wildtypes=None, sample2sequence_format="both"):
+    """
+    Assign sequence IDs to the wildtype and mutant sequences of every gene and map samples to them.
+
+    Sequence IDs are assigned in a single grouped pass. Mutants are handled in their delta encoding
+    (wildtype id, position, mutant residue); full sequence strings are only built while the text
+    files are written.
+
+    Outputs (in `output_dir`):
+        - `sequences` table and `sequences.txt` (sequence, sequence_id), one row per sequence code.
+        - `samples` table and `sample2sequence_long` table: integer (sample_code, sequence_code) pairs
+          for mutant sequences only; a sample carries the wildtype of every gene it has no pair for.
+        - optionally the `;`-joined `sample2sequences` table and `sample2sequences.tsv`.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory to write the sequence tables to.
+    lengene_mutseq : pd.DataFrame
+        Filtered mutations, either delta-encoded (with 'wt_id') or with full 'wildtypeSequence' strings.
+    unique_samples : array-like
+        All sample IDs of the cohort.
+    starting_sequence_count : int, default=0
+        Number the sequence IDs start after.
+    intermediate_format : str, default="parquet"
+        Storage format of the tables.
+    wildtypes : pd.DataFrame, optional
+        Interned wildtype table for delta-encoded input.
+    sample2sequence_format : str, default="both"
+        "long" for the normalised mapping only, "joined" for the `;`-joined table only, or "both".
+
+    Returns
+    -------
+    tuple of pd.DataFrame
+        The sequence table and the sample-to-sequence mapping (long format unless
+        `sample2sequence_format` is "joined").
+    """
+    if sample2sequence_format not in ("long", "joined", "both"):
+        raise ValueError(f"Unknown sample2sequence_format '{sample2sequence_format}'.")
+    lengene_mutseq, wildtypes = _toDelta(lengene_mutseq, wildtypes)
+    final_sequence_file, row_codes = build_sequence_table(lengene_mutseq, starting_sequence_count)
+    samples, sample2sequence_long = build_sample_mapping(lengene_mutseq, row_codes, unique_samples)
+    write_frame(final_sequence_file, output_dir, "sequences", intermediate_format)
+    write_frame(wildtypes, output_dir, "wildtypes", intermediate_format)
+    # Text hand-off file read by the embeddings step, materialised chunk by chunk
+    sequenceDelta.writeMaterialised(
+        final_sequence_file, wildtypes, f"{output_dir}/sequences.txt",
+        "sequence", ["sequence", "sequence_id"]
+    )
+    if sample2sequence_format in ("long", "both"):
+        write_frame(samples, output_dir, "samples", intermediate_format)
+        write_frame(sample2sequence_long, output_dir, "sample2sequence_long", intermediate_format)
+    if sample2sequence_format in ("joined", "both"):
+        final_sample2sequence = _writeJoined(output_dir, lengene_mutseq, row_codes, final_sequence_file, samples, wildtypes, intermediate_format)
+        if sample2sequence_format == "joined":
+            return final_sequence_file, final_sample2sequence
+    print(f"Assigned {len(final_sequence_file)} sequence IDs; {len(sample2sequence_long)} sample-mutant pairs.")
+    return final_sequence_file, sample2sequence_long
+
+def _entryKeys(table):
+    # (gene, position, mutant residue) of every sequence table entry; wildtypes have position 0
+    return pd.MultiIndex.from_arrays([
+        table["geneName"].astype(str).to_numpy(),
+        table["pos"].to_numpy(dtype=np.int64),
+        table["mutAA"].fillna("").astype(str).to_numpy(),
+    ])
+
+def append_sequence_mappings(output_dir, lengene_mutseq, wildtypes=None, intermediate_format="parquet", sample2sequence_format="long"):
+    """
+    Merge the mutations of new mutation files into the sequence tables of an existing run.
+
+    Sequence IDs are append-only: every sequence already in `output_dir` keeps its `sequence_code`
+    and `sequence_id`, and new sequences are numbered after the last existing one (within-gene
+    counters continue per gene). New wildtypes and samples are appended likewise, so every
+    existing row of `sequences`, `wildtypes`, `samples` and `sequences.txt` is unchanged.
+    Rows of genes whose wildtype differs from the one already used (e.g. after a UniProt update)
+    are skipped with a warning, as their mutants would not be comparable. As in a full run, a sample
+    keeps one mutation per gene position: new rows at a (sample, gene, position) that is already
+    mapped are dropped, and the existing mutation is kept.
+
+    Outputs (in `output_dir`): the updated tables as in `generate_sequence_mappings`, the new
+    rows appended to `sequences.txt`, and `sequences_delta.txt` with only the new sequences.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory of the existing run.
+    lengene_mutseq : pd.DataFrame
+        Filtered mutations of the new files, delta-encoded against `wildtypes` or with full
+        'wildtypeSequence' strings.
+    wildtypes : pd.DataFrame, optional
+        Interned wildtype table of `lengene_mutseq`.
+    intermediate_format : str, default="parquet"
+        Storage format of the tables.
+    sample2sequence_format : str, default="long"
+        "long", "joined" or "both", as in `generate_sequence_mappings`.
+
+    Returns
+    -------
+    tuple of pd.DataFrame
+        The full sequence table, the long sample-to-sequence mapping and the new sequences.
+    """
+    lengene_mutseq, wildtypes = _toDelta(lengene_mutseq, wildtypes)
+    existing = read_frame(output_dir, "sequences")
+    existing_wildtypes = read_frame(output_dir, "wildtypes")
+    samples = read_frame(output_dir, "samples")
+    sample2sequence_long = read_frame(output_dir, "sample2sequence_long")
+    # ---- Multi-residue mutations: positions already mapped for a sample keep their mutation
+    mapped = existing.iloc[pd.Index(existing["sequence_code"]).get_indexer(sample2sequence_long["sequence_code"])]
+    mapped_keys = pd.MultiIndex.from_arrays([
+        samples["sample_id"].to_numpy(dtype=object)[pd.Index(samples["sample_code"]).get_indexer(sample2sequence_long["sample_code"])],
+        mapped["geneName"].to_numpy(dtype=object),
+        mapped["pos"].to_numpy(dtype=np.int64),
+    ])
+    remapped = pd.MultiIndex.from_arrays([
+        lengene_mutseq["sample_id"].to_numpy(dtype=object),
+        lengene_mutseq["geneName"].to_numpy(dtype=object),
+        lengene_mutseq["pos"].to_numpy(dtype=np.int64),
+    ]).isin(mapped_keys)
+    if remapped.any():
+        print(f"⚠️ Warning: {int(remapped.sum())} mutations skipped (sample already has a mutation at that gene position).")
+        lengene_mutseq = lengene_mutseq[~remapped]
+    # ---- Wildtypes: reuse the ids of known sequences; genes keep the wildtype they were numbered against
+    known = pd.Index(existing_wildtypes["wildtypeSequence"]).get_indexer(wildtypes["wildtypeSequence"])
+    local_wt = pd.Index(wildtypes["wt_id"]).get_indexer(lengene_mutseq["wt_id"])
+    row_wt = existing_wildtypes["wt_id"].to_numpy()[known][local_wt]
+    row_wt[known[local_wt] < 0] = -1
+    gene_wt = existing[existing["pos"] == 0].set_index("geneName")["wt_id"]
+    expected = gene_wt.reindex(lengene_mutseq["geneName"].to_numpy()).to_numpy()
+    conflict = ~np.isnan(expected) & (row_wt != np.nan_to_num(expected, nan=-1))
+    for gene_name in pd.unique(lengene_mutseq["geneName"].to_numpy()[conflict]):
+        print(f"⚠️ Warning: Gene {gene_name} skipped (wildtype differs from the existing run).")
+    lengene_mutseq, local_wt, row_wt = lengene_mutseq[~conflict], local_wt[~conflict], row_wt[~conflict]
+    unseen = np.unique(local_wt[row_wt < 0])
+    next_wt = int(existing_wildtypes["wt_id"].max()) + 1 if len(existing_wildtypes) else 0
+    added_wildtypes = pd.DataFrame({
+        "wt_id": np.arange(next_wt, next_wt + len(unseen), dtype=np.int32),
+        "wildtypeSequence": wildtypes["wildtypeSequence"].to_numpy(dtype=object)[unseen],
+    })
+    row_wt[row_wt < 0] = added_wildtypes["wt_id"].to_numpy()[np.searchsorted(unseen, local_wt[row_wt < 0])]
+    lengene_mutseq = lengene_mutseq.assign(wt_id=row_wt.astype(np.int32))
+    all_wildtypes = pd.concat([existing_wildtypes, added_wildtypes], ignore_index=True)
+    # ---- Sequences: existing entries keep their codes, new ones are appended
+    table, row_codes = build_sequence_table(lengene_mutseq)
+    codes = _entryKeys(existing).get_indexer(_entryKeys(table))
+    is_new = codes < 0
+    new_sequences = table[is_new].copy()
+    codes[is_new] = len(existing) + np.arange(is_new.sum())
+    numbers = existing["sequence_id"].str.extract(r"^Seq(\d+)_", expand=False).astype(float)
+    last_number = int(numbers.max()) if numbers.notna().any() else len(existing)
+    within_gene = (
+        existing["geneName"].value_counts().reindex(new_sequences["geneName"]).fillna(0).to_numpy(dtype=np.int64)
+        + new_sequences.groupby("geneName").cumcount().to_numpy() + 1
+    )
+    new_sequences["sequence_code"] = codes[is_new].astype(np.int32)
+    new_sequences["sequence_id"] = (
+        "Seq" + pd.Series(last_number + np.arange(1, len(new_sequences) + 1)).astype(str) + "_"
+        + new_sequences["geneName"].astype(str).reset_index(drop=True) + pd.Series(within_gene).astype(str)
+    ).to_numpy(dtype=object)
+    final_sequence_file = pd.concat([existing, new_sequences], ignore_index=True)[SEQUENCE_COLUMNS]
+    row_codes = np.where(row_codes >= 0, codes[np.maximum(row_codes, 0)], -1)
+    # ---- Samples and the long mapping
+    new_ids = pd.unique(lengene_mutseq["sample_id"].to_numpy())
+    new_ids = new_ids[pd.Index(samples["sample_id"]).get_indexer(new_ids) < 0]
+    samples = pd.concat([samples, pd.DataFrame({
+        "sample_code": np.arange(len(samples), len(samples) + len(new_ids), dtype=np.int32),
+        "sample_id": np.asarray(new_ids, dtype=object),
+    })], ignore_index=True)
+    _, added_pairs = build_sample_mapping(lengene_mutseq, row_codes, samples["sample_id"])
+    sample2sequence_long = (
+        pd.concat([sample2sequence_long, added_pairs], ignore_index=True).drop_duplicates()
+        .sort_values(["sequence_code", "sample_code"], kind="stable").reset_index(drop=True)
+    )
+    write_frame(final_sequence_file, output_dir, "sequences", intermediate_format)
+    write_frame(all_wildtypes, output_dir, "wildtypes", intermediate_format)
+    write_frame(samples, output_dir, "samples", intermediate_format)
+    write_frame(sample2sequence_long, output_dir, "sample2sequence_long", intermediate_format)
+    # Existing lines of sequences.txt are kept as they are; the copy is swapped in once complete
+    sequences_txt = os.path.join(output_dir, "sequences.txt")
+    shutil.copyfile(sequences_txt, f"{sequences_txt}.tmp")
+    sequenceDelta.writeMaterialised(new_sequences, all_wildtypes, f"{sequences_txt}.tmp", "sequence", ["sequence", "sequence_id"], append=True)
+    os.replace(f"{sequences_txt}.tmp", sequences_txt)
+    sequenceDelta.writeMaterialised(
+        new_sequences, all_wildtypes, os.path.join(output_dir, "sequences_delta.txt"), "sequence", ["sequence", "sequence_id"]
+    )
+    if sample2sequence_format in ("joined", "both"):
+        # The joined table is rebuilt from the whole cohort's long mapping
+        pairs = pd.DataFrame({
+            "sample_id": samples["sample_id"].to_numpy(dtype=object)[sample2sequence_long["sample_code"]],
+            "variant": final_sequence_file["variant"].to_numpy(dtype=object)[sample2sequence_long["sequence_code"]],
+        })
+        _writeJoined(output_dir, pairs, sample2sequence_long["sequence_code"].to_numpy(), final_sequence_file, samples, all_wildtypes, intermediate_format)
+    print(f"Appended {len(new_sequences)} new sequence IDs ({len(final_sequence_file)} in total); {len(added_pairs)} new sample-mutant pairs.")
+    return final_sequence_file, sample2sequence_long, new_sequences
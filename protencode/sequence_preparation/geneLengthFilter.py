@@ -1,13 +1,15 @@
 import pandas as pd
 
-def filterGenesLength(mutseq_variantextract, wildtype_col='wildtypeSequence', max_width=5000):
+def filterGenesLength(mutseq_variantextract, wildtype_col='wildtypeSequence', max_width=5000, min_length=None):
     """
-    Filters the dataset to include only genes with protein lengths less than the given threshold.
+    Filters the dataset to include only genes with protein lengths less than the given threshold
+    (and, with `min_length`, at least that long).
     
     Args:
         mutseq_variantextract (pd.DataFrame): Input DataFrame containing mutation and protein data.
         wildtype_col (str): Column name containing the wildtype sequence. Default is 'wildtypeSequence'.
         max_width (int): Maximum allowable protein width for filtering. Default is 5000.
+        min_length (int, optional): Minimum protein length kept. Default is None (no minimum).
     
     Returns:
         pd.DataFrame: Filtered DataFrame containing only rows with genes meeting the criteria.
@@ -15,10 +17,13 @@ def filterGenesLength(mutseq_variantextract, wildtype_col='wildtypeSequence', ma
     mutseq_variantextract = mutseq_variantextract.copy()
     mutseq_variantextract.loc[:, 'width'] = mutseq_variantextract[wildtype_col].str.len()
     total_records = len(mutseq_variantextract)
-    filtered_data = mutseq_variantextract[
-        mutseq_variantextract['width'] < max_width
-    ]
-    excluded_records_count = total_records - len(filtered_data)
-    print(f"Returning dataframe with {total_records} records.")
+    keep = mutseq_variantextract['width'] < max_width
+    if min_length is not None:
+        short = mutseq_variantextract['width'] < min_length
+        print(f"Excluded records with width < {min_length}: {int(short.sum())}")
+        keep &= ~short
+    filtered_data = mutseq_variantextract[keep]
+    excluded_records_count = int((mutseq_variantextract['width'] >= max_width).sum())
+    print(f"Returning dataframe with {len(filtered_data)} of {total_records} records.")
     print(f"Excluded records with width >= {max_width}: {excluded_records_count}")
     return filtered_data
\ No newline at end of file
@@ -1,11 +1,17 @@
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from protencode.sequence_preparation.sequenceDelta import groupBoundaries, internWildtypes, residueCodes
+from protencode.utils.intermediate_store import write_frame
+
+VALIDATION_ERROR_COLUMNS = ['sample_id', 'geneName', 'pos', 'expected', 'found']
 
 def generateMutatedSequence(row, log_file, error_counter):
     """
     Generate the mutated protein sequence for a given row with validation.
     Logs validation errors to a file if mismatches occur and increments an error counter.
-    
+    Single-row form of `generateMutatedSequencesBatch`, which the pipeline uses.
+
     Args:
         row (pd.Series): A row from the DataFrame containing mutation details.
         log_file (str): Path to the log file for recording validation errors.
@@ -14,41 +20,132 @@ def generateMutatedSequence(row, log_file, error_counter):
     Returns:
         str: The mutated protein sequence if validation passes, or None if it fails.
     """
-    sequence = list(row['wildtypeSequence'])
-    position = row['pos'] - 1
-    if position >= len(sequence) or sequence[position] != row['wtAA']:
-        with open(log_file, "a") as log:
-            log.write(f"Validation Error for sample {row['sample_id']}:\n")
-            log.write(f"  Position: {row['pos']}\n")
-            log.write(f"  Expected wtAA: '{row['wtAA']}'\n")
-            log.write(f"  Found: '{sequence[position] if position < len(sequence) else 'Out of bounds'}'\n")
-            log.write(f"  Wildtype Sequence: {row['wildtypeSequence']}\n")
-            log.write("-" * 50 + "\n")
-        error_counter['count'] += 1
-        return None
-    sequence[position] = row['mutAA']
-    return ''.join(sequence)
-
-def processMutationsProgress(df, log_file, output_dir):
+    valid, mutants, errors = generateMutatedSequencesBatch(pd.DataFrame([row]), show_progress=False)
+    if valid[0]:
+        return mutants[0]
+    with open(log_file, "a") as log:
+        log.write(f"Validation Error for sample {row['sample_id']}:\n")
+        log.write(f"  Position: {row['pos']}\n")
+        log.write(f"  Expected wtAA: '{row['wtAA']}'\n")
+        log.write(f"  Found: '{errors['found'].iloc[0]}'\n")
+        log.write(f"  Wildtype Sequence: {row['wildtypeSequence']}\n")
+        log.write("-" * 50 + "\n")
+    error_counter['count'] += 1
+    return None
+
+def generateMutatedSequencesBatch(df, wildtype_col='wildtypeSequence', materialise=True, block_bytes=64 * 1024 * 1024, show_progress=True):
+    """
+    Validate and apply all substitutions in a DataFrame, one wildtype sequence at a time.
+
+    Rows are grouped by wildtype sequence; the reference residues of a whole group are checked at once
+    against a NumPy uint8 view of the sequence, and mutants are built by copying the wildtype bytes
+    into a (rows x length) buffer and writing the substituted residues in a single scatter.
+
+    Args:
+        df (pd.DataFrame): DataFrame with wildtype sequence, 'pos', 'wtAA' and 'mutAA' columns.
+        wildtype_col (str): Column name containing the wildtype sequence (default: 'wildtypeSequence').
+        materialise (bool): Build the mutant sequence strings; if False only validation is run (default: True).
+        block_bytes (int): Upper bound on the size of the mutant buffer built at once (default: 64 MiB).
+        show_progress (bool): Whether to show a progress bar over wildtype groups (default: True).
+
+    Returns:
+        np.ndarray: Boolean mask of rows that passed validation.
+        np.ndarray: Object array of mutant sequences (None for failed rows), or None if not materialised.
+        pd.DataFrame: One row per validation error with columns 'sample_id', 'geneName', 'pos', 'expected', 'found'.
+    """
+    n_rows = len(df)
+    codes, wildtypes = pd.factorize(df[wildtype_col])
+    positions = df['pos'].to_numpy(dtype=np.int64) - 1
+    expected = residueCodes(df['wtAA'])
+    substituted = residueCodes(df['mutAA'])
+    valid = np.zeros(n_rows, dtype=bool)
+    found = np.zeros(n_rows, dtype=np.uint8)
+    mutants = np.full(n_rows, None, dtype=object) if materialise else None
+    order, starts, ends = groupBoundaries(codes)
+    for start, end in tqdm(zip(starts, ends), total=len(starts), desc="Processing sequences", disable=not show_progress):
+        rows = order[start:end]
+        if codes[rows[0]] < 0:
+            continue
+        wildtype = wildtypes[codes[rows[0]]].encode('ascii')
+        sequence = np.frombuffer(wildtype, dtype=np.uint8)
+        length = len(sequence)
+        group_positions = positions[rows]
+        in_bounds = (group_positions >= 0) & (group_positions < length)
+        group_found = sequence[np.clip(group_positions, 0, max(length - 1, 0))] if length else np.zeros(len(rows), dtype=np.uint8)
+        group_valid = in_bounds & (group_found == expected[rows])
+        found[rows] = np.where(in_bounds, group_found, 0)
+        valid[rows] = group_valid
+        if not materialise or length == 0:
+            continue
+        ok_rows = rows[group_valid]
+        rows_per_block = max(1, block_bytes // length)
+        for block_start in range(0, len(ok_rows), rows_per_block):
+            block = ok_rows[block_start:block_start + rows_per_block]
+            buffer = np.empty((len(block), length), dtype=np.uint8)
+            buffer[:] = sequence
+            buffer[np.arange(len(block)), positions[block]] = substituted[block]
+            mutants[block] = [mutant.decode('ascii') for mutant in buffer.view(f'S{length}').ravel().tolist()]
+    invalid = ~valid
+    found_residues = np.array([chr(code) if code else 'Out of bounds' for code in range(256)], dtype=object)
+    errors = pd.DataFrame({
+        'sample_id': df['sample_id'].to_numpy()[invalid] if 'sample_id' in df else None,
+        'geneName': df['geneName'].to_numpy()[invalid] if 'geneName' in df else None,
+        'pos': df['pos'].to_numpy()[invalid],
+        'expected': np.asarray(df['wtAA'], dtype=object)[invalid],
+        'found': found_residues[found[invalid]],
+    }, columns=VALIDATION_ERROR_COLUMNS)
+    return valid, mutants, errors
+
+def processMutationsProgress(df, log_file, output_dir, intermediate_format="parquet", export_csv=False):
     """
     Process all rows in the DataFrame to generate mutated sequences.
-    Uses tqdm for a progress bar, logs validation errors to a file, and returns only valid rows.
-    
+    Uses tqdm for a progress bar, writes validation errors to a file in a single write, and returns only valid rows.
+
     Args:
         df (pd.DataFrame): The DataFrame containing mutation data.
-        log_file (str): Path to the log file for validation errors.
-    
+        log_file (str): Path to the log file for validation errors, written as a tab-separated table
+            with columns 'sample_id', 'geneName', 'pos', 'expected' and 'found'.
+        output_dir (str): Directory where the `mutationsequence` table is saved.
+        intermediate_format (str): Format of the saved table (default: "parquet").
+        export_csv (bool): Additionally export `mutationsequence.csv` (default: False).
+
     Returns:
         pd.DataFrame: Updated DataFrame with a new 'mutantSequence' column, excluding rows with errors.
     """
-    error_counter = {'count': 0}
-    tqdm.pandas(desc="Processing sequences")
-    df['mutantSequence'] = df.progress_apply(
-        lambda row: generateMutatedSequence(row, log_file, error_counter), axis=1
-    )
-    print(f"\nTotal validation errors: {error_counter['count']}")
-    valid_df = df[df['mutantSequence'].notnull()].reset_index(drop=True)
+    valid, mutants, errors = generateMutatedSequencesBatch(df)
+    df['mutantSequence'] = mutants
+    errors.to_csv(log_file, sep='\t', index=False)
+    print(f"\nTotal validation errors: {len(errors)}")
+    valid_df = df[valid].reset_index(drop=True)
     print(f"Saving processed files to {output_dir}. Error log at {log_file}.")
-    valid_df.to_csv(f"{output_dir}/mutationsequence.csv", index=False)
+    write_frame(valid_df, output_dir, "mutationsequence", intermediate_format, export_csv)
     print(f"Returning processed dataframe with {len(valid_df)} entries.")
-    return valid_df
\ No newline at end of file
+    return valid_df
+
+def processMutationsDelta(df, log_file, output_dir, intermediate_format="parquet", export_csv=False):
+    """
+    Validate all mutations and keep them delta-encoded instead of materialising mutant sequences.
+
+    Each valid mutation is stored as (wildtype id, position, mutant residue) against an interned table
+    of wildtype sequences; full strings are only built by consumers that need them (see `sequenceDelta`).
+
+    Args:
+        df (pd.DataFrame): The DataFrame containing mutation data.
+        log_file (str): Path to the log file for validation errors (tab-separated table).
+        output_dir (str): Directory where the `mutationsequence` and `wildtypes` tables are saved.
+        intermediate_format (str): Format of the saved tables (default: "parquet").
+        export_csv (bool): Additionally export the tables as CSV (default: False).
+
+    Returns:
+        pd.DataFrame: Valid rows with a 'wt_id' column in place of 'wildtypeSequence'.
+        pd.DataFrame: The interned wildtype table with columns 'wt_id' and 'wildtypeSequence'.
+    """
+    valid, _, errors = generateMutatedSequencesBatch(df, materialise=False)
+    errors.to_csv(log_file, sep='\t', index=False)
+    print(f"\nTotal validation errors: {len(errors)}")
+    delta_df, wildtypes = internWildtypes(df[valid].reset_index(drop=True))
+    print(f"Saving processed files to {output_dir}. Error log at {log_file}.")
+    write_frame(delta_df, output_dir, "mutationsequence", intermediate_format, export_csv)
+    write_frame(wildtypes, output_dir, "wildtypes", intermediate_format, export_csv)
+    print(f"Returning {len(delta_df)} delta-encoded mutations against {len(wildtypes)} wildtype sequences.")
+    return delta_df, wildtypes
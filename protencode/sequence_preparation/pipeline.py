@@ -1,18 +1,193 @@
 import os
-import pandas as pd
-from tqdm import tqdm
+import sys
+import json
+from functools import partial
 
 from protencode.sequence_preparation import (
     variantProcessor,
     uniProtFasta,
     fastaProcessor,
+    fastaIndex,
     mutationSequenceMerge,
     extractVarationInfo,
     geneLengthFilter,
     mutationGenerator,
+    sequenceDelta,
     downstreamProcess,
     finalise_sequences,
 )
+from protencode.utils.stage_cache import Stage, run_stages, file_fingerprint
+from protencode.utils.intermediate_store import read_frame
+from protencode.utils.profiling import profile_stage
+
+SEQUENCE_STAGES = (
+    "mutations", "uniprot", "fasta", "merge", "variants", "length_filter", "dedupe", "mutants", "downstream", "mappings",
+)
+
+def _mutationsStage(data_dir, file_list, fingerprints, output_dir, **settings):
+    # DepMap/CCLE CSV and MAF files can be mixed; each is read with its extension's columns
+    return variantProcessor.multiProcessVariantFiles(
+        data_dir,
+        file_list,
+        output_dir,
+        file_layouts={name: variantProcessor.variantFileLayout(name) for name in file_list},
+        **settings,
+    )
+
+class UniprotDownloadError(RuntimeError):
+    """
+    The UniProt FASTA could not be downloaded (raised by the uniprot stage only).
+    """
+
+def _uniprotStage(**params):
+    try:
+        fasta_file = uniProtFasta.downloadUniprotFasta(verbose=True, **params)
+    except RuntimeError as e:
+        raise UniprotDownloadError(str(e)) from e
+    print(f"[INFO] UniProt FASTA: {fasta_file}")
+    return fasta_file
+
+def _fastaStage(fasta_file, all_mutations, output_dir, **settings):
+    # Only sequences of mutated genes are read; the FASTA index is reused across runs
+    return fastaProcessor.uniprotFastaSwissProtProcessor(
+        fasta_file, output_dir, genes=all_mutations["geneName"].unique(), **settings
+    )
+
+def _dropMultiResidues(mutseq_widthfilt):
+    return (
+        mutseq_widthfilt.sort_values(
+            by=["geneName", "sample_id", "uniprotAccession", "pos", "mutAA"]
+        )
+        .drop_duplicates(subset=["geneName", "sample_id", "uniprotAccession", "pos"])
+    )
+
+def _mutantsStage(mutseq_dropmultires, output_dir, **settings):
+    log_file = os.path.join(output_dir, "logs", "mutation_generator.log")
+    return mutationGenerator.processMutationsDelta(mutseq_dropmultires, log_file, output_dir, **settings)
+
+def _mappingsStage(lengene_mutseq, mutants, output_dir, sample2sequence_format, intermediate_format):
+    unique_samples = finalise_sequences.sequence_sample_count(lengene_mutseq)
+    return finalise_sequences.generate_sequence_mappings(
+        output_dir, lengene_mutseq, unique_samples, starting_sequence_count=0,
+        intermediate_format=intermediate_format, wildtypes=mutants[1],
+        sample2sequence_format=sample2sequence_format,
+    )
+
+def mutationFiles(data_dir):
+    return sorted(f for f in os.listdir(data_dir) if variantProcessor.variantFileLayout(f) is not None)
+
+def _cohortPath(output_dir):
+    return os.path.join(output_dir, "cohort.json")
+
+def readCohort(output_dir):
+    """
+    The cohort manifest of a run directory (merged mutation files and update history), or None.
+    """
+    if not os.path.exists(_cohortPath(output_dir)):
+        return None
+    with open(_cohortPath(output_dir)) as f:
+        return json.load(f)
+
+def _writeCohort(output_dir, cohort):
+    tmp = f"{_cohortPath(output_dir)}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(cohort, f, indent=2)
+    os.replace(tmp, _cohortPath(output_dir))
+
+def _recordUpdate(cohort, data_dir, files, first_sequence_code, new_sequences):
+    for name in files:
+        cohort["files"][name] = file_fingerprint(os.path.join(data_dir, name))[1:]
+    cohort["updates"].append(
+        {"files": list(files), "first_sequence_code": int(first_sequence_code), "new_sequences": int(new_sequences)}
+    )
+    return cohort
+
+def _newMutationFiles(data_dir, cohort):
+    # Merged files must be unchanged: their sequences are already numbered
+    new_files = []
+    for name in mutationFiles(data_dir):
+        if name not in cohort["files"]:
+            new_files.append(name)
+        elif file_fingerprint(os.path.join(data_dir, name))[1:] != cohort["files"][name]:
+            raise ValueError(
+                f"Mutation file {name} changed since it was merged; rerun without incremental mode to renumber the cohort"
+            )
+    return new_files
+
+def sequenceStages(
+    data_dir, output_dir, organism_id="9606", contact_email="", update=False, uniprot_cache=None, min_length=200,
+    top_genes=None, n_workers=1, chunksize=None, intermediate_format="parquet", export_csv=False,
+    sample2sequences_tsv=False, files=None,
+):
+    """
+    The sequence preparation DAG (see `run_sequence_preparation` for the parameters); `files`
+    restricts it to some of the mutation files in `data_dir`.
+
+    Each stage's cache key covers the parameters that change its output (mutation files by path,
+    size and modification time); settings that only affect speed or side files, such as
+    `n_workers` and `export_csv`, are not part of it.
+    """
+    maf_files = sorted(files if files is not None else mutationFiles(data_dir))
+    store = dict(intermediate_format=intermediate_format, export_csv=export_csv)
+    return [
+        # 1. Collect mutation data
+        Stage(
+            "mutations", partial(_mutationsStage, n_workers=n_workers, chunksize=chunksize, **store),
+            params=dict(data_dir=data_dir, file_list=maf_files, output_dir=output_dir,
+                        fingerprints=[file_fingerprint(os.path.join(data_dir, f)) for f in maf_files]),
+            code=(variantProcessor,),
+        ),
+        # 2. Download (or reuse) the UniProt FASTA; downstream keys follow the FASTA file itself
+        Stage(
+            "uniprot", _uniprotStage,
+            params=dict(organism_id=organism_id, output_dir=output_dir, contact_email=contact_email,
+                        update=update, cache_dir=uniprot_cache),
+            code=(uniProtFasta,), always_run=True,
+            resolve=None if update else partial(uniProtFasta.cachedUniprotFasta, organism_id, output_dir, uniprot_cache),
+        ),
+        # 3. Parse the FASTA for the mutated genes
+        Stage(
+            "fasta", partial(_fastaStage, **store), inputs=("uniprot", "mutations"),
+            params=dict(output_dir=output_dir), code=(fastaProcessor, fastaIndex),
+        ),
+        # 4. Merge mutation data with UniProt
+        Stage("merge", mutationSequenceMerge.mergeReport, inputs=("mutations", "fasta")),
+        # 5. Extract variant info (the variant table and the unmatched variants)
+        Stage(
+            "variants", extractVarationInfo.processVariantParts, inputs=("merge",),
+            params=dict(variant_column="variant"),
+        ),
+        # 6. Apply gene length filter
+        Stage(
+            "length_filter", lambda variants, min_length: geneLengthFilter.filterGenesLength(variants[0], min_length=min_length),
+            inputs=("variants",), params=dict(min_length=min_length), code=(geneLengthFilter,),
+        ),
+        # 7. Drop multi-residues duplicates
+        Stage("dedupe", _dropMultiResidues, inputs=("length_filter",), code=(sys.modules[__name__],)),
+        # 8. Validate mutations and keep mutants delta-encoded against interned wildtypes
+        Stage(
+            "mutants", partial(_mutantsStage, **store), inputs=("dedupe",),
+            params=dict(output_dir=output_dir), code=(mutationGenerator, sequenceDelta),
+        ),
+        # 9. Downstream filtering
+        Stage(
+            "downstream",
+            lambda mutants, positional_threshold, top_genes, output_dir: downstreamProcess.DownstreamReduce(
+                mutants[0], positional_threshold, output_dir, top_genes=top_genes, **store
+            ),
+            inputs=("mutants",), params=dict(positional_threshold=800, top_genes=top_genes, output_dir=output_dir),
+            code=(downstreamProcess,),
+        ),
+        # 10. Final sequence mappings
+        Stage(
+            "mappings", _mappingsStage, inputs=("downstream", "mutants"),
+            params=dict(output_dir=output_dir, intermediate_format=intermediate_format,
+                        sample2sequence_format="both" if sample2sequences_tsv else "long"),
+            code=(finalise_sequences, sequenceDelta),
+            files=(os.path.join(output_dir, "sequences.txt"),),
+        ),
+    ]
+
 
 def run_sequence_preparation(
     data_dir: str,
@@ -20,15 +195,39 @@ def run_sequence_preparation(
     organism_id: str = "9606",
     contact_email: str = "",
     update: bool = False,
+    uniprot_cache: str = None,
     min_length: int = 200,
+    n_workers: int = 1,
+    chunksize: int = None,
+    intermediate_format: str = "parquet",
+    export_csv: bool = False,
+    sample2sequences_tsv: bool = False,
+    top_genes: int = None,
+    from_stage: str = None,
+    until_stage: str = None,
+    dry_run: bool = False,
+    stage_cache: str = None,
+    use_stage_cache: bool = True,
+    incremental: bool = False,
 ):
     """
-    Run the sequence preparation pipeline.
+    Run the sequence preparation pipeline as a DAG of named stages (`SEQUENCE_STAGES`).
+
+    Every stage's output is cached under a key hashed from its inputs, parameters and code, and a
+    stage whose key is already cached is skipped (its output is only loaded if a later stage
+    has to run), so changing e.g. `min_length` only reruns the stages from the length filter on.
+
+    With `incremental`, mutation files not yet merged into `output_dir` (per its `cohort.json`) are
+    run through the stages on their own, in `<output_dir>/updates/<n>`, and their sequences are
+    appended by `finalise_sequences.append_sequence_mappings`: existing sequence IDs stay fixed
+    and `sequences_delta.txt` lists the new sequences to embed. New mutations at a position already
+    mapped for the same sample are dropped, keeping the existing one. A full run renumbers all sequences.
 
     Parameters
     ----------
     data_dir : str
-        Directory containing MAF/CSV files with mutation data.
+        Directory containing mutation files: DepMap/CCLE `.csv` and tab-separated `.maf` files
+        (also compressed, e.g. `.maf.gz`), see `variantProcessor.VARIANT_FILE_LAYOUTS`.
     output_dir : str
         Directory to write processed files.
     organism_id : str, default="9606"
@@ -36,68 +235,102 @@ def run_sequence_preparation(
     contact_email : str, optional
         Email address required for UniProt downloads.
     update : bool, default=False
-        Force UniProt FASTA re-download.
+        Check UniProt for a newer release and download it if it is not cached.
+    uniprot_cache : str, optional
+        Shared UniProt download cache (default: `<output_dir>/uniprot_cache`).
     min_length : int, default=200
         Minimum gene length filter.
+    n_workers : int, default=1
+        Number of processes used to parse mutation files (and byte ranges of large files).
+    chunksize : int, optional
+        Stream mutation files in chunks of this many rows to bound peak memory.
+    intermediate_format : str, default="parquet"
+        Storage format for intermediate tables ("parquet", "arrow" or "csv").
+    export_csv : bool, default=False
+        Additionally export every intermediate table as CSV.
+    sample2sequences_tsv : bool, default=False
+        Also write the `;`-joined sample2sequences table and TSV next to the long-format mapping.
+    top_genes : int, optional
+        Keep only the most frequently mutated genes (default: all genes).
+    from_stage : str, optional
+        Recompute this stage and all later ones even if cached.
+    until_stage : str, optional
+        Stop after this stage.
+    dry_run : bool, default=False
+        Only print which stages would be recomputed.
+    stage_cache : str, optional
+        Stage cache directory (default: `<output_dir>/stage_cache`).
+    use_stage_cache : bool, default=True
+        Read and write the stage cache; otherwise every stage runs.
+    incremental : bool, default=False
+        Only merge new mutation files into an existing run (a full run if there is none yet).
     """
     os.makedirs(output_dir, exist_ok=True)
     os.makedirs(os.path.join(output_dir, "logs"), exist_ok=True)
-    # 1. Collect mutation data
-    maf_files = [f for f in os.listdir(data_dir) if f.endswith(".csv")]
-    all_mutations = variantProcessor.multiProcessVariantFiles(
-        data_dir,
-        maf_files,
-        output_dir,
-        columns_to_keep=["DepMap_ID", "Hugo_Symbol", "Protein_Change"],
-        column_mappings={
-            "DepMap_ID": "sample_id",
-            "Hugo_Symbol": "geneName",
-            "Protein_Change": "variant",
-        },
-        separator=",",
+    stage_cache = stage_cache or os.path.join(output_dir, "stage_cache")
+    cohort = readCohort(output_dir)
+    if incremental and cohort is not None:
+        return _runIncremental(
+            data_dir, output_dir, cohort, organism_id, contact_email, update, uniprot_cache, min_length, top_genes,
+            n_workers, chunksize, intermediate_format, export_csv, sample2sequences_tsv,
+            from_stage, until_stage, dry_run, stage_cache, use_stage_cache,
+        )
+    stages = sequenceStages(
+        data_dir, output_dir, organism_id, contact_email, update, uniprot_cache, min_length, top_genes,
+        n_workers, chunksize, intermediate_format, export_csv, sample2sequences_tsv,
     )
-    # 2. Download and parse UniProt FASTA
     try:
-        result = uniProtFasta.downloadUniprotFasta(
-            organism_id, output_dir, contact_email, update, verbose=True
+        results = run_stages(
+            stages, stage_cache, from_stage=from_stage,
+            until_stage=until_stage, dry_run=dry_run, use_cache=use_stage_cache,
         )
-        print(f"[INFO] UniProt FASTA download result: {result}")
-    except RuntimeError as e:
+    except UniprotDownloadError as e:
         print(f"[ERROR] UniProt download failed: {e}")
         return
-    fasta_file = os.path.join(output_dir, f"{organism_id}.fasta")
-    uniprot_data = fastaProcessor.uniprotFastaSwissProtProcessor(fasta_file, output_dir)
-    # 3. Merge mutation data with UniProt
-    all_mutations = pd.read_csv(os.path.join(output_dir, "all_mutations.csv"))
-    uniprot_data = pd.read_csv(os.path.join(output_dir, "uniprot_data.csv"))
-    mut_seq_merge = mutationSequenceMerge.mergeReport(all_mutations, uniprot_data)
-    # 4. Extract variant info
-    mutseq_variantextract, unmatched_variants = extractVarationInfo.processVariantParts(
-        mut_seq_merge, variant_column="variant"
-    )
-    # 5. Apply gene length filter
-    mutseq_widthfilt = geneLengthFilter.filterGenesLength(
-        mutseq_variantextract, min_length=min_length
+    if dry_run:
+        return results
+    if until_stage in (None, "mappings"):
+        n_sequences = len(read_frame(output_dir, "sequences", columns=["sequence_code"]))
+        _writeCohort(output_dir, _recordUpdate({"files": {}, "updates": []}, data_dir, mutationFiles(data_dir), 0, n_sequences))
+    print("[INFO] Sequence preparation pipeline complete ✅")
+
+def _runIncremental(
+    data_dir, output_dir, cohort, organism_id, contact_email, update, uniprot_cache, min_length, top_genes,
+    n_workers, chunksize, intermediate_format, export_csv, sample2sequences_tsv,
+    from_stage, until_stage, dry_run, stage_cache, use_stage_cache,
+):
+    if top_genes is not None:
+        raise ValueError("top_genes selects genes across the whole cohort and cannot be applied incrementally")
+    if until_stage == "mappings":
+        until_stage = None
+    new_files = _newMutationFiles(data_dir, cohort)
+    if not new_files:
+        print(f"[INFO] No new mutation files in {data_dir}; {output_dir} is up to date.")
+        return {} if dry_run else None
+    print(f"[INFO] Merging {len(new_files)} new mutation files: {', '.join(new_files)}")
+    update_dir = os.path.join(output_dir, "updates", f"{len(cohort['updates']):04d}")
+    os.makedirs(os.path.join(update_dir, "logs"), exist_ok=True)
+    stages = sequenceStages(
+        data_dir, update_dir, organism_id, contact_email, update, uniprot_cache or os.path.join(output_dir, "uniprot_cache"),
+        min_length, None, n_workers, chunksize, intermediate_format, export_csv, sample2sequences_tsv, files=new_files,
     )
-    # 6. Drop multi-residues duplicates
-    mutseq_dropmultires = (
-        mutseq_widthfilt.sort_values(
-            by=["geneName", "sample_id", "uniprotAccession", "pos", "mutAA"]
+    try:
+        results = run_stages(
+            stages, stage_cache, from_stage=from_stage, until_stage=until_stage or "downstream",
+            dry_run=dry_run, use_cache=use_stage_cache, load=("downstream", "mutants"),
         )
-        .drop_duplicates(subset=["geneName", "sample_id", "uniprotAccession", "pos"])
-    )
-    # 7. Generate mutated sequences
-    log_file = os.path.join(output_dir, "logs", "mutation_generator.log")
-    mutseq_mutated = mutationGenerator.processMutationsProgress(
-        mutseq_dropmultires, log_file, output_dir
-    )
-    # 8. Downstream filtering
-    lengene_mutseq = downstreamProcess.DownstreamReduce(
-        mutseq_mutated, 800, output_dir
-    )
-    # 9. Final sequence mappings
-    unique_samples = finalise_sequences.sequence_sample_count(lengene_mutseq)
-    final_sequence_file, final_sample2sequence = finalise_sequences.generate_sequence_mappings(
-        output_dir, lengene_mutseq, unique_samples, starting_sequence_count=0
-    )
-    print("[INFO] Sequence preparation pipeline complete ✅")
\ No newline at end of file
+    except UniprotDownloadError as e:
+        print(f"[ERROR] UniProt download failed: {e}")
+        return
+    if dry_run or until_stage is not None:
+        return results if dry_run else None
+    first_code = len(read_frame(output_dir, "sequences", columns=["sequence_code"]))
+    with profile_stage("append_mappings", rows_in=len(results["downstream"])) as record:
+        _, _, new_sequences = finalise_sequences.append_sequence_mappings(
+            output_dir, results["downstream"], results["mutants"][1], intermediate_format,
+            "both" if sample2sequences_tsv else "long",
+        )
+        record.count(rows_out=len(new_sequences))
+    _writeCohort(output_dir, _recordUpdate(cohort, data_dir, new_files, first_code, len(new_sequences)))
+    print(f"[INFO] {len(new_sequences)} new sequences listed in {os.path.join(output_dir, 'sequences_delta.txt')}")
+    print("[INFO] Sequence preparation pipeline complete ✅")
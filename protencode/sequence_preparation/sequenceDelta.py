@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# Columns identifying a mutant relative to its interned wildtype. Wildtype rows have pos == 0.
+DELTA_COLUMNS = ['wt_id', 'pos', 'mutAA']
+
+def residueCodes(residues):
+    """
+    Convert a column of single-letter residues to a uint8 array of ASCII codes (0 for missing values).
+    """
+    categorical = pd.Categorical(residues)
+    lookup = np.array(
+        [ord(residue) if isinstance(residue, str) and len(residue) == 1 else 0 for residue in categorical.categories] + [0],
+        dtype=np.uint8,
+    )
+    # Missing values have code -1, which indexes the trailing 0
+    return lookup[categorical.codes]
+
+def groupBoundaries(codes):
+    """
+    Return a stable ordering of `codes` and the [start, end) bounds of each run of equal codes in it.
+    """
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(codes) else np.array([], dtype=np.int64)
+    ends = np.r_[starts[1:], len(codes)]
+    return order, starts, ends
+
+def internWildtypes(df, wildtype_col='wildtypeSequence'):
+    """
+    Replace the full wildtype sequence column by an integer 'wt_id' into an interned wildtype table.
+
+    Args:
+        df (pd.DataFrame): DataFrame with one wildtype sequence per row.
+        wildtype_col (str): Column name containing the wildtype sequence (default: 'wildtypeSequence').
+
+    Returns:
+        pd.DataFrame: `df` without the wildtype column and with an int32 'wt_id' column.
+        pd.DataFrame: The wildtype table with columns 'wt_id' and 'wildtypeSequence'.
+    """
+    codes, uniques = pd.factorize(df[wildtype_col])
+    wildtypes = pd.DataFrame({
+        'wt_id': np.arange(len(uniques), dtype=np.int32),
+        'wildtypeSequence': np.asarray(uniques, dtype=object),
+    })
+    delta_df = df.drop(columns=[wildtype_col]).assign(wt_id=codes.astype(np.int32))
+    return delta_df, wildtypes
+
+def sequenceLengths(delta_df, wildtypes):
+    """
+    Return the length of every sequence of a delta table without building the strings.
+    """
+    lengths = wildtypes.set_index('wt_id')['wildtypeSequence'].str.len()
+    return lengths.reindex(delta_df['wt_id'].to_numpy()).to_numpy()
+
+def materialiseSequences(delta_df, wildtypes):
+    """
+    Build the full sequence strings of a delta table.
+
+    Args:
+        delta_df (pd.DataFrame): Rows with 'wt_id', 'pos' (1-based, 0 for the wildtype itself) and 'mutAA'.
+        wildtypes (pd.DataFrame): The interned wildtype table.
+
+    Returns:
+        np.ndarray: Object array of sequences in the order of `delta_df`.
+    """
+    sequences = np.full(len(delta_df), None, dtype=object)
+    if not len(delta_df):
+        return sequences
+    wildtype_lookup = pd.Series(wildtypes['wildtypeSequence'].to_numpy(), index=wildtypes['wt_id'].to_numpy())
+    wt_ids = delta_df['wt_id'].to_numpy()
+    positions = delta_df['pos'].to_numpy(dtype=np.int64) - 1
+    substituted = residueCodes(delta_df['mutAA'])
+    is_mutant = (positions >= 0) & (substituted > 0)
+    order, starts, ends = groupBoundaries(wt_ids)
+    for start, end in zip(starts, ends):
+        rows = order[start:end]
+        wildtype = wildtype_lookup[wt_ids[rows[0]]]
+        sequences[rows[~is_mutant[rows]]] = wildtype
+        mutant_rows = rows[is_mutant[rows]]
+        if not len(mutant_rows):
+            continue
+        sequence = np.frombuffer(wildtype.encode('ascii'), dtype=np.uint8)
+        buffer = np.empty((len(mutant_rows), len(sequence)), dtype=np.uint8)
+        buffer[:] = sequence
+        buffer[np.arange(len(mutant_rows)), positions[mutant_rows]] = substituted[mutant_rows]
+        sequences[mutant_rows] = [mutant.decode('ascii') for mutant in buffer.view(f'S{len(sequence)}').ravel().tolist()]
+    return sequences
+
+def writeMaterialised(delta_df, wildtypes, path, sequence_column, columns, sep='\t', chunk_rows=20000, append=False):
+    """
+    Write a delta table as delimited text with its sequences materialised, one chunk of rows at a time.
+
+    Args:
+        delta_df (pd.DataFrame): Rows with the delta columns plus any columns to export.
+        wildtypes (pd.DataFrame): The interned wildtype table.
+        path (str): Output file.
+        sequence_column (str): Name of the materialised sequence column.
+        columns (list of str): Output column order, including `sequence_column`.
+        sep (str): Delimiter (default: tab).
+        chunk_rows (int): Number of rows materialised at once (default: 20000).
+        append (bool): Append rows to an existing file, without a header (default: False).
+    """
+    with open(path, 'a' if append else 'w') as f:
+        if not len(delta_df) and not append:
+            pd.DataFrame(columns=columns).to_csv(f, sep=sep, index=False)
+        for start in range(0, len(delta_df), chunk_rows):
+            chunk = delta_df.iloc[start:start + chunk_rows]
+            chunk = chunk.assign(**{sequence_column: materialiseSequences(chunk, wildtypes)})
+            chunk[columns].to_csv(f, sep=sep, index=False, header=start == 0 and not append)
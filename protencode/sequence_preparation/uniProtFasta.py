@@ -1,8 +1,146 @@
+import gzip
+import json
 import os
+import shutil
 import requests
-from datetime import datetime
+import urllib3
 from tqdm import tqdm
 
+def _releaseDir(cache_dir, organism_id, release):
+    return os.path.join(cache_dir, str(organism_id), release)
+
+def _cachedFasta(cache_dir, organism_id, release, format="fasta"):
+    """
+    Return the FASTA path of a complete cached release, or None.
+    """
+    release_dir = _releaseDir(cache_dir, organism_id, release)
+    fasta_file = os.path.join(release_dir, f"{organism_id}.{format}")
+    if os.path.exists(os.path.join(release_dir, "release.json")) and os.path.exists(fasta_file):
+        return fasta_file
+    return None
+
+def _latestRelease(cache_dir, organism_id):
+    latest_file = os.path.join(cache_dir, str(organism_id), "LATEST")
+    if not os.path.exists(latest_file):
+        return None
+    with open(latest_file) as f:
+        return f.read().strip() or None
+
+def _writeAtomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def cachedUniprotFasta(organism_id, output_dir, cache_dir=None, format="fasta"):
+    """
+    Return the FASTA of the latest complete cached release, without network access, or None.
+    """
+    cache_dir = cache_dir or os.path.join(output_dir, "uniprot_cache")
+    latest = _latestRelease(cache_dir, organism_id)
+    return _cachedFasta(cache_dir, organism_id, latest, format) if latest else None
+
+def queryUniprotRelease(query_url, headers, timeout=60):
+    """
+    Ask UniProt which release a query would be served from, without downloading the data.
+
+    Returns:
+    --------
+    dict
+        The 'X-UniProt-Release', 'X-UniProt-Release-Date' and 'X-Total-Results' response headers.
+    """
+    response = requests.head(query_url, headers=headers, timeout=timeout, allow_redirects=True)
+    if response.status_code in (405, 501):
+        # Servers without HEAD support: read the headers of a streamed GET and drop the body
+        response = requests.get(query_url, headers=headers, timeout=timeout, stream=True)
+        response.close()
+    if response.status_code not in (200, 206):
+        raise RuntimeError(
+            f"Failed to query UniProt release. Status: {response.status_code}, URL: {query_url}"
+        )
+    return {
+        "release": response.headers.get("X-UniProt-Release", "unknown"),
+        "release_date": response.headers.get("X-UniProt-Release-Date", "unknown"),
+        "results": response.headers.get("X-Total-Results", "unknown"),
+    }
+
+def _expectedSize(response):
+    if response.status_code == 206:
+        content_range = response.headers.get("Content-Range", "")
+        total = content_range.rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) if length is not None and length.isdigit() else None
+
+def _resumableDownload(url, part_file, headers, chunk_size, max_retries, timeout, desc, verbose):
+    """
+    Stream `url` to `part_file`, resuming with HTTP Range requests after dropped connections.
+
+    Returns:
+    --------
+    int or None
+        The expected size of the complete file if the server reported it.
+    """
+    expected_size = None
+    for attempt in range(max_retries + 1):
+        resume_from = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        request_headers = dict(headers)
+        if resume_from:
+            request_headers["Range"] = f"bytes={resume_from}-"
+            if verbose:
+                print(f"Resuming download from byte {resume_from}...")
+        try:
+            with requests.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416 and resume_from:
+                    # Nothing left to fetch: the partial file is already complete
+                    return expected_size if expected_size is not None else resume_from
+                if response.status_code not in (200, 206):
+                    raise RuntimeError(
+                        f"Failed to download data. Status: {response.status_code}, URL: {url}\n"
+                        f"Reason: {response.text}"
+                    )
+                if response.status_code == 200:
+                    resume_from = 0
+                expected_size = _expectedSize(response) or expected_size
+                mode = "ab" if response.status_code == 206 else "wb"
+                with open(part_file, mode) as f, tqdm(
+                    total=expected_size,
+                    initial=resume_from,
+                    unit="B",
+                    unit_scale=True,
+                    desc=desc
+                ) as pbar:
+                    # Keep the transfer compressed on disk: do not undo any Content-Encoding
+                    for chunk in response.raw.stream(chunk_size, decode_content=False):
+                        f.write(chunk)
+                        pbar.update(len(chunk))
+            if expected_size is None or os.path.getsize(part_file) == expected_size:
+                return expected_size
+            if verbose:
+                print(f"Incomplete transfer ({os.path.getsize(part_file)} of {expected_size} bytes).")
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError, urllib3.exceptions.HTTPError) as e:
+            if verbose:
+                print(f"Connection interrupted (attempt {attempt + 1}/{max_retries + 1}): {e}")
+    raise RuntimeError(f"Failed to download data from {url} after {max_retries + 1} attempts.")
+
+def _decompressFasta(download_file, fasta_file):
+    """
+    Decompress a downloaded transfer into the FASTA file, verifying the gzip CRC and length.
+    Transfers that are not gzip-compressed are copied as they are.
+    """
+    tmp_file = f"{fasta_file}.tmp"
+    with open(download_file, "rb") as f:
+        is_gzip = f.read(2) == b"\x1f\x8b"
+    opener = gzip.open if is_gzip else open
+    try:
+        with opener(download_file, "rb") as src, open(tmp_file, "wb") as dst:
+            shutil.copyfileobj(src, dst, length=1024 * 1024)
+    except (EOFError, OSError) as e:
+        os.remove(tmp_file)
+        raise RuntimeError(f"Downloaded file {download_file} is corrupt or truncated: {e}")
+    os.replace(tmp_file, fasta_file)
+
 def downloadUniprotFasta(
     organism_id,
     output_dir,
@@ -11,90 +149,106 @@ def downloadUniprotFasta(
     verbose=True,
     base_url="https://rest.uniprot.org/uniprotkb/stream",
     format="fasta",
-    chunk_size=1024
+    chunk_size=1024 * 1024,
+    cache_dir=None,
+    max_retries=5,
+    timeout=60
 ):
     """
-    Download FASTA sequences for a specified organism from UniProt and save to a local file.
+    Download FASTA sequences for a specified organism from UniProt into a release-versioned cache.
+
+    The cache is laid out as `<cache_dir>/<organism_id>/<X-UniProt-Release>/` and holds the compressed
+    transfer, the decompressed FASTA, its index (written next to it by `fastaProcessor`) and a
+    `release.json` completion marker. Without `update`, the latest complete release in the cache is
+    reused without any network access. Transfers are streamed gzip-compressed to a `.part` file and
+    resumed with Range requests if the connection drops.
 
     Parameters:
     -----------
     organism_id : str or int
         The UniProt organism ID (taxonomy ID) for which to download the FASTA sequences.
     output_dir : str
-        Directory where the FASTA file will be saved.
+        Output directory of the run; the cache defaults to `<output_dir>/uniprot_cache`.
     contact_email : str, optional
         Contact email address to be included in the User-Agent header (default is an empty string).
     update : bool, optional
-        If True, force re-download of the file even if it already exists locally (default is False).
+        If True, ask UniProt for its current release and download it if it is not cached yet
+        (default is False).
     verbose : bool, optional
         If True, print detailed progress and status messages (default is True).
     base_url : str, optional
         Base URL for the UniProt REST API (default is "https://rest.uniprot.org/uniprotkb/stream").
     format : str, optional
         File format to retrieve from UniProt (default is "fasta").
+    chunk_size : int, optional
+        Size in bytes of the chunks streamed to disk (default is 1 MiB).
+    cache_dir : str, optional
+        Shared cache directory (default is `<output_dir>/uniprot_cache`).
+    max_retries : int, optional
+        Number of times an interrupted transfer is resumed before giving up (default is 5).
+    timeout : float, optional
+        Connection/read timeout in seconds for each request (default is 60).
 
     Returns:
     --------
     str
-        Path to the downloaded FASTA file or a message indicating no update was needed.
+        Path to the cached FASTA file.
 
     Raises:
     -------
     RuntimeError
-        If the download fails due to an error in the request.
+        If the download fails or the downloaded file is incomplete.
     """
     print(f"Starting download process for organism ID: {organism_id}")
     os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, f"{organism_id}.fasta")
-    if verbose:
-        print(f"Output directory: {output_dir}")
-        print(f"Output file: {output_file}")
+    cache_dir = cache_dir or os.path.join(output_dir, "uniprot_cache")
+    if not update:
+        cached = cachedUniprotFasta(organism_id, output_dir, cache_dir, format)
+        if cached:
+            if verbose:
+                print(f"Using cached UniProt release {_latestRelease(cache_dir, organism_id)} for taxon {organism_id}: {cached}")
+            return cached
     query_url = f"{base_url}?query=organism_id:{organism_id}&format={format}"
     if verbose:
+        print(f"Cache directory: {cache_dir}")
         print(f"Constructed query URL: {query_url}")
     headers = {
         "User-Agent": f"Python-requests {contact_email}" if contact_email else "Python-requests",
     }
-    if os.path.exists(output_file) and not update:
-        last_modified_time = datetime.utcfromtimestamp(os.path.getmtime(output_file)).strftime("%a, %d %b %Y %H:%M:%S GMT")
-        headers["If-Modified-Since"] = last_modified_time
-        if verbose:
-            print(f"Existing file found. Last modified: {last_modified_time}")
-            print("Checking if the data is up-to-date...")
-    response = requests.get(query_url, headers=headers)
-    if response.status_code == 200:
-        if verbose:
-            print("New data available. Downloading...")
-        total_size = int(response.headers.get("Content-Length", 0))
-        with open(output_file, "wb") as f, tqdm(
-            total=total_size,
-            unit="B",
-            unit_scale=True,
-            desc=f"Downloading {organism_id}"
-        ) as pbar:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                f.write(chunk)
-                pbar.update(len(chunk))
-        results = response.headers.get("X-Total-Results", "unknown")
-        release = response.headers.get("X-UniProt-Release", "unknown")
-        release_date = response.headers.get("X-UniProt-Release-Date", "unknown")
+    info = queryUniprotRelease(query_url, headers, timeout=timeout)
+    release = info["release"]
+    cached = _cachedFasta(cache_dir, organism_id, release, format)
+    if cached and release != "unknown":
         if verbose:
-            print(
-                f"Downloaded FASTAs for organism ID: {organism_id} from UniProt release {release} "
-                f"({release_date}). Total results: {results}"
-            )
-            print(f"File saved to: {output_file}")
-        return output_file
-    elif response.status_code == 304:
-        if verbose:
-            print(f"Data for taxon {organism_id} is up-to-date. No new download needed.")
-        return f"Data for taxon {organism_id} is up-to-date. No new download needed."
-    else:
-        error_message = (
-            f"Failed to download data. Status: {response.status_code}, URL: {query_url}\n"
-            f"Reason: {response.text}"
+            print(f"Data for taxon {organism_id} is up-to-date (release {release}). No new download needed.")
+        _writeAtomic(os.path.join(cache_dir, str(organism_id), "LATEST"), release)
+        return cached
+    release_dir = _releaseDir(cache_dir, organism_id, release)
+    if release == "unknown" and os.path.exists(release_dir):
+        shutil.rmtree(release_dir)
+    os.makedirs(release_dir, exist_ok=True)
+    download_file = os.path.join(release_dir, f"{organism_id}.{format}.gz")
+    fasta_file = os.path.join(release_dir, f"{organism_id}.{format}")
+    if verbose:
+        print(f"New data available (release {release}). Downloading to {release_dir}...")
+    expected_size = _resumableDownload(
+        f"{query_url}&compressed=true", f"{download_file}.part", headers,
+        chunk_size, max_retries, timeout, f"Downloading {organism_id}", verbose
+    )
+    os.replace(f"{download_file}.part", download_file)
+    _decompressFasta(download_file, fasta_file)
+    _writeAtomic(os.path.join(release_dir, "release.json"), json.dumps({
+        "organism_id": str(organism_id),
+        "release": release,
+        "release_date": info["release_date"],
+        "results": info["results"],
+        "compressed_bytes": expected_size if expected_size is not None else os.path.getsize(download_file),
+    }, indent=2))
+    _writeAtomic(os.path.join(cache_dir, str(organism_id), "LATEST"), release)
+    if verbose:
+        print(
+            f"Downloaded FASTAs for organism ID: {organism_id} from UniProt release {release} "
+            f"({info['release_date']}). Total results: {info['results']}"
         )
-        if verbose:
-            print("An error occurred during the download process.")
-            print(error_message)
-        raise RuntimeError(error_message)
\ No newline at end of file
+        print(f"File saved to: {fasta_file}")
+    return fasta_file
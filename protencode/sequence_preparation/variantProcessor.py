@@ -1,6 +1,133 @@
+import csv
 import pandas as pd
 import os
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from protencode.utils.intermediate_store import write_frame
+
+# Column layout of the supported mutation files, by extension (compressed copies such as `.maf.gz` included)
+VARIANT_FILE_LAYOUTS = {
+    ".csv": dict(
+        separator=",",
+        columns_to_keep=["DepMap_ID", "Hugo_Symbol", "Protein_Change"],
+        column_mappings={"DepMap_ID": "sample_id", "Hugo_Symbol": "geneName", "Protein_Change": "variant"},
+    ),
+    ".maf": dict(
+        separator="\t",
+        columns_to_keep=["Tumor_Sample_Barcode", "Hugo_Symbol", "HGVSp_Short"],
+        column_mappings={"Tumor_Sample_Barcode": "sample_id", "Hugo_Symbol": "geneName", "HGVSp_Short": "variant"},
+        comment="#",
+    ),
+}
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".zip", ".xz", ".zst")
+
+def variantFileLayout(file_name):
+    """
+    The `processVariantFile` keyword arguments (separator, columns and their mappings) for a mutation
+    file, chosen by its extension (see `VARIANT_FILE_LAYOUTS`), or None if it is not a supported file.
+    """
+    name = file_name.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    layout = VARIANT_FILE_LAYOUTS.get(os.path.splitext(name)[1])
+    return dict(layout) if layout is not None else None
+
+class _ByteRangeReader:
+    """
+    Minimal read-only file object exposing bytes [start, end) of a file, so that
+    pandas can parse one slice of a large delimited file without loading the rest.
+    """
+    def __init__(self, file_path, start, end):
+        self._file = open(file_path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def readline(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        line = self._file.readline(self._remaining)
+        self._remaining -= len(line)
+        return line
+
+    def close(self):
+        self._file.close()
+
+def _readHeader(file_path, separator, comment=None):
+    """
+    Return the header column names and the byte offset at which the data rows start, skipping
+    leading lines that start with `comment` (e.g. the `#version` lines of MAF files).
+    """
+    with open(file_path, "rb") as f:
+        line = f.readline()
+        while comment is not None and line.startswith(comment.encode()):
+            line = f.readline()
+        header = next(csv.reader([line.decode("utf-8").rstrip("\r\n")], delimiter=separator))
+        return header, f.tell()
+
+def splitVariantFile(file_path, num_parts, separator='\t', comment=None):
+    """
+    Split a variant file into byte ranges aligned to line boundaries.
+
+    Parameters:
+    -----------
+    file_path : str
+        Path to the (uncompressed) variant annotation file.
+    num_parts : int
+        Number of ranges to split the data rows into.
+    separator : str, optional
+        Delimiter used in the input file (default is '\t').
+    comment : str, optional
+        Character marking comment lines before the header (default is None).
+
+    Returns:
+    --------
+    list of tuple
+        (start, end) byte offsets covering the data rows of the file. Quoted fields
+        containing newlines are not supported when splitting into more than one part.
+    """
+    _, data_start = _readHeader(file_path, separator, comment)
+    file_size = os.path.getsize(file_path)
+    num_parts = max(1, min(num_parts, file_size - data_start))
+    step = max(1, (file_size - data_start) // num_parts)
+    boundaries = [data_start]
+    with open(file_path, "rb") as f:
+        for i in range(1, num_parts):
+            f.seek(data_start + i * step)
+            f.readline()
+            offset = f.tell()
+            if offset >= file_size:
+                break
+            if offset > boundaries[-1]:
+                boundaries.append(offset)
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _filterChunk(chunk, variant_type, classification_column, columns_to_keep):
+    chunk = chunk[chunk[classification_column] == variant_type]
+    return chunk[columns_to_keep].drop_duplicates()
+
+def _dedupeFrames(frames, columns_to_keep):
+    if not frames:
+        return pd.DataFrame(columns=columns_to_keep)
+    return pd.concat(frames, ignore_index=True).drop_duplicates()
 
 def processVariantFile(
     file_path,
@@ -8,7 +135,10 @@ def processVariantFile(
     classification_column='Variant_Classification',
     columns_to_keep=None,
     column_mappings=None,
-    separator='\t'
+    separator='\t',
+    chunksize=None,
+    byte_range=None,
+    comment=None
 ):
     """
     Process a variant annotation file (e.g., MAF or VCF) to extract and standardise mutation information.
@@ -24,16 +154,26 @@ def processVariantFile(
     columns_to_keep : list, optional
         List of column names to retain in the output (default is ['Tumor_Sample_Barcode', 'Hugo_Symbol', 'HGVSp_Short']).
     column_mappings : dict, optional
-        Dictionary mapping original column names to new names for standardisation (default is 
+        Dictionary mapping original column names to new names for standardisation (default is
         {'Tumor_Sample_Barcode': 'sample_id', 'Hugo_Symbol': 'geneName', 'HGVSp_Short': 'variant'}).
     separator : str, optional
         Delimiter used in the input file (default is '\t' for tab-separated files).
+    chunksize : int, optional
+        If given, stream the file in chunks of this many rows, filtering and de-duplicating each
+        chunk as it arrives so that peak memory is bounded by the chunk size and the filtered output
+        (default is None, read the file in one go).
+    byte_range : tuple of int, optional
+        (start, end) byte offsets, as returned by `splitVariantFile`, restricting parsing to one slice
+        of the data rows (default is None, parse the whole file).
+    comment : str, optional
+        Character marking comment lines, such as the `#version` header lines of MAF files; these
+        lines (and the rest of any line from this character on) are skipped (default is None).
 
     Returns:
     --------
     pd.DataFrame
         A DataFrame containing filtered and standardised mutation information, with duplicates removed.
-    """ 
+    """
     if columns_to_keep is None:
         columns_to_keep = ['Tumor_Sample_Barcode', 'Hugo_Symbol', 'HGVSp_Short']
     if column_mappings is None:
@@ -41,17 +181,54 @@ def processVariantFile(
             'Tumor_Sample_Barcode': 'sample_id',
             'Hugo_Symbol': 'geneName',
             'HGVSp_Short': 'variant'
-        } 
-    mut = pd.read_csv(file_path, sep=separator, low_memory=False)
-    mut = mut[mut[classification_column] == variant_type]
-    mut = mut[columns_to_keep]
+        }
+    usecols = list(dict.fromkeys(columns_to_keep + [classification_column]))
+    read_kwargs = dict(sep=separator, usecols=usecols, dtype=str, comment=comment)
+    if byte_range is not None:
+        header, _ = _readHeader(file_path, separator, comment)
+        source = _ByteRangeReader(file_path, *byte_range)
+        read_kwargs.update(header=None, names=header)
+    else:
+        source = file_path
+    try:
+        if chunksize is None:
+            mut = _filterChunk(
+                pd.read_csv(source, **read_kwargs), variant_type, classification_column, columns_to_keep
+            )
+        else:
+            frames = []
+            buffered_rows = 0
+            collapse_at = chunksize
+            with pd.read_csv(source, chunksize=chunksize, **read_kwargs) as reader:
+                for chunk in reader:
+                    filtered = _filterChunk(chunk, variant_type, classification_column, columns_to_keep)
+                    frames.append(filtered)
+                    buffered_rows += len(filtered)
+                    # Dedupe incrementally; doubling the threshold keeps the total re-work linear
+                    if buffered_rows >= collapse_at:
+                        frames = [_dedupeFrames(frames, columns_to_keep)]
+                        buffered_rows = len(frames[0])
+                        collapse_at = max(chunksize, 2 * buffered_rows)
+            mut = _dedupeFrames(frames, columns_to_keep)
+    finally:
+        if byte_range is not None:
+            source.close()
+    mut = mut.reset_index(drop=True)
     mut.columns = [column_mappings.get(col, col) for col in mut.columns]
     return mut.drop_duplicates()
 
+def _processVariantTask(task):
+    file_path, byte_range, kwargs = task
+    return processVariantFile(file_path, byte_range=byte_range, **kwargs)
+
 def multiProcessVariantFiles(
     data_dir,
     file_list,
     output_dir,
+    n_workers=1,
+    intermediate_format="parquet",
+    export_csv=False,
+    file_layouts=None,
     **kwargs
 ):
     """
@@ -63,15 +240,55 @@ def multiProcessVariantFiles(
         The directory containing the variant files.
     file_list : list of str
         A list of filenames to process within the specified directory.
+    output_dir : str
+        Directory where the combined mutations are saved.
+    n_workers : int, optional
+        Number of worker processes (default is 1, process files sequentially). With more than one
+        worker, uncompressed files are also split into line-aligned byte ranges so that the chunks
+        of a single large file are parsed in parallel.
+    intermediate_format : str, optional
+        Format of the saved `all_mutations` table: "parquet", "arrow" or "csv" (default is "parquet").
+    export_csv : bool, optional
+        Additionally export `all_mutations.csv` (default is False).
+    file_layouts : dict, optional
+        Per-file `processVariantFile` keyword arguments overriding `kwargs`, by file name, e.g.
+        from `variantFileLayout` for directories mixing CSV and MAF files (default is None).
+    **kwargs
+        Passed on to `processVariantFile` (e.g. `chunksize`, `separator`, `columns_to_keep`).
 
     Returns:
     --------
     pd.DataFrame
         A concatenated DataFrame containing the processed data from all files.
     """
-    processed_files = [processVariantFile(os.path.join(data_dir, file), **kwargs) for file in tqdm(file_list, desc="Processing variant files")]
-    all_processed_files = pd.concat(processed_files, ignore_index=True)
+    file_paths = [os.path.join(data_dir, file) for file in file_list]
+    file_kwargs = [dict(kwargs, **(file_layouts or {}).get(file, {})) for file in file_list]
+    if n_workers > 1:
+        tasks = []
+        for file_path, options in zip(file_paths, file_kwargs):
+            # Compressed files cannot be split at byte boundaries, so they are read by one worker
+            if file_path.endswith(COMPRESSED_SUFFIXES):
+                tasks.append((file_path, None, options))
+            else:
+                tasks.extend(
+                    (file_path, byte_range, options)
+                    for byte_range in splitVariantFile(
+                        file_path, n_workers, separator=options.get('separator', '\t'), comment=options.get('comment'),
+                    )
+                )
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            processed_files = list(tqdm(
+                executor.map(_processVariantTask, tasks),
+                total=len(tasks),
+                desc="Processing variant files"
+            ))
+    else:
+        processed_files = [
+            processVariantFile(file_path, **options)
+            for file_path, options in tqdm(zip(file_paths, file_kwargs), total=len(file_paths), desc="Processing variant files")
+        ]
+    all_processed_files = pd.concat(processed_files, ignore_index=True).drop_duplicates().reset_index(drop=True)
     print(f"Saving processed files to {output_dir}.")
-    all_processed_files.to_csv(f"{output_dir}/all_mutations.csv", index=False)
+    write_frame(all_processed_files, output_dir, "all_mutations", intermediate_format, export_csv)
     print(f"Returning processed files with {len(all_processed_files.index)} rows and {len(all_processed_files.columns)} columns.")
-    return all_processed_files
\ No newline at end of file
+    return all_processed_files
@@ -0,0 +1,145 @@
+import os
+import pandas as pd
+
+# Supported intermediate formats and their file extensions, in lookup order.
+INTERMEDIATE_FORMATS = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+    "csv": ".csv",
+}
+DEFAULT_FORMAT = "parquet"
+
+def frame_path(output_dir, name, fmt=DEFAULT_FORMAT):
+    """
+    Return the path of an intermediate table.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory holding the intermediate tables.
+    name : str
+        Table name without extension (e.g. "all_mutations").
+    fmt : str, default="parquet"
+        One of "parquet", "arrow" (Arrow IPC / Feather v2) or "csv".
+    """
+    if fmt not in INTERMEDIATE_FORMATS:
+        raise ValueError(f"Unknown intermediate format '{fmt}'. Choose from {list(INTERMEDIATE_FORMATS)}.")
+    return os.path.join(output_dir, f"{name}{INTERMEDIATE_FORMATS[fmt]}")
+
+def _dictionary_encode(df, max_unique_ratio=0.5):
+    """
+    Convert repetitive string columns (gene names, sample IDs, wildtype sequences) to categoricals
+    so they are stored once per distinct value in Arrow/Parquet.
+    """
+    encoded = {}
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+            if len(series) and series.nunique(dropna=True) <= max_unique_ratio * len(series):
+                encoded[col] = series.astype("category")
+    return df.assign(**encoded) if encoded else df
+
+def write_frame(df, output_dir, name, fmt=DEFAULT_FORMAT, export_csv=False, compression="zstd", index=False):
+    """
+    Write an intermediate table in the chosen columnar format.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Table to write.
+    output_dir : str
+        Destination directory.
+    name : str
+        Table name without extension.
+    fmt : str, default="parquet"
+        One of "parquet", "arrow" or "csv".
+    export_csv : bool, default=False
+        Additionally write `<name>.csv` for inspection with other tools.
+    compression : str, default="zstd"
+        Compression codec for Parquet/Arrow output.
+    index : bool, default=False
+        Whether to store the DataFrame index.
+
+    Returns
+    -------
+    str
+        Path of the written table.
+    """
+    path = frame_path(output_dir, name, fmt)
+    if fmt == "parquet":
+        _dictionary_encode(df).to_parquet(path, compression=compression, index=index)
+    elif fmt == "arrow":
+        frame = _dictionary_encode(df)
+        if index:
+            frame = frame.reset_index()
+        frame.reset_index(drop=True).to_feather(path, compression=compression)
+    else:
+        df.to_csv(path, index=index)
+    if export_csv and fmt != "csv":
+        df.to_csv(frame_path(output_dir, name, "csv"), index=index)
+    # Drop copies left by earlier runs in other formats so `find_frame` cannot pick up a stale table
+    for other in INTERMEDIATE_FORMATS:
+        if other == fmt or (other == "csv" and export_csv):
+            continue
+        stale = frame_path(output_dir, name, other)
+        if os.path.exists(stale):
+            os.remove(stale)
+    return path
+
+def find_frame(output_dir, name, legacy_file=None):
+    """
+    Return the path of the first existing representation of an intermediate table, or None.
+
+    `write_frame` removes the other formats' copies of a table, so at most one representation
+    (plus an optional exported CSV) exists per table.
+    """
+    for fmt in INTERMEDIATE_FORMATS:
+        path = frame_path(output_dir, name, fmt)
+        if os.path.exists(path):
+            return path
+    if legacy_file is not None:
+        path = os.path.join(output_dir, legacy_file)
+        if os.path.exists(path):
+            return path
+    return None
+
+def read_frame(output_dir, name, columns=None, legacy_file=None, sep="\t", keep_categories=False):
+    """
+    Read an intermediate table, whichever supported format it was written in.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory holding the intermediate tables.
+    name : str
+        Table name without extension.
+    columns : list of str, optional
+        Only load these columns.
+    legacy_file : str, optional
+        Delimited text file (relative to `output_dir`) to fall back to when no intermediate table exists,
+        e.g. "sample2sequences.tsv" from older runs.
+    sep : str, default="\\t"
+        Delimiter of `legacy_file`.
+    keep_categories : bool, default=False
+        Keep dictionary-encoded columns as categoricals instead of decoding them to plain strings.
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    path = find_frame(output_dir, name)
+    if path is None and legacy_file is not None and os.path.exists(os.path.join(output_dir, legacy_file)):
+        return pd.read_csv(os.path.join(output_dir, legacy_file), sep=sep, usecols=columns)
+    if path is None:
+        raise FileNotFoundError(f"No intermediate table '{name}' found in {output_dir}")
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path, columns=columns)
+    elif path.endswith(".arrow"):
+        df = pd.read_feather(path, columns=columns)
+    else:
+        df = pd.read_csv(path, usecols=columns)
+    if not keep_categories:
+        categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+        if categorical:
+            df = df.assign(**{col: df[col].astype(df[col].cat.categories.dtype) for col in categorical})
+    return df
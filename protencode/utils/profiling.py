@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import cProfile
+import resource
+import threading
+from contextlib import contextmanager
+
+# Profiler collecting the stages of the current run (set by `profiling`); None when profiling is off
+_ACTIVE = None
+
+def current_rss():
+    """
+    Resident set size of this process in bytes (from /proc/self/statm; elsewhere the peak so far).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def count_rows(value):
+    """
+    Rows of a table or array (of the first element of a tuple output), or None if it has none.
+    """
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, "shape", None)
+    if shape:
+        return int(shape[0])
+    if isinstance(value, (list, dict)):
+        return len(value)
+    return None
+
+def _cpu_seconds():
+    # This process plus its waited-for children (worker processes)
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+class StageRecord:
+    """
+    Totals of every run of one stage: wall and CPU time, peak RSS and item counts.
+
+    Counts ("rows_in", "rows_out", "sequences", "tokens", ...) are added with `count` while the
+    stage runs; throughput is reported per wall-clock second.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.counts = {}
+
+    def count(self, **counts):
+        for key, value in counts.items():
+            if value is not None:
+                self.counts[key] = self.counts.get(key, 0) + int(value)
+
+    def as_dict(self):
+        wall = max(self.wall_seconds, 1e-9)
+        throughput = {f"{key}_per_second": value / wall for key, value in self.counts.items() if key != "rows_in"}
+        if "rows_out" not in self.counts and "rows_in" in self.counts:
+            throughput["rows_per_second"] = self.counts["rows_in"] / wall
+        elif "rows_out" in self.counts:
+            throughput["rows_per_second"] = throughput.pop("rows_out_per_second")
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            **self.counts,
+            **throughput,
+        }
+
+class Profiler:
+    """
+    Per-stage wall time, CPU time (including reaped worker processes), peak RSS and throughput of
+    one pipeline run.
+
+    Peak RSS is sampled every `interval` seconds by a background thread while stages run. Stages
+    running concurrently in threads share the process-wide CPU time and RSS. With `cprofile_dir`,
+    each stage also runs under cProfile and its statistics are written to `<stage>.prof` there
+    (nested stages are part of the outermost profiled stage, and only the thread that entered
+    the stage is profiled).
+    """
+
+    def __init__(self, pipeline, cprofile_dir=None, interval=0.05):
+        self.pipeline = pipeline
+        self.cprofile_dir = cprofile_dir
+        self.interval = interval
+        self.records = {}
+        self._active = []
+        self._profiles = {}
+        self._profiling = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.started = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = _cpu_seconds()
+        self.peak_rss_bytes = current_rss()
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._observe(current_rss())
+
+    def _observe(self, rss):
+        with self._lock:
+            self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+            for record in self._active:
+                record.peak_rss_bytes = max(record.peak_rss_bytes, rss)
+
+    @contextmanager
+    def stage(self, name, **counts):
+        """
+        Record one run of stage `name`; yields its `StageRecord` so counts can be added.
+        """
+        with self._lock:
+            record = self.records.setdefault(name, StageRecord(name))
+            self._active.append(record)
+        record.count(**counts)
+        self._observe(current_rss())
+        profile = None
+        if self.cprofile_dir is not None and not self._profiling:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            record.wall_seconds += time.perf_counter() - wall
+            record.cpu_seconds += _cpu_seconds() - cpu
+            record.calls += 1
+            self._observe(current_rss())
+            with self._lock:
+                self._active.remove(record)
+
+    def report(self):
+        """
+        The run report: totals of the run and one entry per stage, in order of first run.
+        """
+        return {
+            "pipeline": self.pipeline,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": time.perf_counter() - self._wall_start,
+            "cpu_seconds": _cpu_seconds() - self._cpu_start,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "stages": [record.as_dict() for record in self.records.values()],
+        }
+
+    def write_json(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(tmp, path)
+
+    def write_prometheus(self, path):
+        """
+        Write the report in the Prometheus text format, e.g. for the node_exporter textfile collector
+        (written to a temporary file and renamed, as the collector requires).
+        """
+        report = self.report()
+        metrics = {}
+        for stage in report["stages"]:
+            for key, value in stage.items():
+                if key != "stage":
+                    metrics.setdefault(key, []).append((stage["stage"], value))
+        lines = []
+        for key in ("wall_seconds", "cpu_seconds", "peak_rss_bytes"):
+            lines += [f"# TYPE protencode_run_{key} gauge", f'protencode_run_{key}{{pipeline="{self.pipeline}"}} {report[key]}']
+        for key, values in metrics.items():
+            lines.append(f"# TYPE protencode_stage_{key} gauge")
+            lines += [f'protencode_stage_{key}{{pipeline="{self.pipeline}",stage="{stage}"}} {value}' for stage, value in values]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def write_cprofile(self):
+        os.makedirs(self.cprofile_dir, exist_ok=True)
+        for name, profile in self._profiles.items():
+            profile.dump_stats(os.path.join(self.cprofile_dir, f"{name}.prof"))
+
+def active_profiler():
+    return _ACTIVE
+
+@contextmanager
+def profile_stage(name, **counts):
+    """
+    Record a stage with the active profiler; a no-op (yielding a detached record) when profiling is off.
+    """
+    if _ACTIVE is None:
+        yield StageRecord(name)
+        return
+    with _ACTIVE.stage(name, **counts) as record:
+        yield record
+
+@contextmanager
+def profiling(pipeline, report_path=None, prometheus_path=None, cprofile_dir=None, interval=0.05):
+    """
+    Profile the stages run inside the block and write the report when it exits, even on error.
+
+    Args:
+        pipeline (str): Pipeline name, recorded in the report and as a Prometheus label.
+        report_path (str, optional): JSON run report to write.
+        prometheus_path (str, optional): Prometheus textfile to write (e.g. `<dir>/protencode.prom`).
+        cprofile_dir (str, optional): Directory for per-stage cProfile statistics (`<stage>.prof`).
+        interval (float): RSS sampling interval in seconds (default: 0.05).
+
+    Yields:
+        Profiler
+    """
+    global _ACTIVE
+    profiler = Profiler(pipeline, cprofile_dir, interval).start()
+    previous, _ACTIVE = _ACTIVE, profiler
+    try:
+        yield profiler
+    finally:
+        _ACTIVE = previous
+        profiler.stop()
+        if report_path is not None:
+            profiler.write_json(report_path)
+            print(f"[INFO] Profile report written to {report_path}")
+        if prometheus_path is not None:
+            profiler.write_prometheus(prometheus_path)
+        if cprofile_dir is not None:
+            profiler.write_cprofile()
@@ -0,0 +1,209 @@
+import os
+import json
+import inspect
+import hashlib
+from typing import Callable, NamedTuple
+import pandas as pd
+
+from protencode.utils.profiling import profile_stage, count_rows
+
+class Stage(NamedTuple):
+    """
+    A named pipeline step: `func(*input values, **params)`.
+
+    Attributes
+    ----------
+    name : str
+        Stage name, used for `from_stage`/`until_stage` and in the cache.
+    func : callable
+        Computes the stage output from the outputs of `inputs`.
+    inputs : tuple of str
+        Names of the upstream stages whose outputs are passed to `func`, in order.
+    params : dict
+        Parameters passed to `func` as keywords; they are part of the cache key.
+    code : tuple of modules
+        Modules whose source versions the stage (default: the module of `func`).
+    files : tuple of str
+        Files the stage writes; the stage is rerun if any is missing or was changed since.
+    always_run : bool
+        Run on every invocation instead of caching (e.g. a download that checks for updates).
+        If the stage returns a file path, downstream keys follow that file's fingerprint.
+    resolve : callable, optional
+        For `always_run` stages: returns the output without side effects, or None if unknown;
+        used by dry runs.
+    """
+    name: str
+    func: Callable
+    inputs: tuple = ()
+    params: dict = {}
+    code: tuple = ()
+    files: tuple = ()
+    always_run: bool = False
+    resolve: Callable = None
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def file_fingerprint(path):
+    """
+    Cheap fingerprint of a file (path, size and modification time), used instead of hashing large inputs.
+    """
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+def _code_version(stage):
+    modules = stage.code or (inspect.getmodule(stage.func),)
+    sources = []
+    for module in modules:
+        try:
+            sources.append(inspect.getsource(module))
+        except (OSError, TypeError):
+            sources.append(getattr(module, "__name__", str(module)))
+    return _digest(*sources)
+
+def _output_digest(key, value):
+    # Stages returning a file path are identified by that file, so changes to it propagate downstream
+    if isinstance(value, str) and os.path.isfile(value):
+        return _digest(key, file_fingerprint(value))
+    return key
+
+class StageCache:
+    """
+    Stage outputs stored under `cache_dir/<stage>/<key>.pkl`, where the key hashes the stage's name,
+    parameters, code version and the keys of its inputs. Only the `keep` most recently used
+    outputs of each stage are kept.
+    """
+
+    def __init__(self, cache_dir, keep=3):
+        self.cache_dir = cache_dir
+        self.keep = keep
+
+    def path(self, stage_name, key):
+        return os.path.join(self.cache_dir, stage_name, f"{key}.pkl")
+
+    def __contains__(self, item):
+        return os.path.exists(self.path(*item))
+
+    def files_unchanged(self, stage_name, key, files):
+        """
+        Whether the files written with this output still have the fingerprints recorded when it was stored.
+        """
+        if not files:
+            return True
+        if not all(os.path.exists(path) for path in files):
+            return False
+        try:
+            with open(self.path(stage_name, key)[:-len(".pkl")] + ".files.json") as f:
+                recorded = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return recorded == [file_fingerprint(path) for path in files]
+
+    def load(self, stage_name, key):
+        path = self.path(stage_name, key)
+        os.utime(path)
+        return pd.read_pickle(path)
+
+    def store(self, stage_name, key, value, files=()):
+        path = self.path(stage_name, key)
+        stage_dir = os.path.dirname(path)
+        os.makedirs(stage_dir, exist_ok=True)
+        if files:
+            with open(f"{path[:-len('.pkl')]}.files.json", "w") as f:
+                json.dump([file_fingerprint(file) for file in files], f)
+        tmp = f"{path}.tmp"
+        pd.to_pickle(value, tmp)
+        os.replace(tmp, path)
+        entries = sorted(
+            (os.path.join(stage_dir, name) for name in os.listdir(stage_dir) if name.endswith(".pkl")),
+            key=os.path.getmtime, reverse=True,
+        )
+        for stale in entries[self.keep:]:
+            os.remove(stale)
+            if os.path.exists(f"{stale[:-len('.pkl')]}.files.json"):
+                os.remove(f"{stale[:-len('.pkl')]}.files.json")
+
+def run_stages(stages, cache_dir, from_stage=None, until_stage=None, dry_run=False, use_cache=True, load=()):
+    """
+    Run a DAG of stages (listed in dependency order), skipping stages whose output is cached.
+
+    Cached outputs are only loaded when a later stage that needs them has to run, or if listed in `load`.
+
+    Parameters
+    ----------
+    stages : list of Stage
+        Stages in dependency order.
+    cache_dir : str
+        Directory of the `StageCache`.
+    from_stage : str, optional
+        Recompute this stage and everything after it even if cached.
+    until_stage : str, optional
+        Stop after this stage.
+    dry_run : bool, default=False
+        Only report which stages would be recomputed.
+    use_cache : bool, default=True
+        Read and write the cache (otherwise every stage runs).
+    load : iterable of str, optional
+        Stages whose output is returned even if cached.
+
+    Returns
+    -------
+    dict
+        Output of every stage that was run or loaded, by name. With `dry_run`, the planned
+        status of every stage instead: "cached", "run" or "check" (depends on an output only
+        known after running).
+    """
+    names = [stage.name for stage in stages]
+    for option in (from_stage, until_stage):
+        if option is not None and option not in names:
+            raise ValueError(f"Unknown stage '{option}'. Stages: {', '.join(names)}")
+    if until_stage is not None:
+        stages = stages[:names.index(until_stage) + 1]
+    forced_from = names.index(from_stage) if from_stage is not None else len(names)
+    cache = StageCache(cache_dir)
+    keys, digests, values, statuses = {}, {}, {}, {}
+
+    def value(name):
+        if name not in values:
+            values[name] = cache.load(name, keys[name])
+        return values[name]
+
+    for position, stage in enumerate(stages):
+        input_digests = [digests[name] for name in stage.inputs]
+        key = None if None in input_digests else _digest(stage.name, _code_version(stage), stage.params, input_digests)
+        keys[stage.name] = key
+        cached = (
+            use_cache and key is not None and not stage.always_run and position < forced_from
+            and (stage.name, key) in cache and cache.files_unchanged(stage.name, key, stage.files)
+        )
+        if dry_run:
+            if stage.always_run:
+                output = stage.resolve() if stage.resolve is not None and key is not None else None
+                digests[stage.name] = _output_digest(key, output) if output is not None else None
+                statuses[stage.name] = "check"
+            else:
+                digests[stage.name] = key
+                statuses[stage.name] = "cached" if cached else ("run" if key is not None else "check")
+            print(f"[DRY-RUN] {stage.name:<20} {statuses[stage.name]:<7} {key[:12] if key else '-'}")
+            continue
+        if cached:
+            print(f"[INFO] Stage {stage.name}: cached ({key[:12]})")
+        else:
+            print(f"[INFO] Stage {stage.name}: running")
+            inputs = [value(name) for name in stage.inputs]
+            with profile_stage(stage.name, rows_in=sum(count_rows(item) or 0 for item in inputs) if inputs else None) as record:
+                values[stage.name] = stage.func(*inputs, **stage.params)
+                record.count(rows_out=count_rows(values[stage.name]))
+            if use_cache and not stage.always_run:
+                cache.store(stage.name, key, values[stage.name], stage.files)
+        digests[stage.name] = _output_digest(key, values[stage.name]) if stage.always_run else key
+    if dry_run:
+        return statuses
+    for name in load:
+        if name in keys:
+            value(name)
+    return values
@@ -0,0 +1,187 @@
+import os
+import json
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+# UniProtKB/Swiss-Prot amino acid composition (%), used to draw synthetic protein sequences
+AMINO_ACID_FREQUENCIES = {
+    "A": 8.25, "R": 5.53, "N": 4.06, "D": 5.45, "C": 1.37, "Q": 3.93, "E": 6.75, "G": 7.07, "H": 2.27, "I": 5.96,
+    "L": 9.66, "K": 5.84, "M": 2.42, "F": 3.86, "P": 4.70, "S": 6.56, "T": 5.34, "W": 1.08, "Y": 2.92, "V": 6.87,
+}
+# Variant classes of the mutation files and their share of the rows; only missense rows reach the pipeline
+VARIANT_CLASSES = {
+    "Missense_Mutation": 0.80, "Silent": 0.10, "Nonsense_Mutation": 0.05, "Frame_Shift_Del": 0.03, "Splice_Site": 0.02,
+}
+# Column names of the supported input layouts: (sample, gene, protein change, classification)
+INPUT_FORMATS = {
+    "csv": (",", ".csv", ["DepMap_ID", "Hugo_Symbol", "Protein_Change", "Variant_Classification"]),
+    "maf": ("\t", ".maf", ["Tumor_Sample_Barcode", "Hugo_Symbol", "HGVSp_Short", "Variant_Classification"]),
+}
+
+class SyntheticDataset(NamedTuple):
+    """
+    Paths of a generated dataset.
+    """
+    data_dir: str
+    files: list
+    fasta_file: str
+    uniprot_cache: str
+
+def protein_lengths(n_genes, rng, median=415, sigma=0.7, min_length=50, max_length=35000):
+    """
+    Protein lengths drawn from a log-normal distribution close to the human proteome's
+    (median about 415 residues, long right tail up to titin-like lengths).
+    """
+    lengths = rng.lognormal(np.log(median), sigma, n_genes)
+    return np.clip(lengths, min_length, max_length).astype(np.int64)
+
+_ALPHABET = np.frombuffer("".join(AMINO_ACID_FREQUENCIES).encode(), dtype=np.uint8)
+
+def _randomResidues(n_proteins, rng, **length_options):
+    # All residues as one byte array, with each protein starting at its offset (and with M)
+    frequencies = np.array(list(AMINO_ACID_FREQUENCIES.values()))
+    lengths = protein_lengths(n_proteins, rng, **length_options)
+    offsets = np.r_[0, np.cumsum(lengths)]
+    residues = _ALPHABET[rng.choice(len(_ALPHABET), offsets[-1], p=frequencies / frequencies.sum())]
+    residues[offsets[:-1]] = ord("M")
+    return residues, offsets
+
+def random_proteins(n_proteins, seed=0, **length_options):
+    """
+    Random protein sequences with realistic lengths (see `protein_lengths`, which takes
+    `length_options`) and Swiss-Prot amino acid composition.
+    """
+    residues, offsets = _randomResidues(n_proteins, np.random.default_rng(seed), **length_options)
+    return [residues[start:end].tobytes().decode() for start, end in zip(offsets[:-1], offsets[1:])]
+
+def write_uniprot_fasta(path, accessions, genes, sequences, reviewed, organism_id="9606"):
+    """
+    Write sequences as a UniProt FASTA (`>sp|ACC|GENE_HUMAN ... OX=<taxon> GN=<gene> PE=1 SV=1`, 60 residues per line).
+    """
+    with open(path, "w") as f:
+        for accession, gene, sequence, is_reviewed in zip(accessions, genes, sequences, reviewed):
+            database = "sp" if is_reviewed else "tr"
+            f.write(f">{database}|{accession}|{gene}_HUMAN Synthetic protein {gene} OS=Homo sapiens OX={organism_id} GN={gene} PE=1 SV=1\n")
+            f.write("\n".join(sequence[start:start + 60] for start in range(0, len(sequence), 60)))
+            f.write("\n")
+
+def _releaseFasta(cache_dir, organism_id):
+    # The FASTA is laid out as a cached UniProt release, so `protencode sequence --uniprot-cache` runs offline
+    release_dir = os.path.join(cache_dir, str(organism_id), "synthetic")
+    os.makedirs(release_dir, exist_ok=True)
+    with open(os.path.join(release_dir, "release.json"), "w") as f:
+        json.dump({"release": "synthetic", "organism_id": str(organism_id)}, f)
+    with open(os.path.join(cache_dir, str(organism_id), "LATEST"), "w") as f:
+        f.write("synthetic")
+    return os.path.join(release_dir, f"{organism_id}.fasta")
+
+def generate_synthetic_dataset(
+    output_dir,
+    n_mutations=10_000,
+    n_samples=100,
+    n_genes=1_000,
+    n_files=1,
+    input_format="csv",
+    organism_id="9606",
+    mismatch_fraction=0.02,
+    unmatched_fraction=0.01,
+    trembl_fraction=0.05,
+    seed=0,
+    chunk_rows=1_000_000,
+):
+    """
+    Generate an offline mutation dataset and matching UniProt FASTA at a configurable scale.
+
+    Genes get log-normal protein lengths and residues drawn with the Swiss-Prot composition.
+    Mutations are spread over genes in proportion to their length times a Zipf-like recurrence
+    weight (a few genes are mutated in many samples) and over samples with a log-normal
+    mutation burden. Missense variants mostly match their wildtype residue; `mismatch_fraction`
+    of them do not (exercising the validation step), `unmatched_fraction` of the rows name genes
+    missing from the FASTA, and `trembl_fraction` of the genes get an extra unreviewed (tr) entry.
+    Rows are generated and written in chunks of `chunk_rows`, so 10M mutations need little memory.
+
+    Outputs (in `output_dir`): the mutation files in `data/` and the FASTA as the cached release
+    `uniprot_cache/<organism_id>/synthetic/`, for `protencode sequence --uniprot-cache`.
+
+    Args:
+        output_dir (str): Directory to write the dataset to.
+        n_mutations (int): Rows across all mutation files (default: 10,000).
+        n_samples (int): Number of samples (default: 100).
+        n_genes (int): Number of genes in the FASTA (default: 1,000).
+        n_files (int): Number of mutation files the rows are split over (default: 1).
+        input_format (str): "csv" (CCLE/DepMap columns) or "maf" (tab-separated MAF columns).
+        organism_id (str): Taxonomy ID written to the FASTA headers and cache (default: "9606").
+        mismatch_fraction (float): Share of variants whose wildtype residue is wrong (default: 0.02).
+        unmatched_fraction (float): Share of rows for genes absent from the FASTA (default: 0.01).
+        trembl_fraction (float): Share of genes with an additional TrEMBL entry (default: 0.05).
+        seed (int): Random seed (default: 0).
+        chunk_rows (int): Rows generated at once (default: 1,000,000).
+
+    Returns:
+        SyntheticDataset
+    """
+    if input_format not in INPUT_FORMATS:
+        raise ValueError(f"Unknown input format '{input_format}', expected one of {list(INPUT_FORMATS)}")
+    rng = np.random.default_rng(seed)
+    separator, extension, columns = INPUT_FORMATS[input_format]
+    data_dir = os.path.join(output_dir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    # ---- Proteins
+    residues, offsets = _randomResidues(n_genes, rng)
+    lengths = np.diff(offsets)
+    genes = np.array([f"GENE{i:05d}" for i in range(n_genes)], dtype=object)
+    sequences = [residues[start:end].tobytes().decode() for start, end in zip(offsets[:-1], offsets[1:])]
+    trembl = np.flatnonzero(rng.random(n_genes) < trembl_fraction)
+    uniprot_cache = os.path.join(output_dir, "uniprot_cache")
+    fasta_file = _releaseFasta(uniprot_cache, organism_id)
+    write_uniprot_fasta(
+        fasta_file,
+        [f"P{i:05d}" for i in range(n_genes)] + [f"A0A{i:06d}" for i in trembl],
+        list(genes) + list(genes[trembl]),
+        sequences + [sequences[i][:max(len(sequences[i]) // 2, 1)] for i in trembl],
+        [True] * n_genes + [False] * len(trembl),
+        organism_id,
+    )
+    # ---- Mutations
+    recurrence = rng.permutation((np.arange(n_genes) + 1.0) ** -0.8)
+    gene_weights = lengths * recurrence
+    gene_weights = gene_weights / gene_weights.sum()
+    burden = rng.lognormal(0, 1, n_samples)
+    burden = burden / burden.sum()
+    sample_ids = np.array([f"ACH-{i:06d}" for i in range(n_samples)], dtype=object)
+    classes = np.array(list(VARIANT_CLASSES), dtype=object)
+    class_weights = np.array(list(VARIANT_CLASSES.values()))
+    alphabet_chars = np.array(list(AMINO_ACID_FREQUENCIES), dtype=object)
+    code_of = np.zeros(256, dtype=np.int64)
+    code_of[_ALPHABET] = np.arange(len(_ALPHABET))
+    rows_per_file = np.diff(np.linspace(0, n_mutations, n_files + 1).astype(np.int64))
+    files = []
+    for file_number, file_rows in enumerate(rows_per_file):
+        path = os.path.join(data_dir, f"synthetic_mutations_{file_number:03d}{extension}")
+        files.append(path)
+        with open(path, "w") as f:
+            for start in range(0, max(file_rows, 1), chunk_rows):
+                n = int(min(chunk_rows, file_rows - start))
+                gene = rng.choice(n_genes, n, p=gene_weights)
+                pos = (rng.random(n) * lengths[gene]).astype(np.int64) + 1
+                wildtype = code_of[residues[offsets[gene] + pos - 1]]
+                mismatched = rng.random(n) < mismatch_fraction
+                wildtype[mismatched] = (wildtype[mismatched] + rng.integers(1, 20, mismatched.sum())) % 20
+                mutant = (wildtype + rng.integers(1, 20, n)) % 20
+                variant_class = classes[rng.choice(len(classes), n, p=class_weights)]
+                wt_chars = alphabet_chars[wildtype]
+                mut_chars = alphabet_chars[mutant].astype(object)
+                mut_chars[variant_class == "Silent"] = wt_chars[variant_class == "Silent"]
+                mut_chars[variant_class == "Nonsense_Mutation"] = "*"
+                change = "p." + pd.Series(wt_chars) + pd.Series(pos).astype(str) + pd.Series(mut_chars)
+                change[variant_class == "Frame_Shift_Del"] += "fs"
+                change[variant_class == "Splice_Site"] = "p.X" + pd.Series(pos).astype(str) + "_splice"
+                gene_names = genes[gene]
+                unmatched = rng.random(n) < unmatched_fraction
+                gene_names[unmatched] = "NOVEL" + pd.Series(rng.integers(0, max(n_genes // 10, 1), unmatched.sum())).astype(str)
+                frame = pd.DataFrame(dict(zip(columns, [
+                    sample_ids[rng.choice(n_samples, n, p=burden)], gene_names, change.to_numpy(), variant_class,
+                ])))
+                frame.to_csv(f, sep=separator, index=False, header=start == 0)
+    return SyntheticDataset(data_dir, files, fasta_file, uniprot_cache)
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from protencode.embeddings_generation.random_model import save_random_esm2
+from protencode.utils.intermediate_store import write_frame
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory):
+    """A small randomly initialised ESM-2 model, saved like a downloaded checkpoint."""
+    return save_random_esm2(
+        str(tmp_path_factory.mktemp("esm2_tiny")), num_hidden_layers=2, hidden_size=32, num_attention_heads=4,
+        intermediate_size=64,
+    )
+
+
+def write_sequences(output_dir, n=24, seed=0):
+    """Write the `sequences.txt` and `sequences` table read by the embeddings pipeline."""
+    rng = np.random.default_rng(seed)
+    residues = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+    sequences = pd.DataFrame({
+        "sequence_id": [f"seq{i}" for i in range(n)],
+        "sequence": ["".join(rng.choice(residues, rng.integers(5, 45))) for _ in range(n)],
+    })
+    os.makedirs(output_dir, exist_ok=True)
+    sequences.to_csv(os.path.join(output_dir, "sequences.txt"), sep="\t", index=False)
+    write_frame(sequences.assign(geneName=[f"GENE{i % 3}" for i in range(n)]), output_dir, "sequences")
+    return output_dir
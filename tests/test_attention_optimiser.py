@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from protencode.embeddings_generation.attention_optimiser import optimiseAttention, selectTopDimensions
+from protencode.embeddings_generation.pipeline import selectTopEmbeddings
+
+
+@pytest.fixture(scope="module")
+def weighted():
+    rng = np.random.default_rng(0)
+    genes = rng.choice([f"GENE{i}" for i in range(12)], size=300)
+    return rng.normal(size=(300, 48)).astype(np.float32), genes
+
+
+@pytest.mark.parametrize("n_workers, chunk_rows", [(1, 1_000_000), (1, 40), (2, 1_000_000)])
+def test_batched_selection_matches_optimiser_per_gene(weighted, n_workers, chunk_rows):
+    embeddings, genes = weighted
+    top, labels = selectTopDimensions(embeddings, genes, 10, n_workers=n_workers, chunk_rows=chunk_rows)
+    assert list(labels) == list(dict.fromkeys(genes))
+    for gene, selected in zip(labels, top):
+        # Every column is one vector over the gene's sequences
+        expected = optimiseAttention(embeddings[genes == gene].T, 10, None)
+        np.testing.assert_array_equal(selected, expected)
+
+
+def test_empty_input():
+    top, labels = selectTopDimensions(np.zeros((0, 0), dtype=np.float32), np.array([], dtype=object), 10)
+    assert top.shape[0] == 0 and len(labels) == 0
+    top, _ = selectTopDimensions(np.zeros((0, 48), dtype=np.float32), [], 10)
+    assert top.shape == (0, 10)
+    empty = np.zeros((0, 0), dtype=np.float32)
+    assert selectTopEmbeddings(empty, empty, np.array([], dtype=object), 10).shape[0] == 0
@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+
+from conftest import write_sequences
+from protencode.embeddings_generation import cpu_engine
+from protencode.embeddings_generation.pipeline import run_embeddings_generation
+
+OUTPUTS = ("averaged_embeddings", "pooled_embeddings", "selected_top_unweighted_embeddings")
+
+
+def test_sharded_run_starts_workers_once(monkeypatch, tmp_path, tiny_model):
+    pools = []
+
+    class CountingPool(cpu_engine.CPUWorkerPool):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(cpu_engine, "CPUWorkerPool", CountingPool)
+    options = dict(model_name=tiny_model, max_length=40, batch_size=4, shard_size=8, top_n=4, threads=1)
+    sharded = run_embeddings_generation(write_sequences(str(tmp_path / "sharded")), n_workers=2, **options)
+    # Three shards, one pool
+    assert len(pools) == 1
+    single = run_embeddings_generation(write_sequences(str(tmp_path / "single")), n_workers=1, **options)
+    for name in OUTPUTS:
+        np.testing.assert_allclose(
+            np.load(os.path.join(sharded, f"{name}.npy")), np.load(os.path.join(single, f"{name}.npy")), rtol=1e-5, atol=1e-6,
+        )
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+
+from protencode.embeddings_generation.embedding_cache import EmbeddingCache
+
+VALUE_BYTES = 100 * 10 * 4
+
+
+def _values(n):
+    return {f"key{i}": np.full((100, 10), i, dtype=np.float32) for i in range(n)}
+
+
+def _shards(cache_dir):
+    return [name for name in os.listdir(cache_dir) if name.startswith("shard-")]
+
+
+def test_put_and_get_roundtrip(tmp_path):
+    values = _values(5)
+    with EmbeddingCache(str(tmp_path)) as cache:
+        cache.put_many(values)
+        cache.put("key0", np.zeros((1,), dtype=np.float32))
+        hits = cache.get_many(list(values) + ["missing"])
+    assert set(hits) == set(values)
+    for key, value in values.items():
+        np.testing.assert_array_equal(hits[key], value)
+    with EmbeddingCache(str(tmp_path)) as cache:
+        assert len(cache) == 5
+        np.testing.assert_array_equal(cache.get("key3"), values["key3"])
+
+
+def test_evict_bounds_disk_use_and_keeps_recent_entries(tmp_path):
+    values = _values(50)
+    keys = list(values)
+    cache = EmbeddingCache(str(tmp_path), shard_bytes=10 * VALUE_BYTES, access_resolution=0)
+    for start in range(0, 50, 5):
+        cache.put_many({key: values[key] for key in keys[start:start + 5]})
+    assert cache.disk_bytes() == 50 * VALUE_BYTES
+    assert len(_shards(str(tmp_path))) == 5
+    # Read some old entries so they are the most recently used
+    recent = ["key0", "key3", "key11", "key25"]
+    assert set(cache.get_many(recent)) == set(recent)
+    cache.evict(15 * VALUE_BYTES)
+    assert cache.disk_bytes() <= 15 * VALUE_BYTES
+    assert cache.total_bytes() == 15 * VALUE_BYTES
+    kept = [key for key in keys if cache.get(key) is not None]
+    assert set(recent) <= set(kept)
+    assert set(kept) - set(recent) == {f"key{i}" for i in range(39, 50)}
+    for key in kept:
+        np.testing.assert_array_equal(cache.get(key), values[key])
+    cache.close()
+
+
+def test_reads_defer_access_updates(tmp_path):
+    with EmbeddingCache(str(tmp_path)) as cache:
+        cache.put_many(_values(3))
+    reader = EmbeddingCache(str(tmp_path), access_resolution=0)
+    before = dict(reader.db.execute("SELECT key, last_access FROM entries").fetchall())
+    reader.get_many(["key0", "key1"])
+    # Nothing is written until the reader closes (or writes)
+    assert dict(reader.db.execute("SELECT key, last_access FROM entries").fetchall()) == before
+    reader.close()
+    with EmbeddingCache(str(tmp_path)) as cache:
+        after = dict(cache.db.execute("SELECT key, last_access FROM entries").fetchall())
+    assert after["key0"] > before["key0"] and after["key1"] > before["key1"]
+    assert after["key2"] == before["key2"]
@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import write_sequences
+from protencode.embeddings_generation.pipeline import run_embeddings_generation
+
+OUTPUTS = ("averaged_embeddings", "pooled_embeddings", "selected_top_unweighted_embeddings")
+
+
+@pytest.mark.parametrize("pooling", [None, ("mean", "attention")])
+def test_dynamic_padding_gives_the_same_outputs(tmp_path, tiny_model, pooling):
+    embed_dirs = {}
+    for dynamic_padding in (False, True):
+        output_dir = write_sequences(str(tmp_path / f"dynamic_{dynamic_padding}"))
+        embed_dirs[dynamic_padding] = run_embeddings_generation(
+            output_dir, model_name=tiny_model, max_length=40, batch_size=5, shard_size=10, top_n=4, n_workers=1,
+            threads=1, dynamic_padding=dynamic_padding, token_dtype="float32" if pooling else None, pooling=pooling,
+        )
+    names = OUTPUTS + tuple(f"{strategy}_pooled_embeddings" for strategy in pooling or ())
+    for name in names:
+        fixed = np.load(os.path.join(embed_dirs[False], f"{name}.npy"))
+        dynamic = np.load(os.path.join(embed_dirs[True], f"{name}.npy"))
+        np.testing.assert_allclose(dynamic, fixed, rtol=1e-4, atol=1e-5, err_msg=name)
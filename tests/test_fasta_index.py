@@ -0,0 +1,19 @@
+from protencode.sequence_preparation import fastaIndex
+
+FASTA = (
+    ">sp|P00001|NA_HUMAN Protein OS=Homo sapiens OX=9606 GN=NA PE=1 SV=1\nMKTAYIAK\n"
+    ">sp|P00002|NULL_HUMAN Protein OS=Homo sapiens OX=9606 GN=NULL PE=1 SV=1\nMKAQR\n"
+    ">sp|P00003|NAN_HUMAN Protein OS=Homo sapiens OX=9606 GN=nan PE=1 SV=1\nMKQ\n"
+    ">tr|A0A001|A0A001_HUMAN Protein OS=Homo sapiens OX=9606 PE=4 SV=1\nMKR\n"
+)
+
+
+def test_reloaded_index_keeps_na_like_gene_names(tmp_path):
+    fasta_file = tmp_path / "9606.fasta"
+    fasta_file.write_text(FASTA)
+    built = fastaIndex.loadFastaIndex(str(fasta_file), show_progress=False)
+    reloaded = fastaIndex.loadFastaIndex(str(fasta_file), show_progress=False)
+    assert built["geneName"].tolist()[:3] == ["NA", "NULL", "nan"]
+    assert reloaded["geneName"].tolist()[:3] == ["NA", "NULL", "nan"]
+    assert built["geneName"].isna().tolist() == reloaded["geneName"].isna().tolist() == [False, False, False, True]
+    assert reloaded["length"].tolist() == [8, 5, 3, 3]
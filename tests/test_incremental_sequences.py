@@ -0,0 +1,105 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from protencode.sequence_preparation.pipeline import run_sequence_preparation
+from protencode.utils.intermediate_store import read_frame
+from protencode.utils.synthetic_data import generate_synthetic_dataset
+
+
+def _pairs(output_dir):
+    sequences = read_frame(output_dir, "sequences")
+    samples = read_frame(output_dir, "samples")
+    pairs = read_frame(output_dir, "sample2sequence_long").merge(sequences, on="sequence_code").merge(samples, on="sample_code")
+    return set(zip(pairs["sample_id"], pairs["geneName"], pairs["variant"]))
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    return generate_synthetic_dataset(str(tmp_path_factory.mktemp("synthetic")), n_mutations=4_000, n_samples=40, n_genes=80)
+
+
+@pytest.fixture(scope="module")
+def runs(tmp_path_factory, dataset):
+    root = tmp_path_factory.mktemp("incremental")
+    options = dict(uniprot_cache=dataset.uniprot_cache, use_stage_cache=False)
+    # Each update brings new samples: split the rows into two files by sample
+    mutations = pd.read_csv(dataset.files[0], dtype=str)
+    new_samples = mutations["DepMap_ID"].isin(mutations["DepMap_ID"].drop_duplicates().iloc[::2])
+    full_dir, first_dir = root / "all_files", root / "data"
+    full_dir.mkdir()
+    first_dir.mkdir()
+    mutations[~new_samples].to_csv(full_dir / "batch_0.csv", index=False)
+    mutations[new_samples].to_csv(full_dir / "batch_1.csv", index=False)
+    run_sequence_preparation(str(full_dir), str(root / "full"), **options)
+    # First file only, then the second one merged incrementally
+    shutil.copy(full_dir / "batch_0.csv", first_dir)
+    incremental = str(root / "incremental")
+    run_sequence_preparation(str(first_dir), incremental, **options)
+    before = read_frame(incremental, "sequences")
+    with open(os.path.join(incremental, "sequences.txt")) as f:
+        before_txt = f.read()
+    shutil.copy(full_dir / "batch_1.csv", first_dir)
+    run_sequence_preparation(str(first_dir), incremental, incremental=True, **options)
+    return str(root / "full"), incremental, before, before_txt
+
+
+def test_existing_sequence_ids_are_unchanged(runs):
+    _, incremental, before, _ = runs
+    after = read_frame(incremental, "sequences")
+    assert len(after) > len(before)
+    pd.testing.assert_frame_equal(after.iloc[:len(before)].reset_index(drop=True), before, check_dtype=False)
+    assert after["sequence_code"].is_unique and after["sequence_id"].is_unique
+
+
+def test_sequences_file_is_appended_and_delta_lists_new_sequences(runs):
+    _, incremental, before, before_txt = runs
+    with open(os.path.join(incremental, "sequences.txt")) as f:
+        after_txt = f.read()
+    assert after_txt.startswith(before_txt)
+    delta = pd.read_csv(os.path.join(incremental, "sequences_delta.txt"), sep="\t", dtype=str)
+    appended = pd.read_csv(os.path.join(incremental, "sequences.txt"), sep="\t", dtype=str).iloc[len(before):]
+    pd.testing.assert_frame_equal(delta.reset_index(drop=True), appended.reset_index(drop=True))
+
+
+def test_incremental_run_matches_full_run(runs):
+    full, incremental, _, _ = runs
+    full_sequences = read_frame(full, "sequences")
+    incremental_sequences = read_frame(incremental, "sequences")
+    assert set(zip(full_sequences["geneName"], full_sequences["variant"])) == set(
+        zip(incremental_sequences["geneName"], incremental_sequences["variant"])
+    )
+    assert _pairs(full) == _pairs(incremental)
+
+
+def test_rerun_without_new_files_changes_nothing(runs):
+    _, incremental, _, _ = runs
+    after = read_frame(incremental, "sequences")
+    run_sequence_preparation(os.path.join(os.path.dirname(incremental), "data"), incremental, incremental=True, use_stage_cache=False)
+    pd.testing.assert_frame_equal(read_frame(incremental, "sequences"), after)
+
+
+def _remutate(change, residues="ACDEFGHIKLMNPQRSTVWY"):
+    # Same position, another mutant residue: p.L273N -> p.L273A
+    wildtype, mutant = change[2], change[-1]
+    return change[:-1] + next(residue for residue in residues if residue not in (wildtype, mutant))
+
+
+def test_update_with_known_samples_keeps_one_mutation_per_position(dataset, tmp_path):
+    options = dict(uniprot_cache=dataset.uniprot_cache, use_stage_cache=False)
+    first = pd.read_csv(dataset.files[0], dtype=str)
+    data_dir, output_dir = tmp_path / "data", str(tmp_path / "out")
+    data_dir.mkdir()
+    first.to_csv(data_dir / "batch_0.csv", index=False)
+    run_sequence_preparation(str(data_dir), output_dir, **options)
+    before = _pairs(output_dir)
+    # The same samples, genes and positions with other mutant residues
+    first.assign(Protein_Change=first["Protein_Change"].map(_remutate)).to_csv(data_dir / "batch_1.csv", index=False)
+    run_sequence_preparation(str(data_dir), output_dir, incremental=True, **options)
+    # Positions without a valid mutation in the first file (e.g. a mismatched wildtype residue) may gain one
+    assert before <= _pairs(output_dir)
+    sequences = read_frame(output_dir, "sequences")
+    pairs = read_frame(output_dir, "sample2sequence_long").merge(sequences, on="sequence_code")
+    assert not pairs.duplicated(["sample_code", "geneName", "pos"]).any()
@@ -0,0 +1,29 @@
+import os
+
+import pandas as pd
+
+from protencode.utils.intermediate_store import find_frame, read_frame, write_frame
+
+
+def test_switching_format_does_not_read_stale_tables(tmp_path):
+    output_dir = str(tmp_path)
+    old = pd.DataFrame({"sample_id": ["A", "B"], "value": [1, 2]})
+    new = pd.DataFrame({"sample_id": ["C"], "value": [3]})
+    write_frame(old, output_dir, "samples", fmt="parquet")
+    write_frame(new, output_dir, "samples", fmt="csv")
+    assert find_frame(output_dir, "samples") == os.path.join(output_dir, "samples.csv")
+    assert not os.path.exists(os.path.join(output_dir, "samples.parquet"))
+    pd.testing.assert_frame_equal(read_frame(output_dir, "samples"), new)
+    write_frame(old, output_dir, "samples", fmt="arrow")
+    assert sorted(os.listdir(output_dir)) == ["samples.arrow"]
+    pd.testing.assert_frame_equal(read_frame(output_dir, "samples"), old)
+
+
+def test_exported_csv_is_kept_next_to_columnar_table(tmp_path):
+    output_dir = str(tmp_path)
+    frame = pd.DataFrame({"sample_id": ["A", "B"], "value": [1, 2]})
+    write_frame(frame, output_dir, "samples", fmt="parquet", export_csv=True)
+    assert sorted(os.listdir(output_dir)) == ["samples.csv", "samples.parquet"]
+    assert find_frame(output_dir, "samples").endswith(".parquet")
+    write_frame(frame, output_dir, "samples", fmt="parquet")
+    assert sorted(os.listdir(output_dir)) == ["samples.parquet"]
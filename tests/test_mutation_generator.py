@@ -0,0 +1,24 @@
+import pandas as pd
+
+from protencode.sequence_preparation.mutationGenerator import generateMutatedSequence, generateMutatedSequencesBatch
+
+ROWS = pd.DataFrame({
+    "sample_id": ["S1", "S2", "S3", "S4"],
+    "geneName": ["G1", "G1", "G2", "G2"],
+    "wildtypeSequence": ["MKTAY", "MKTAY", "MQR", "MQR"],
+    "pos": [2, 2, 3, 9],
+    "wtAA": ["K", "A", "R", "R"],
+    "mutAA": ["R", "R", "W", "W"],
+})
+
+
+def test_single_row_matches_batch(tmp_path):
+    log_file = str(tmp_path / "errors.log")
+    counter = {"count": 0}
+    valid, mutants, errors = generateMutatedSequencesBatch(ROWS, show_progress=False)
+    single = [generateMutatedSequence(row, log_file, counter) for _, row in ROWS.iterrows()]
+    assert single == list(mutants) == ["MRTAY", None, "MQW", None]
+    assert counter["count"] == (~valid).sum() == len(errors) == 2
+    with open(log_file) as f:
+        log = f.read()
+    assert "Found: 'K'" in log and "Found: 'Out of bounds'" in log
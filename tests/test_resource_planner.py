@@ -0,0 +1,156 @@
+import functools
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import write_sequences
+from protencode.embeddings_generation import pipeline, resource_planner
+from protencode.embeddings_generation.resource_planner import (
+    available_cpu_memory, parse_bytes, plan_resources, read_cgroup_cpus, read_cgroup_memory,
+)
+
+CONFIG = SimpleNamespace(
+    hidden_size=480, intermediate_size=1920, num_hidden_layers=12, num_attention_heads=20, vocab_size=33,
+    max_position_embeddings=1026,
+)
+# index, memory.total, memory.used (MiB): GPU 0 is nearly full
+NVIDIA_SMI = "0, 16000, 15950\n1, 16000, 4000\n2, 24000, 2000"
+LENGTHS = [100, 250, 400]
+
+
+@pytest.fixture(autouse=True)
+def no_env_overrides(monkeypatch):
+    for name in resource_planner.ENV_OVERRIDES.values():
+        monkeypatch.delenv(name, raising=False)
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+@pytest.fixture
+def cgroup_v2(tmp_path):
+    root = tmp_path / "cgroup_v2"
+    _write(root / "memory.max", "4294967296\n")
+    _write(root / "memory.current", "1073741824\n")
+    _write(root / "cpu.max", "300000 100000\n")
+    return str(root)
+
+
+@pytest.fixture
+def meminfo(tmp_path):
+    path = tmp_path / "meminfo"
+    # 64 GiB total, 32 GiB available
+    _write(path, "MemTotal:       67108864 kB\nMemFree:        1048576 kB\nMemAvailable:   33554432 kB\n")
+    return str(path)
+
+
+def _plan(**kwargs):
+    kwargs.setdefault("nvidia_smi_output", NVIDIA_SMI)
+    return plan_resources(CONFIG, LENGTHS, 512, **kwargs)
+
+
+def test_gpus_with_room_for_the_model_are_chosen_by_free_memory():
+    plan = _plan()
+    assert plan.device == "cuda"
+    assert plan.gpus == [2, 1]
+    assert plan.n_workers == 1
+    assert plan.available_bytes == 12000 * 1024 ** 2
+    assert plan.batch_size >= 1 and plan.max_tokens >= 402
+
+
+def test_gpu_selection_overrides(monkeypatch, meminfo, cgroup_v2):
+    assert _plan(overrides={"gpus": "1"}).gpus == [1]
+    monkeypatch.setenv("PROTENCODE_GPUS", "2")
+    assert _plan().gpus == [2]
+    assert _plan(overrides={"gpus": "1"}).gpus == [1]
+    cpu = _plan(overrides={"gpus": "none"}, meminfo_path=meminfo, cgroup_root=cgroup_v2, cpus=8)
+    assert cpu.device == "cpu" and cpu.gpus == []
+
+
+def test_no_gpus_plans_for_the_cpu(meminfo, cgroup_v2):
+    plan = _plan(nvidia_smi_output="", meminfo_path=meminfo, cgroup_root=cgroup_v2, cpus=8)
+    assert plan.device == "cpu"
+    # The cgroup has 3 GiB left of its limit, less than MemAvailable
+    assert plan.available_bytes == 3 * 1024 ** 3
+    assert plan.threads_per_worker * plan.n_workers <= 8
+
+
+def test_cgroup_v2_limits(meminfo, cgroup_v2, tmp_path):
+    assert read_cgroup_memory(cgroup_v2) == (4 * 1024 ** 3, 1024 ** 3)
+    assert read_cgroup_cpus(cgroup_v2) == 3
+    assert available_cpu_memory(meminfo, cgroup_v2) == 3 * 1024 ** 3
+    unlimited = tmp_path / "unlimited"
+    _write(unlimited / "memory.max", "max\n")
+    _write(unlimited / "cpu.max", "max 100000\n")
+    assert read_cgroup_memory(str(unlimited)) == (None, None)
+    assert read_cgroup_cpus(str(unlimited)) is None
+    assert available_cpu_memory(meminfo, str(unlimited)) == 32 * 1024 ** 3
+
+
+def test_cgroup_v1_limits(meminfo, tmp_path):
+    root = tmp_path / "cgroup_v1"
+    _write(root / "memory" / "memory.limit_in_bytes", "2147483648\n")
+    _write(root / "memory" / "memory.usage_in_bytes", "536870912\n")
+    _write(root / "cpu" / "cpu.cfs_quota_us", "200000\n")
+    _write(root / "cpu" / "cpu.cfs_period_us", "100000\n")
+    assert read_cgroup_memory(str(root)) == (2 * 1024 ** 3, 512 * 1024 ** 2)
+    assert read_cgroup_cpus(str(root)) == 2
+    assert available_cpu_memory(meminfo, str(root)) == 1536 * 1024 ** 2
+    # cgroup v1 reports no limit as a huge number, and no quota as -1
+    _write(root / "memory" / "memory.limit_in_bytes", "9223372036854771712\n")
+    _write(root / "cpu" / "cpu.cfs_quota_us", "-1\n")
+    assert read_cgroup_memory(str(root))[0] is None
+    assert read_cgroup_cpus(str(root)) is None
+
+
+def test_flags_override_environment_override_plan(monkeypatch, meminfo, cgroup_v2):
+    options = dict(nvidia_smi_output="", meminfo_path=meminfo, cgroup_root=cgroup_v2, cpus=8)
+    planned = _plan(**options)
+    monkeypatch.setenv("PROTENCODE_BATCH_SIZE", "3")
+    monkeypatch.setenv("PROTENCODE_WORKERS", "2")
+    monkeypatch.setenv("PROTENCODE_THREADS", "1")
+    monkeypatch.setenv("PROTENCODE_MEMORY_LIMIT", "2G")
+    from_env = _plan(**options)
+    assert (from_env.batch_size, from_env.n_workers, from_env.threads_per_worker) == (3, 2, 1)
+    assert from_env.available_bytes == 2 * 1024 ** 3 != planned.available_bytes
+    from_flags = _plan(overrides=dict(batch_size=7, n_workers=1, threads_per_worker=4, memory_limit="1G"), **options)
+    assert (from_flags.batch_size, from_flags.n_workers, from_flags.threads_per_worker) == (7, 1, 4)
+    assert from_flags.available_bytes == 1024 ** 3
+
+
+def test_parse_bytes():
+    assert parse_bytes("8G") == parse_bytes("8GiB") == 8 * 1024 ** 3
+    assert parse_bytes(" 512 MB ") == 512 * 1024 ** 2
+    assert parse_bytes(1024) == 1024
+    with pytest.raises(ValueError):
+        parse_bytes("lots")
+
+
+def _run(output_dir, tiny_model, **kwargs):
+    return pipeline.run_embeddings_generation(
+        write_sequences(output_dir, n=6), model_name=tiny_model, max_length=40, shard_size=10, top_n=4, threads=1,
+        **kwargs,
+    )
+
+
+def test_pipeline_applies_gpu_selection_with_fixed_sizes(monkeypatch, tmp_path, tiny_model):
+    chosen = []
+    monkeypatch.setattr(pipeline, "plan_resources", functools.partial(plan_resources, nvidia_smi_output=NVIDIA_SMI))
+    monkeypatch.setattr(pipeline, "set_cuda_visible_devices", chosen.append)
+    monkeypatch.setattr(pipeline.torch.cuda, "is_available", lambda: False)
+    _run(str(tmp_path / "flag"), tiny_model, batch_size=4, n_workers=1, gpus="1")
+    monkeypatch.setenv("PROTENCODE_GPUS", "2")
+    _run(str(tmp_path / "env"), tiny_model, batch_size=4, n_workers=1)
+    assert chosen == [[1], [2]]
+
+
+def test_pipeline_runs_cpu_plans_on_the_cpu(monkeypatch, tmp_path, tiny_model):
+    # A CUDA build with GPUs: "none" must still load the CPU engine rather than move the model to CUDA
+    engines = []
+    load_engine = pipeline._loadEngine
+    monkeypatch.setattr(pipeline.torch.cuda, "is_available", lambda: True)
+    monkeypatch.setattr(pipeline, "_loadEngine", lambda *args: engines.append(load_engine(*args)) or engines[-1])
+    _run(str(tmp_path / "cpu"), tiny_model, batch_size=4, n_workers=1, gpus="none")
+    assert len(engines) == 1 and engines[0] is not None and engines[0].device.type == "cpu"
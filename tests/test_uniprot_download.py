@@ -0,0 +1,111 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from protencode.sequence_preparation import uniProtFasta
+
+FASTA = "".join(
+    f">sp|P{i:05d}|GENE{i}_HUMAN Protein {i} OS=Homo sapiens OX=9606 GN=GENE{i} PE=1 SV=1\n{'MKTAYIAKQR' * 30}\n"
+    for i in range(200)
+).encode()
+
+
+class _UniProtStandIn(BaseHTTPRequestHandler):
+    """
+    Serves `payload` as the compressed UniProt stream, with Range support; the first full GET is
+    cut off halfway through.
+    """
+
+    payload = b""
+    drop_first = True
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _releaseHeaders(self):
+        self.send_header("X-UniProt-Release", "2025_01")
+        self.send_header("X-UniProt-Release-Date", "05-February-2025")
+        self.send_header("X-Total-Results", "200")
+
+    def do_HEAD(self):
+        type(self).requests.append(("HEAD", None))
+        self.send_response(200)
+        self._releaseHeaders()
+        self.end_headers()
+
+    def do_GET(self):
+        payload = type(self).payload
+        byte_range = self.headers.get("Range")
+        type(self).requests.append(("GET", byte_range))
+        start = int(byte_range.split("=")[1].rstrip("-")) if byte_range else 0
+        body = payload[start:]
+        self.send_response(206 if byte_range else 200)
+        self._releaseHeaders()
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{len(payload) - 1}/{len(payload)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if type(self).drop_first and not byte_range:
+            type(self).drop_first = False
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    handler = type("Handler", (_UniProtStandIn,), {"payload": gzip.compress(FASTA), "drop_first": True, "requests": []})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield handler, f"http://127.0.0.1:{httpd.server_address[1]}/stream"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _download(tmp_path, base_url, **kwargs):
+    return uniProtFasta.downloadUniprotFasta(
+        "9606", str(tmp_path / "out"), base_url=base_url, cache_dir=str(tmp_path / "cache"),
+        chunk_size=1024, max_retries=2, timeout=5, verbose=False, **kwargs,
+    )
+
+
+def test_download_resumes_after_dropped_connection(tmp_path, server):
+    handler, base_url = server
+    fasta_file = _download(tmp_path, base_url)
+    with open(fasta_file, "rb") as f:
+        assert f.read() == FASTA
+    ranges = [byte_range for method, byte_range in handler.requests if method == "GET"]
+    assert ranges[0] is None
+    assert ranges[1] is not None and int(ranges[1].split("=")[1].rstrip("-")) > 0
+    release_dir = tmp_path / "cache" / "9606" / "2025_01"
+    with open(release_dir / "release.json") as f:
+        assert json.load(f)["compressed_bytes"] == len(handler.payload)
+    assert (tmp_path / "cache" / "9606" / "LATEST").read_text() == "2025_01"
+
+
+def test_cached_release_is_reused_offline(tmp_path, server):
+    handler, base_url = server
+    first = _download(tmp_path, base_url)
+    n_requests = len(handler.requests)
+    assert _download(tmp_path, base_url) == first
+    assert len(handler.requests) == n_requests
+    assert uniProtFasta.cachedUniprotFasta("9606", str(tmp_path / "out"), str(tmp_path / "cache")) == first
+
+
+def test_corrupt_transfer_fails_crc_check(tmp_path, server):
+    handler, base_url = server
+    payload = bytearray(handler.payload)
+    # Flip a bit of the gzip trailer's CRC32
+    payload[-8] ^= 0xFF
+    handler.payload = bytes(payload)
+    handler.drop_first = False
+    with pytest.raises(RuntimeError, match="corrupt or truncated"):
+        _download(tmp_path, base_url)
+    assert uniProtFasta.cachedUniprotFasta("9606", str(tmp_path / "out"), str(tmp_path / "cache")) is None
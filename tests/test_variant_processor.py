@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+
+from protencode.sequence_preparation import variantProcessor
+from protencode.sequence_preparation.pipeline import run_sequence_preparation
+from protencode.utils.intermediate_store import read_frame
+from protencode.utils.synthetic_data import generate_synthetic_dataset
+
+
+@pytest.fixture(scope="module")
+def maf_file(tmp_path_factory):
+    dataset = generate_synthetic_dataset(
+        str(tmp_path_factory.mktemp("synthetic")), n_mutations=3_000, n_samples=30, n_genes=100, input_format="maf",
+    )
+    return dataset.files[0]
+
+
+def _sorted(frame):
+    return frame.sort_values(list(frame.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("num_parts", [1, 2, 7, 64])
+def test_split_ranges_cover_data_rows_on_line_boundaries(maf_file, num_parts):
+    with open(maf_file, "rb") as f:
+        content = f.read()
+    ranges = variantProcessor.splitVariantFile(maf_file, num_parts)
+    assert 1 <= len(ranges) <= num_parts
+    assert ranges[0][0] == content.index(b"\n") + 1
+    assert ranges[-1][1] == len(content)
+    for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+        assert end == start
+        assert content[start - 1:start] == b"\n"
+    assert b"".join(content[start:end] for start, end in ranges) == content[ranges[0][0]:]
+
+
+def test_split_more_parts_than_bytes(tmp_path):
+    path = tmp_path / "tiny.maf"
+    path.write_text("Hugo_Symbol\tVariant_Classification\nA\tSilent\n")
+    ranges = variantProcessor.splitVariantFile(str(path), 1000)
+    assert ranges[0][0] == len("Hugo_Symbol\tVariant_Classification\n")
+    assert ranges[-1][1] == path.stat().st_size
+
+
+@pytest.mark.parametrize("chunksize", [None, 250])
+def test_byte_ranges_parse_like_the_whole_file(maf_file, chunksize):
+    whole = variantProcessor.processVariantFile(maf_file)
+    parts = pd.concat([
+        variantProcessor.processVariantFile(maf_file, byte_range=byte_range, chunksize=chunksize)
+        for byte_range in variantProcessor.splitVariantFile(maf_file, 5)
+    ]).drop_duplicates()
+    assert len(whole) > 0
+    pd.testing.assert_frame_equal(_sorted(whole), _sorted(parts))
+
+
+def test_maf_version_lines_are_skipped(maf_file, tmp_path):
+    with open(maf_file) as f:
+        content = f.read()
+    versioned = tmp_path / "versioned.maf"
+    versioned.write_text("#version gdc-1.0.0\n#filedate 20250101\n" + content)
+    layout = variantProcessor.variantFileLayout(str(versioned))
+    whole = variantProcessor.processVariantFile(maf_file)
+    parsed = variantProcessor.processVariantFile(str(versioned), **layout)
+    pd.testing.assert_frame_equal(_sorted(whole), _sorted(parsed))
+    ranges = variantProcessor.splitVariantFile(str(versioned), 4, comment="#")
+    assert ranges[0][0] == len("#version gdc-1.0.0\n#filedate 20250101\n") + content.index("\n") + 1
+    parts = pd.concat([
+        variantProcessor.processVariantFile(str(versioned), byte_range=byte_range, **layout) for byte_range in ranges
+    ]).drop_duplicates()
+    pd.testing.assert_frame_equal(_sorted(whole), _sorted(parts))
+
+
+def test_layouts_by_extension():
+    assert variantProcessor.variantFileLayout("cohort.csv")["separator"] == ","
+    assert variantProcessor.variantFileLayout("TCGA.BRCA.maf.gz")["columns_to_keep"][0] == "Tumor_Sample_Barcode"
+    assert variantProcessor.variantFileLayout("notes.txt") is None
+
+
+def test_sequence_preparation_reads_maf_like_csv(tmp_path):
+    outputs = {}
+    for input_format in ("csv", "maf"):
+        dataset = generate_synthetic_dataset(
+            str(tmp_path / input_format), n_mutations=2_000, n_samples=20, n_genes=60, input_format=input_format,
+        )
+        output_dir = str(tmp_path / f"out_{input_format}")
+        run_sequence_preparation(dataset.data_dir, output_dir, uniprot_cache=dataset.uniprot_cache, use_stage_cache=False)
+        outputs[input_format] = read_frame(output_dir, "sequences")
+    assert len(outputs["maf"]) > 0
+    pd.testing.assert_frame_equal(outputs["maf"], outputs["csv"])